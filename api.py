@@ -1,25 +1,35 @@
 import atexit
+import functools
 import json
 import os
+import time
 import traceback
 from datetime import datetime
 from urllib.parse import urlparse
 
+from dotenv import load_dotenv
+
+# biz 中的模块（以及 prometheus_client）在导入时读取配置，需要在导入它们之前加载 conf/.env
+load_dotenv("conf/.env")
+
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
-from dotenv import load_dotenv
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, Response
 
 from biz.gitlab.webhook_handler import slugify_url
 from biz.queue.worker import handle_merge_request_event, handle_push_event, handle_github_pull_request_event, handle_github_push_event
-from biz.service.review_service import ReviewService
+from biz.service.review_service import ReviewService, review_log_writer
+from biz.service.review_log_writer import WRITE_BEHIND_ENABLED
+from biz.service.notification_outbox import OUTBOX_ENABLED, notification_outbox
+from biz.utils import metrics, tracing
 from biz.utils.im import notifier
+from biz.utils.im.webhook_router import webhook_router
 from biz.utils.log import logger
-from biz.utils.queue import handle_queue
+from biz.utils.prompt_registry import prompt_registry
+from biz.utils.queue import handle_queue, refresh_queue_depth
 from biz.utils.reporter import Reporter
 
 from biz.utils.config_checker import check_config
-load_dotenv("conf/.env")
 api_app = Flask(__name__)
 
 
@@ -36,6 +46,27 @@ def home():
               """
 
 
+@api_app.before_request
+def start_request_timer():
+    g.request_start_time = time.perf_counter()
+
+
+@api_app.after_request
+def record_webhook_latency(response):
+    # 统计 Webhook 从接收到返回响应（ack）的耗时
+    if request.path == '/review/webhook' and 'request_start_time' in g:
+        source = 'github' if request.headers.get('X-GitHub-Event') else 'gitlab'
+        metrics.WEBHOOK_ACK_LATENCY.labels(source=source, status=response.status_code).observe(
+            time.perf_counter() - g.request_start_time)
+    return response
+
+
+@api_app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    refresh_queue_depth()
+    return Response(metrics.generate_metrics(), mimetype=metrics.CONTENT_TYPE_LATEST)
+
+
 @api_app.route('/review/daily_report', methods=['GET'])
 def daily_report():
     # 获取当前日期0点和23点59分59秒的时间戳
@@ -43,10 +74,16 @@ def daily_report():
     end_time = datetime.now().replace(hour=23, minute=59, second=59, microsecond=0).timestamp()
 
     try:
+        # 日报只需要提交信息，不读取 Review 结果
         if push_review_enabled:
-            df = ReviewService().get_push_review_logs(updated_at_gte=start_time, updated_at_lte=end_time)
+            df = ReviewService().get_push_review_logs(updated_at_gte=start_time, updated_at_lte=end_time,
+                                                      columns=["project_name", "author", "branch", "updated_at",
+                                                               "commit_messages", "score"])
         else:
-            df = ReviewService().get_mr_review_logs(updated_at_gte=start_time, updated_at_lte=end_time)
+            df = ReviewService().get_mr_review_logs(updated_at_gte=start_time, updated_at_lte=end_time,
+                                                    columns=["project_name", "author", "source_branch",
+                                                             "target_branch", "updated_at", "commit_messages",
+                                                             "score", "url"])
 
         if df.empty:
             logger.info("No data to process.")
@@ -69,6 +106,74 @@ def daily_report():
         return jsonify({'message': f"Failed to generate daily report: {e}"}), 500
 
 
+# /review/logs 每页最大条数
+MAX_PAGE_SIZE = 500
+
+
+def require_api_token(func):
+    """设置了 REVIEW_API_TOKEN 时，要求请求头携带 Authorization: Bearer {REVIEW_API_TOKEN}"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        api_token = os.getenv('REVIEW_API_TOKEN')
+        if api_token and request.headers.get('Authorization') != f'Bearer {api_token}':
+            return jsonify({'message': 'Unauthorized'}), 401
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+@api_app.route('/review/logs', methods=['GET'])
+@require_api_token
+def review_logs():
+    """
+    分页查询审核日志
+    参数: type=mr|push, limit, cursor（上一页返回的 next_cursor）, sort=updated_at|score, order=desc|asc,
+         author、project_name（可重复传递多个）, updated_at_gte, updated_at_lte（秒级时间戳）,
+         columns（逗号分隔，默认不包含 review_result、complexity_summary、commit_messages）
+    """
+    args = request.args
+    try:
+        limit = min(max(int(args.get('limit', 50)), 1), MAX_PAGE_SIZE)
+        updated_at_gte = int(args['updated_at_gte']) if args.get('updated_at_gte') else None
+        updated_at_lte = int(args['updated_at_lte']) if args.get('updated_at_lte') else None
+        columns = args['columns'].split(',') if args.get('columns') else None
+        df, next_cursor = ReviewService.get_review_log_page(
+            args.get('type', 'mr'), authors=args.getlist('author'), project_names=args.getlist('project_name'),
+            updated_at_gte=updated_at_gte, updated_at_lte=updated_at_lte, columns=columns,
+            sort_by=args.get('sort', 'updated_at'), descending=args.get('order', 'desc') != 'asc', limit=limit,
+            cursor=args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    # 通过 to_json 转换，NaN 等值会被处理为 null
+    return jsonify({'items': json.loads(df.to_json(orient='records', force_ascii=False)),
+                    'next_cursor': next_cursor})
+
+
+@api_app.route('/review/search', methods=['GET'])
+@require_api_token
+def review_search():
+    """
+    在 Review 结果与提交信息中全文检索，按相关度返回命中片段
+    参数: q（以空格分隔的关键词）, type=mr|push, limit, author、project_name（可重复传递多个）,
+         updated_at_gte, updated_at_lte（秒级时间戳）
+    """
+    args = request.args
+    if not args.get('q', '').strip():
+        return jsonify({'message': 'Missing parameter: q'}), 400
+    try:
+        limit = min(max(int(args.get('limit', 20)), 1), MAX_PAGE_SIZE)
+        updated_at_gte = int(args['updated_at_gte']) if args.get('updated_at_gte') else None
+        updated_at_lte = int(args['updated_at_lte']) if args.get('updated_at_lte') else None
+        df = ReviewService.search_reviews(args['q'], args.get('type', 'mr'), authors=args.getlist('author'),
+                                          project_names=args.getlist('project_name'), updated_at_gte=updated_at_gte,
+                                          updated_at_lte=updated_at_lte, limit=limit)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    return jsonify({'items': json.loads(df.to_json(orient='records', force_ascii=False))})
+
+
 def setup_scheduler():
     """
     配置并启动定时任务调度器
@@ -91,6 +196,20 @@ def setup_scheduler():
             )
         )
 
+        # 数据库维护：归档过期的审核日志、回收空间、更新统计信息
+        maintenance_minute, maintenance_hour, maintenance_day, maintenance_month, maintenance_day_of_week = \
+            os.getenv('MAINTENANCE_CRONTAB_EXPRESSION', '30 3 * * *').split()
+        scheduler.add_job(
+            ReviewService.run_maintenance,
+            trigger=CronTrigger(
+                minute=maintenance_minute,
+                hour=maintenance_hour,
+                day=maintenance_day,
+                month=maintenance_month,
+                day_of_week=maintenance_day_of_week
+            )
+        )
+
         # Start the scheduler
         scheduler.start()
         logger.info("Scheduler started successfully.")
@@ -105,21 +224,26 @@ def setup_scheduler():
 # 处理 GitLab Merge Request Webhook
 @api_app.route('/review/webhook', methods=['POST'])
 def handle_webhook():
-    # 获取请求的JSON数据
-    if request.is_json:
-        data = request.get_json()
-        if not data:
-            return jsonify({"error": "Invalid JSON"}), 400
-
-        # 判断是GitLab还是GitHub的webhook
-        webhook_source = request.headers.get('X-GitHub-Event')
-        
-        if webhook_source:  # GitHub webhook
-            return handle_github_webhook(webhook_source, data)
-        else:  # GitLab webhook
-            return handle_gitlab_webhook(data)
-    else:
-        return jsonify({'message': 'Invalid data format'}), 400
+    # 以 webhook.ingest 作为整条 Review 链路的根 Span，上游若传递了 traceparent 则沿用其 trace id
+    with tracing.start_span('webhook.ingest', traceparent=request.headers.get('traceparent'),
+                            **{'http.request.body.size': request.content_length or 0}) as span:
+        # 获取请求的JSON数据
+        if request.is_json:
+            data = request.get_json()
+            if not data:
+                return jsonify({"error": "Invalid JSON"}), 400
+
+            # 判断是GitLab还是GitHub的webhook
+            webhook_source = request.headers.get('X-GitHub-Event')
+
+            if webhook_source:  # GitHub webhook
+                span.set_attributes({'webhook.source': 'github', 'webhook.event': webhook_source})
+                return handle_github_webhook(webhook_source, data)
+            else:  # GitLab webhook
+                span.set_attributes({'webhook.source': 'gitlab', 'webhook.event': data.get('object_kind')})
+                return handle_gitlab_webhook(data)
+        else:
+            return jsonify({'message': 'Invalid data format'}), 400
 
 def handle_github_webhook(event_type, data):
     # 获取GitHub配置
@@ -200,8 +324,20 @@ def handle_gitlab_webhook(data):
 
 if __name__ == '__main__':
     check_config()
+    # 清理上次运行遗留的多进程指标文件
+    metrics.clear_multiproc_dir()
+    # 预加载提示词模板，fork 出的工作进程直接复用已编译的模板
+    prompt_registry.preload()
+    # 构建 IM 通知的 Webhook 路由表，工作进程直接复用
+    webhook_router.reload()
     # 启动定时任务调度器
     setup_scheduler()
+    # 启动 Review 日志的批量写入线程，同时补写上次异常退出时遗留的记录
+    if WRITE_BEHIND_ENABLED:
+        review_log_writer.start()
+    # 启动 IM 通知发件箱的发送线程，工作进程写入的通知由这里限流发送
+    if OUTBOX_ENABLED:
+        notification_outbox.start()
 
     # 启动Flask API服务
     port = int(os.environ.get('SERVER_PORT', 5001))
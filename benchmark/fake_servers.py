@@ -0,0 +1,205 @@
+"""
+本地模拟的 GitLab/GitHub API 与 OpenAI 兼容的 LLM 服务，供压测与单元测试使用，无需访问外部网络。
+"""
+import json
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+
+# 统计请求次数时把路径中的编号、SHA 归一化
+ID_PATTERN = re.compile(r'(?<=/)([0-9a-f]{40}|\d+)(?=/|$|\.)')
+
+
+def generate_diff(file_index: int, lines: int) -> str:
+    """生成一个包含 lines 行新增代码的 unified diff"""
+    body = '\n'.join(f'+    value_{file_index}_{i} = compute(value_{file_index}_{i - 1}, {i})' for i in range(lines))
+    return f'@@ -1,3 +1,{lines + 3} @@\n def handler_{file_index}(request):\n {body}\n     return value\n'
+
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        return json.loads(raw) if raw else {}
+
+    def _send_json(self, status: int, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _BackgroundServer:
+    handler_class = _JsonHandler
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        handler = type(self.handler_class.__name__, (self.handler_class,), {'server_state': self})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+class _GitHandler(_JsonHandler):
+    server_state: 'FakeGitServer'
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        state = self.server_state
+        state.count_request('GET', path)
+
+        # GitLab
+        if re.match(r'^/api/v4/projects/[^/]+/merge_requests/\d+/changes$', path):
+            return self._send_json(200, {'changes': state.gitlab_changes()})
+        if re.match(r'^/api/v4/projects/[^/]+/merge_requests/\d+/commits$', path):
+            return self._send_json(200, [{'id': 'c' * 40, 'title': 'bench commit', 'message': 'bench commit'}])
+        if re.match(r'^/api/v4/projects/[^/]+/repository/compare$', path):
+            return self._send_json(200, {'diffs': state.gitlab_changes()})
+        if re.match(r'^/api/v4/projects/[^/]+/repository/commits$', path):
+            return self._send_json(200, [{'id': 'b' * 40, 'parent_ids': ['a' * 40]}])
+
+        # GitHub
+        if re.match(r'^/repos/[^/]+/[^/]+/pulls/\d+/files$', path):
+            return self._send_json(200, state.github_files())
+        if re.match(r'^/repos/[^/]+/[^/]+/pulls/\d+/commits$', path):
+            return self._send_json(200, [{'sha': 'c' * 40, 'commit': {'message': 'bench commit', 'author': {}}}])
+        if re.match(r'^/repos/[^/]+/[^/]+/compare/.+$', path):
+            return self._send_json(200, {'files': state.github_files()})
+        if re.match(r'^/repos/[^/]+/[^/]+/commits/[0-9a-f]+$', path):
+            return self._send_json(200, {'sha': path.rsplit('/', 1)[-1], 'parents': [{'sha': 'a' * 40}]})
+
+        self._send_json(404, {'message': f'not found: {path}'})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        state = self.server_state
+        state.count_request('POST', path)
+        self._read_body()
+
+        # GitLab: MR notes / commit comments；GitHub: issue comments / commit comments
+        match = (re.match(r'^/api/v4/projects/[^/]+/merge_requests/(\d+)/notes$', path)
+                 or re.match(r'^/api/v4/projects/[^/]+/repository/commits/([0-9a-f]+)/comments$', path)
+                 or re.match(r'^/repos/[^/]+/[^/]+/issues/(\d+)/comments$', path)
+                 or re.match(r'^/repos/[^/]+/[^/]+/commits/([0-9a-f]+)/comments$', path))
+        if match:
+            state.record_note(match.group(1))
+            return self._send_json(201, {'id': 1})
+        self._send_json(404, {'message': f'not found: {path}'})
+
+
+class FakeGitServer(_BackgroundServer):
+    """
+    模拟 GitLab v4 与 GitHub REST API 中 Review 流程会用到的接口。
+    每次收到 note/comment 请求时记录时间，用于计算端到端耗时。
+    """
+    handler_class = _GitHandler
+
+    def __init__(self, files: int = 3, lines_per_file: int = 40, latency: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.files = files
+        self.lines_per_file = lines_per_file
+        self.latency = latency
+        self.notes = {}
+        self.request_counts = {}
+        self._lock = threading.Lock()
+        self._diffs = [generate_diff(i, lines_per_file) for i in range(files)]
+
+    def count_request(self, method: str, path: str):
+        if self.latency:
+            time.sleep(self.latency)
+        key = f"{method} {ID_PATTERN.sub(':id', path)}"
+        with self._lock:
+            self.request_counts[key] = self.request_counts.get(key, 0) + 1
+
+    def record_note(self, key: str):
+        with self._lock:
+            self.notes.setdefault(key, time.time())
+
+    def gitlab_changes(self) -> list:
+        return [{'old_path': f'src/module_{i}.py', 'new_path': f'src/module_{i}.py', 'diff': diff,
+                 'new_file': False, 'renamed_file': False, 'deleted_file': False}
+                for i, diff in enumerate(self._diffs)]
+
+    def github_files(self) -> list:
+        return [{'filename': f'src/module_{i}.py', 'status': 'modified', 'patch': diff}
+                for i, diff in enumerate(self._diffs)]
+
+
+class _LLMHandler(_JsonHandler):
+    server_state: 'FakeLLMServer'
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        if not path.endswith('/chat/completions'):
+            return self._send_json(404, {'error': {'message': f'not found: {path}'}})
+
+        request = self._read_body()
+        state = self.server_state
+        state.record_request(request)
+        if state.latency:
+            time.sleep(state.latency)
+
+        prompt_chars = sum(len(str(message.get('content', ''))) for message in request.get('messages', []))
+        # ping 请求只需要返回 ok
+        if prompt_chars < 20:
+            content = 'ok'
+        else:
+            content = '### 问题描述\n' + ' '.join(['建议'] * state.completion_tokens) + '\n\n总分:80分'
+        self._send_json(200, {
+            'id': 'chatcmpl-bench',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'bench-model'),
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': content}}],
+            'usage': {'prompt_tokens': prompt_chars // 4, 'completion_tokens': state.completion_tokens,
+                      'total_tokens': prompt_chars // 4 + state.completion_tokens,
+                      'prompt_tokens_details': {'cached_tokens': 0}},
+        })
+
+
+class FakeLLMServer(_BackgroundServer):
+    """
+    OpenAI 兼容的 /chat/completions 接口，按配置的延迟和 token 数返回固定的 Review 结果
+    """
+    handler_class = _LLMHandler
+
+    def __init__(self, latency: float = 1.0, completion_tokens: int = 200, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.completion_tokens = completion_tokens
+        self.requests = 0
+        self.prompt_chars = 0
+        self._lock = threading.Lock()
+
+    def record_request(self, request: dict):
+        with self._lock:
+            self.requests += 1
+            self.prompt_chars += sum(len(str(message.get('content', ''))) for message in request.get('messages', []))
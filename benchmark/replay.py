@@ -0,0 +1,352 @@
+"""
+离线压测：将录制的 Webhook 请求回放到 /review/webhook，GitLab/GitHub 与 LLM 均由本地模拟服务提供。
+
+用法（在项目根目录执行）：
+    python -m benchmark.replay --requests 50 --concurrency 10 --llm-latency 2 --driver async
+    python -m benchmark.replay --driver rq --rq-workers 4 --redis-url redis://127.0.0.1:6379
+
+输出每种队列驱动下的吞吐量、Webhook 响应(ack)耗时、端到端耗时（从发送 Webhook 到 Review 结果写回
+GitLab/GitHub）的分位数，以及服务进程树的 RSS 峰值。
+"""
+import argparse
+import copy
+import hashlib
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlparse
+
+import requests
+
+from benchmark.fake_servers import FakeGitServer, FakeLLMServer
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_CORPUS = Path(__file__).resolve().parent / 'payloads'
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def load_corpus(corpus_dir: Path) -> list:
+    """加载录制的 Webhook 请求，按内容识别来源与事件类型"""
+    corpus = []
+    for path in sorted(corpus_dir.glob('*.json')):
+        payload = json.loads(path.read_text(encoding='utf-8'))
+        if 'object_kind' in payload:
+            kind = f"gitlab_{payload['object_kind']}"
+        elif 'pull_request' in payload:
+            kind = 'github_pull_request'
+        else:
+            kind = 'github_push'
+        corpus.append((kind, payload))
+    if not corpus:
+        raise SystemExit(f'未在 {corpus_dir} 中找到 *.json 请求样本')
+    return corpus
+
+
+def prepare_request(kind: str, template: dict, seq: int):
+    """
+    为每次回放生成唯一的 MR/PR 编号或提交 SHA，用于把模拟服务收到的 note 与请求对应起来
+    :return: (payload, headers, correlation_key)
+    """
+    payload = copy.deepcopy(template)
+    # 注意不能以 0000000 开头，否则会被当作删除分支的 push
+    sha = hashlib.sha1(str(seq).encode()).hexdigest()
+    headers = {'Content-Type': 'application/json'}
+    if kind == 'gitlab_merge_request':
+        payload['object_attributes']['iid'] = seq
+        key = str(seq)
+    elif kind == 'github_pull_request':
+        payload['number'] = seq
+        payload['pull_request']['number'] = seq
+        headers['X-GitHub-Event'] = 'pull_request'
+        key = str(seq)
+    else:
+        payload['after'] = sha
+        payload['commits'][-1]['id'] = sha
+        if kind == 'github_push':
+            headers['X-GitHub-Event'] = 'push'
+        key = sha
+    return payload, headers, key
+
+
+class RssMonitor(threading.Thread):
+    """定期采样进程树的 RSS，记录峰值（仅支持 Linux /proc）"""
+
+    def __init__(self, root_pids: list, interval: float = 0.05):
+        super().__init__(daemon=True)
+        self.root_pids = root_pids
+        self.interval = interval
+        self.peak_total_kb = 0
+        self.peak_process_kb = 0
+        self._stop_event = threading.Event()
+
+    @staticmethod
+    def _children_map() -> dict:
+        children = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+        return children
+
+    @staticmethod
+    def _rss_kb(pid: int) -> int:
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1])
+        except OSError:
+            pass
+        return 0
+
+    def sample(self):
+        children = self._children_map()
+        pids, stack = set(), list(self.root_pids)
+        while stack:
+            pid = stack.pop()
+            if pid not in pids:
+                pids.add(pid)
+                stack.extend(children.get(pid, []))
+        rss = [self._rss_kb(pid) for pid in pids]
+        self.peak_total_kb = max(self.peak_total_kb, sum(rss))
+        self.peak_process_kb = max(self.peak_process_kb, max(rss, default=0))
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.sample()
+            time.sleep(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def build_env(args, driver: str, port: int, git_server: FakeGitServer, llm_server: FakeLLMServer,
+              workdir: Path) -> dict:
+    env = dict(os.environ)
+    redis_url = urlparse(args.redis_url)
+    env.update({
+        'PYTHONPATH': str(PROJECT_ROOT),
+        'SERVER_PORT': str(port),
+        'QUEUE_DRIVER': driver,
+        'REDIS_HOST': redis_url.hostname or '127.0.0.1',
+        'REDIS_PORT': str(redis_url.port or 6379),
+        'LLM_PROVIDER': 'openai',
+        'OPENAI_API_KEY': 'bench',
+        'OPENAI_API_BASE_URL': f'{llm_server.url}/v1',
+        'OPENAI_API_MODEL': 'bench-model',
+        'GITLAB_URL': git_server.url,
+        'GITLAB_ACCESS_TOKEN': 'bench',
+        'GITHUB_ACCESS_TOKEN': 'bench',
+        'GITHUB_API_URL': git_server.url,
+        'PUSH_REVIEW_ENABLED': '1',
+        'SUPPORTED_EXTENSIONS': '.py,.java',
+        'DINGTALK_ENABLED': '0',
+        'WECOM_ENABLED': '0',
+        'FEISHU_ENABLED': '0',
+        'LOG_FILE': str(workdir / 'log' / 'app.log'),
+        'LOG_LEVEL': args.log_level,
+        'TRACE_EXPORTER': 'none',
+        'PROMETHEUS_MULTIPROC_DIR': str(workdir / 'data' / 'prometheus'),
+    })
+    return env
+
+
+def prepare_workdir() -> Path:
+    """创建独立的工作目录，避免读写项目中的 conf/.env 与 data/data.db"""
+    workdir = Path(tempfile.mkdtemp(prefix='codereview-bench-'))
+    for name in ('conf', 'data', 'log'):
+        (workdir / name).mkdir()
+    shutil.copy(PROJECT_ROOT / 'conf' / 'prompt_templates.yml', workdir / 'conf' / 'prompt_templates.yml')
+    return workdir
+
+
+def wait_for_server(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'服务进程已退出，退出码 {process.returncode}')
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f'等待服务启动超时: {url}')
+
+
+def redis_available(redis_url: str) -> bool:
+    try:
+        from redis import Redis
+        return Redis.from_url(redis_url, socket_connect_timeout=1).ping()
+    except Exception:
+        return False
+
+
+def run_driver(args, driver: str, corpus: list) -> dict:
+    workdir = prepare_workdir()
+    port = free_port()
+    with FakeGitServer(files=args.diff_files, lines_per_file=args.diff_lines, latency=args.git_latency) as git_server, \
+            FakeLLMServer(latency=args.llm_latency, completion_tokens=args.llm_tokens) as llm_server:
+        env = build_env(args, driver, port, git_server, llm_server, workdir)
+        processes = [subprocess.Popen([sys.executable, str(PROJECT_ROOT / 'api.py')], cwd=workdir, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)]
+        try:
+            if driver == 'rq':
+                from biz.gitlab.webhook_handler import slugify_url
+                queue_names = [slugify_url(git_server.url), slugify_url(os.getenv('GITHUB_URL') or 'https://github.com')]
+                for _ in range(args.rq_workers):
+                    processes.append(subprocess.Popen(
+                        [shutil.which('rq') or 'rq', 'worker', *queue_names, '--url', args.redis_url,
+                         '--path', str(PROJECT_ROOT)],
+                        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+
+            base_url = f'http://127.0.0.1:{port}'
+            wait_for_server(f'{base_url}/', processes[0])
+
+            monitor = RssMonitor([p.pid for p in processes])
+            monitor.start()
+
+            sent_at, ack_latencies, failures = {}, [], 0
+            lock = threading.Lock()
+
+            def send(seq: int):
+                nonlocal failures
+                kind, template = corpus[seq % len(corpus)]
+                payload, headers, key = prepare_request(kind, template, seq + 1)
+                start = time.time()
+                try:
+                    response = requests.post(f'{base_url}/review/webhook', json=payload, headers=headers, timeout=30)
+                    ok = response.status_code == 200
+                except requests.RequestException:
+                    ok = False
+                elapsed = time.time() - start
+                with lock:
+                    if ok:
+                        sent_at[key] = start
+                        ack_latencies.append(elapsed)
+                    else:
+                        failures += 1
+
+            started = time.time()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                for seq in range(args.requests):
+                    executor.submit(send, seq)
+                    if args.rate:
+                        time.sleep(1 / args.rate)
+
+            deadline = time.time() + args.timeout
+            while time.time() < deadline and len(set(sent_at) & set(git_server.notes)) < len(sent_at):
+                time.sleep(0.1)
+
+            monitor.stop()
+            monitor.sample()
+
+            completed = {key: git_server.notes[key] - sent_at[key] for key in sent_at if key in git_server.notes}
+            finished = max((git_server.notes[key] for key in completed), default=time.time())
+            duration = max(finished - started, 1e-9)
+            return {
+                'driver': driver,
+                'requests': args.requests,
+                'acked': len(sent_at),
+                'failed': failures,
+                'completed': len(completed),
+                'duration_s': duration,
+                'throughput_rps': len(completed) / duration,
+                'ack_ms': {f'p{p}': percentile(ack_latencies, p) * 1000 for p in (50, 95, 99)},
+                'e2e_s': {f'p{p}': percentile(list(completed.values()), p) for p in (50, 95, 99)},
+                'peak_rss_mb': {'total': monitor.peak_total_kb / 1024, 'max_process': monitor.peak_process_kb / 1024},
+                'llm_requests': llm_server.requests,
+                'git_requests': dict(sorted(git_server.request_counts.items())),
+            }
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+            if not args.keep_workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_report(results: list):
+    header = (f"{'driver':<8}{'done/sent':>12}{'rps':>9}{'ack p50':>10}{'ack p95':>10}{'ack p99':>10}"
+              f"{'e2e p50':>10}{'e2e p95':>10}{'e2e p99':>10}{'RSS MB':>10}")
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r['driver']:<8}{r['completed']:>5}/{r['requests']:<6}{r['throughput_rps']:>9.2f}"
+              f"{r['ack_ms']['p50']:>8.1f}ms{r['ack_ms']['p95']:>8.1f}ms{r['ack_ms']['p99']:>8.1f}ms"
+              f"{r['e2e_s']['p50']:>9.2f}s{r['e2e_s']['p95']:>9.2f}s{r['e2e_s']['p99']:>9.2f}s"
+              f"{r['peak_rss_mb']['total']:>10.1f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='回放录制的 Webhook 请求，测量 Review 流水线的性能')
+    parser.add_argument('--driver', choices=['async', 'rq', 'all'], default='async', help='队列驱动')
+    parser.add_argument('--corpus', type=Path, default=DEFAULT_CORPUS, help='录制的 Webhook 请求目录(*.json)')
+    parser.add_argument('--requests', type=int, default=20, help='回放的请求总数')
+    parser.add_argument('--concurrency', type=int, default=5, help='并发发送 Webhook 的线程数')
+    parser.add_argument('--rate', type=float, default=0, help='每秒发送的请求数，0 表示不限速')
+    parser.add_argument('--llm-latency', type=float, default=1.0, help='模拟 LLM 的响应延迟（秒）')
+    parser.add_argument('--llm-tokens', type=int, default=200, help='模拟 LLM 每次返回的 completion token 数')
+    parser.add_argument('--git-latency', type=float, default=0.0, help='模拟 GitLab/GitHub API 的响应延迟（秒）')
+    parser.add_argument('--diff-files', type=int, default=3, help='每次变更包含的文件数')
+    parser.add_argument('--diff-lines', type=int, default=40, help='每个文件新增的代码行数')
+    parser.add_argument('--rq-workers', type=int, default=2, help='rq 驱动下启动的 worker 数')
+    parser.add_argument('--redis-url', default='redis://127.0.0.1:6379', help='rq 驱动使用的 Redis 地址')
+    parser.add_argument('--timeout', type=float, default=300, help='等待全部 Review 完成的最长时间（秒）')
+    parser.add_argument('--log-level', default='WARNING', help='被测服务的日志级别')
+    parser.add_argument('--json', type=Path, help='将结果以 JSON 格式写入该文件')
+    parser.add_argument('--keep-workdir', action='store_true', help='保留临时工作目录（日志、数据库）便于排查')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    corpus = load_corpus(args.corpus)
+    drivers = ['async', 'rq'] if args.driver == 'all' else [args.driver]
+
+    results = []
+    for driver in drivers:
+        if driver == 'rq' and not redis_available(args.redis_url):
+            print(f'跳过 rq 驱动: 无法连接 Redis ({args.redis_url})')
+            continue
+        print(f'开始回放: driver={driver}, requests={args.requests}, concurrency={args.concurrency}')
+        results.append(run_driver(args, driver, corpus))
+
+    if results:
+        print_report(results)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+IM 消息切分基准：对比各渠道共用的 split_message 与原企业微信 _split_content 的耗时与切分结果。
+
+用法（在项目根目录执行）：
+    python -m benchmark.split_messages --size-kb 100 --rounds 20
+
+样本为约 100KB 的 Review 结果：多段 markdown（含代码块）与不含换行的长文本。输出每种样本下的平均耗时、
+切分数量、是否超出长度限制、代码块围栏是否成对。
+"""
+import argparse
+import random
+import time
+
+from biz.utils.im.splitter import split_message, max_message_bytes
+
+
+class NoProgress(Exception):
+    pass
+
+
+def legacy_split_content(content: str, max_bytes: int) -> list:
+    """原企业微信的切分方法：从上限位置逐字节向前查找换行符"""
+    chunks = []
+    start_pos = 0
+    content_bytes = content.encode('utf-8')
+    content_length = len(content_bytes)
+
+    while start_pos < content_length:
+        end_pos = start_pos + max_bytes
+        if end_pos >= content_length:
+            chunks.append(content_bytes[start_pos:].decode('utf-8', errors='ignore'))
+            break
+
+        while end_pos > start_pos:
+            if content_bytes[end_pos - 1:end_pos] == b'\n':
+                break
+            end_pos -= 1
+
+        if end_pos == start_pos:
+            # 原实现在一段 max_bytes 内没有换行符时不会前进，会一直循环
+            raise NoProgress()
+        chunks.append(content_bytes[start_pos:end_pos].decode('utf-8', errors='ignore'))
+        start_pos = end_pos
+
+    return chunks
+
+
+def markdown_review(size: int, seed: int = 0) -> str:
+    """生成接近 Review 结果格式的 markdown：问题列表、说明段落与代码块"""
+    rng = random.Random(seed)
+    parts = ['### 😀代码评分：85分\n\n#### ✅代码优点：\n- 结构清晰，命名规范。\n']
+    index = 0
+    while sum(len(part.encode('utf-8')) for part in parts) < size:
+        index += 1
+        parts.append(f'#### 🤔问题点 {index}：\n- 描述：函数 handle_{index} 中未处理异常情况，可能导致任务中断。\n'
+                     f'- 建议：在调用外部接口时增加超时与重试。\n')
+        code_lines = [f'    result_{i} = client.request("/api/v{rng.randint(1, 9)}/items/{i}", timeout=5)'
+                      for i in range(rng.randint(3, 40))]
+        parts.append('```python\ndef handle_%d(client):\n%s\n    return result_0\n```\n' % (index, '\n'.join(code_lines)))
+    return '\n'.join(parts)
+
+
+def single_line_review(size: int) -> str:
+    """不含换行符的长文本，例如模型未按格式输出的结果"""
+    unit = '这段代码的变量命名不够清晰，建议补充注释并拆分过长的函数。'
+    return unit * (size // len(unit.encode('utf-8')) + 1)
+
+
+def fences_balanced(chunk: str) -> bool:
+    return sum(1 for line in chunk.split('\n') if line.lstrip().startswith('```')) % 2 == 0
+
+
+def measure(func, content: str, max_bytes: int, rounds: int):
+    try:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            chunks = func(content, max_bytes)
+        elapsed = (time.perf_counter() - start) / rounds
+    except NoProgress:
+        return None
+    return {
+        'ms': elapsed * 1000,
+        'chunks': len(chunks),
+        'oversized': sum(1 for chunk in chunks if len(chunk.encode('utf-8')) > max_bytes),
+        'unbalanced': sum(1 for chunk in chunks if not fences_balanced(chunk)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='IM 消息切分基准')
+    parser.add_argument('--size-kb', type=int, default=100, help='样本大小（KB）')
+    parser.add_argument('--rounds', type=int, default=20, help='每种样本重复切分的次数')
+    args = parser.parse_args()
+
+    size = args.size_kb * 1024
+    samples = [('markdown', markdown_review(size)), ('single-line', single_line_review(size))]
+    limits = [('wecom/markdown', max_message_bytes('wecom', 'markdown')),
+              ('dingtalk/markdown', max_message_bytes('dingtalk', 'markdown'))]
+    splitters = [('split_message', split_message), ('legacy', legacy_split_content)]
+
+    print(f"{'sample':<12} {'limit':<18} {'splitter':<14} {'avg ms':>8} {'chunks':>7} {'oversized':>10} "
+          f"{'unbalanced':>11}")
+    for sample_name, content in samples:
+        for limit_name, max_bytes in limits:
+            for splitter_name, func in splitters:
+                result = measure(func, content, max_bytes, args.rounds)
+                if result is None:
+                    print(f"{sample_name:<12} {limit_name:<18} {splitter_name:<14} {'no progress (infinite loop)':>40}")
+                    continue
+                print(f"{sample_name:<12} {limit_name:<18} {splitter_name:<14} {result['ms']:>8.2f} "
+                      f"{result['chunks']:>7} {result['oversized']:>10} {result['unbalanced']:>11}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+import argparse
+
+from dotenv import load_dotenv
+
+
+def rebuild_rollups(args):
+    from biz.service.review_service import ReviewService
+    days = ReviewService.rebuild_rollups()
+    print(f"已重新计算 {days} 天的汇总数据")
+
+
+def maintain(args):
+    from biz.service.review_service import ReviewService
+    # 命令行中执行时，数据库尚未切换为增量回收模式则执行一次完整的 VACUUM 完成切换
+    report = ReviewService.run_maintenance(args.retention_days, full_vacuum=True)
+    for table, count in report['archived'].items():
+        print(f"{table}: 归档 {count} 条记录")
+    print(f"回收 {report['reclaimed_pages']} 页，数据库大小 {report['size_before'] / 1024 / 1024:.1f}MB -> "
+          f"{report['size_after'] / 1024 / 1024:.1f}MB，耗时 {report['elapsed_seconds']}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="审核日志数据库维护工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("rebuild-rollups", help="根据审核日志重新计算每日汇总数据（review_daily_rollup）") \
+        .set_defaults(func=rebuild_rollups)
+
+    maintain_parser = subparsers.add_parser(
+        "maintain", help="归档过期的审核日志，回收空间并更新统计信息（首次执行时切换为增量回收模式，会重写整个数据库）")
+    maintain_parser.add_argument("--retention-days", type=int, default=None,
+                                 help="审核日志保留天数，默认读取 REVIEW_LOG_RETENTION_DAYS，0 表示不归档")
+    maintain_parser.set_defaults(func=maintain)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    load_dotenv("conf/.env")
+    main()
@@ -1,6 +1,39 @@
-class MergeRequestReviewEntity:
+from biz.llm.types import CompletionResult
+
+
+class LLMUsageMixin:
+    """从 llm_usage 中读取本次 Review 的 token 用量与耗时"""
+    llm_usage: CompletionResult
+
+    @property
+    def llm_provider(self):
+        return self.llm_usage.provider
+
+    @property
+    def llm_model(self):
+        return self.llm_usage.model
+
+    @property
+    def prompt_tokens(self):
+        return self.llm_usage.usage.prompt_tokens
+
+    @property
+    def completion_tokens(self):
+        return self.llm_usage.usage.completion_tokens
+
+    @property
+    def cached_tokens(self):
+        return self.llm_usage.usage.cached_tokens
+
+    @property
+    def llm_latency_ms(self):
+        return self.llm_usage.latency_ms
+
+
+class MergeRequestReviewEntity(LLMUsageMixin):
     def __init__(self, project_name: str, author: str, source_branch: str, target_branch: str, updated_at: int,
-                 commits: list, score: float, url: str, review_result: str, url_slug: str):
+                 commits: list, score: float, url: str, review_result: str, url_slug: str,
+                 llm_usage: CompletionResult = None, complexity_summary: str = None):
         self.project_name = project_name
         self.author = author
         self.source_branch = source_branch
@@ -11,6 +44,9 @@ class MergeRequestReviewEntity:
         self.url = url
         self.review_result = review_result
         self.url_slug = url_slug
+        self.llm_usage = llm_usage or CompletionResult()
+        # Review 前 lizard 分析得到的函数复杂度变化摘要
+        self.complexity_summary = complexity_summary
 
     @property
     def commit_messages(self):
@@ -18,9 +54,10 @@ class MergeRequestReviewEntity:
         return "; ".join(commit["message"].strip() for commit in self.commits)
 
 
-class PushReviewEntity:
+class PushReviewEntity(LLMUsageMixin):
     def __init__(self, project_name: str, author: str, branch: str, updated_at: int, commits: list, score: float,
-                 review_result: str, url_slug: str):
+                 review_result: str, url_slug: str, llm_usage: CompletionResult = None,
+                 complexity_summary: str = None):
         self.project_name = project_name
         self.author = author
         self.branch = branch
@@ -29,9 +66,11 @@ class PushReviewEntity:
         self.score = score
         self.review_result = review_result
         self.url_slug = url_slug
+        self.llm_usage = llm_usage or CompletionResult()
+        # Review 前 lizard 分析得到的函数复杂度变化摘要
+        self.complexity_summary = complexity_summary
 
     @property
     def commit_messages(self):
         # 合并所有 commit 的 message 属性，用分号分隔
         return "; ".join(commit["message"].strip() for commit in self.commits)
-
@@ -0,0 +1,170 @@
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+from biz.utils import metrics
+from biz.utils.log import logger
+
+# 执行事件处理函数的线程数，为 0 时在发布事件的线程中同步执行
+EVENT_BUS_WORKERS = int(os.getenv('EVENT_BUS_WORKERS', 4))
+# 等待执行的处理函数调用数上限，超过时 publish 阻塞等待
+EVENT_BUS_MAX_PENDING = int(os.getenv('EVENT_BUS_MAX_PENDING', 1000))
+# 任务结束时等待事件处理完成的最长时间（秒）
+EVENT_BUS_DRAIN_TIMEOUT = float(os.getenv('EVENT_BUS_DRAIN_TIMEOUT', 60))
+
+
+class EventBus:
+    """
+    进程内的异步事件总线。
+    publish 只把事件放入队列，由固定数量的线程执行订阅的处理函数：
+      - 每个处理函数的异常单独捕获并记录，不影响其他处理函数和发布方；
+      - 同一处理函数对同一 key（如项目名）的事件按发布顺序依次执行，不同 key、不同处理函数之间并发执行；
+      - 线程不足时优先执行 priority 较大的处理函数；
+      - 每个处理函数的耗时与失败次数记录到 Prometheus 指标，也可以通过 handler_stats() 获取。
+    线程不会跨 fork 继承，工作进程在首次发布事件时启动自己的线程；进程退出前需要调用 drain()。
+    async 与 rq 模式下每个任务在单独的进程中执行并在结束时 drain()，任务的结束时间仍包含处理函数的执行时间，
+    只在 API 进程等长期运行的进程中发布事件时，处理函数才完全不阻塞发布方。
+    """
+
+    def __init__(self, max_workers: int = EVENT_BUS_WORKERS, max_pending: int = EVENT_BUS_MAX_PENDING):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        # 事件名 -> [(priority, 处理函数名, 处理函数)]，按 priority 从大到小排列
+        self._handlers = defaultdict(list)
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._condition = threading.Condition()
+        # (处理函数名, key) -> 待执行的调用，同一队列中的调用依次执行
+        self._lanes = {}
+        self._running_lanes = set()
+        # 可以执行的队列：(-priority, 序号, 队列 key)
+        self._ready = []
+        self._sequence = itertools.count()
+        self._pending = 0
+        self._workers = []
+        # 处理函数名 -> [调用次数, 失败次数, 总耗时, 最大耗时]
+        self._stats = defaultdict(lambda: [0, 0, 0.0, 0.0])
+
+    def subscribe(self, event: str, priority: int = 0):
+        """
+        装饰器：订阅事件
+        :param event: 事件名
+        :param priority: 优先级，越大越先执行
+        """
+
+        def decorator(handler):
+            handlers = self._handlers[event]
+            handlers.append((priority, handler.__name__, handler))
+            handlers.sort(key=lambda item: -item[0])
+            return handler
+
+        return decorator
+
+    def publish(self, event: str, payload, key: str = None) -> int:
+        """
+        发布事件
+        :param event: 事件名
+        :param payload: 传给处理函数的参数
+        :param key: 顺序键，同一处理函数对相同 key 的事件按发布顺序执行，例如项目名
+        :return: 订阅该事件的处理函数数量
+        """
+        handlers = self._handlers.get(event, [])
+        if self.max_workers <= 0:
+            for priority, name, handler in handlers:
+                self._invoke(event, name, handler, payload)
+            return len(handlers)
+
+        with self._condition:
+            # 积压过多时等待，避免无限占用内存
+            while self._pending and self._pending + len(handlers) > self.max_pending:
+                self._condition.wait()
+            for priority, name, handler in handlers:
+                lane_key = (name, key)
+                lane = self._lanes.setdefault(lane_key, deque())
+                # 在发布方的上下文中执行，处理函数的 Span 与发布方属于同一条链路
+                lane.append((priority, event, name, handler, payload, contextvars.copy_context()))
+                if len(lane) == 1 and lane_key not in self._running_lanes:
+                    heapq.heappush(self._ready, (-priority, next(self._sequence), lane_key))
+            self._pending += len(handlers)
+            self._start_workers()
+            self._condition.notify_all()
+        return len(handlers)
+
+    def _start_workers(self):
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._work, name=f'event-bus-{len(self._workers)}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._ready:
+                    self._condition.wait()
+                _, _, lane_key = heapq.heappop(self._ready)
+                priority, event, name, handler, payload, context = self._lanes[lane_key].popleft()
+                self._running_lanes.add(lane_key)
+
+            context.run(self._invoke, event, name, handler, payload)
+
+            with self._condition:
+                self._running_lanes.discard(lane_key)
+                lane = self._lanes[lane_key]
+                if lane:
+                    heapq.heappush(self._ready, (-lane[0][0], next(self._sequence), lane_key))
+                else:
+                    del self._lanes[lane_key]
+                self._pending -= 1
+                self._condition.notify_all()
+
+    def _invoke(self, event: str, name: str, handler, payload):
+        start = time.perf_counter()
+        failed = False
+        try:
+            handler(payload)
+        except Exception as e:
+            failed = True
+            metrics.EVENT_HANDLER_ERRORS.labels(event=event, handler=name).inc()
+            logger.error(f"事件处理失败: event={event}, handler={name}, error={e}", exc_info=True)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.EVENT_HANDLER_LATENCY.labels(event=event, handler=name).observe(elapsed)
+            # 多个工作线程会同时更新同一个处理函数的统计
+            with self._condition:
+                stats = self._stats[name]
+                stats[0] += 1
+                stats[1] += int(failed)
+                stats[2] += elapsed
+                stats[3] = max(stats[3], elapsed)
+
+    def drain(self, timeout: float = EVENT_BUS_DRAIN_TIMEOUT) -> bool:
+        """
+        等待已发布的事件处理完成
+        :return: 是否在超时前全部处理完成
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"等待事件处理超时，仍有 {self._pending} 个处理函数未执行完")
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def handler_stats(self) -> dict:
+        """各处理函数的调用次数、失败次数、平均耗时与最大耗时（毫秒）"""
+        with self._condition:
+            stats = {name: tuple(values) for name, values in self._stats.items()}
+        return {name: {'count': count, 'errors': errors, 'avg_ms': round(total / count * 1000, 1) if count else 0,
+                       'max_ms': round(max_elapsed * 1000, 1)}
+                for name, (count, errors, total, max_elapsed) in stats.items()}
+
+
+event_bus = EventBus()
@@ -1,18 +1,33 @@
-from blinker import Signal
-
 from biz.entity.review_entity import MergeRequestReviewEntity, PushReviewEntity
+from biz.event.event_bus import event_bus
 from biz.service.review_service import ReviewService
+from biz.utils import tracing
 from biz.utils.im import notifier
 
-# 定义全局事件管理器（事件信号）
-event_manager = {
-    "merge_request_reviewed": Signal(),
-    "push_reviewed": Signal(),
-}
+# 事件名
+MERGE_REQUEST_REVIEWED = "merge_request_reviewed"
+PUSH_REVIEWED = "push_reviewed"
+
+
+def publish_event(event: str, entity):
+    """
+    发布 Review 事件，不等待处理函数执行完成。同一项目的事件按发布顺序处理
+    :param event: MERGE_REQUEST_REVIEWED 或 PUSH_REVIEWED
+    :param entity: MergeRequestReviewEntity 或 PushReviewEntity
+    """
+    event_bus.publish(event, entity, key=entity.project_name)
+
+
+# 定义事件处理函数，记录数据库的优先级高于发送通知
+@event_bus.subscribe(MERGE_REQUEST_REVIEWED, priority=10)
+@tracing.traced('event.merge_request_reviewed.save')
+def save_merge_request_review_log(mr_review_entity: MergeRequestReviewEntity):
+    ReviewService().insert_mr_review_log(mr_review_entity)
 
 
-# 定义事件处理函数
-def on_merge_request_reviewed(mr_review_entity: MergeRequestReviewEntity):
+@event_bus.subscribe(MERGE_REQUEST_REVIEWED)
+@tracing.traced('event.merge_request_reviewed.notify')
+def notify_merge_request_reviewed(mr_review_entity: MergeRequestReviewEntity):
     # 发送IM消息通知
     im_msg = f"""
 ### 🔀 {mr_review_entity.project_name}: Merge Request
@@ -35,11 +50,16 @@ def on_merge_request_reviewed(mr_review_entity: MergeRequestReviewEntity):
                                   project_name=mr_review_entity.project_name,
                                   url_slug=mr_review_entity.url_slug)
 
-    # 记录到数据库
-    ReviewService().insert_mr_review_log(mr_review_entity)
+
+@event_bus.subscribe(PUSH_REVIEWED, priority=10)
+@tracing.traced('event.push_reviewed.save')
+def save_push_review_log(entity: PushReviewEntity):
+    ReviewService().insert_push_review_log(entity)
 
 
-def on_push_reviewed(entity: PushReviewEntity):
+@event_bus.subscribe(PUSH_REVIEWED)
+@tracing.traced('event.push_reviewed.notify')
+def notify_push_reviewed(entity: PushReviewEntity):
     # 发送IM消息通知
     im_msg = f"### 🚀 {entity.project_name}: Push\n\n"
     im_msg += "#### 提交记录:\n"
@@ -61,11 +81,3 @@ def on_push_reviewed(entity: PushReviewEntity):
     notifier.send_notification(content=im_msg, msg_type='markdown',
                                   title=f"{entity.project_name} Push Event", project_name=entity.project_name,
                                   url_slug=entity.url_slug)
-
-    # 记录到数据库
-    ReviewService().insert_push_review_log(entity)
-
-
-# 连接事件处理函数到事件信号
-event_manager["merge_request_reviewed"].connect(on_merge_request_reviewed)
-event_manager["push_reviewed"].connect(on_push_reviewed)
@@ -1,12 +1,17 @@
+import base64
 import json
 import os
 import re
 import time
+from urllib.parse import quote
 
 import requests
 
+from biz.utils import metrics, tracing
 from biz.utils.log import logger
 
+# GitHub REST API 地址，GitHub Enterprise 或本地测试时可通过环境变量覆盖
+GITHUB_API_URL = os.getenv('GITHUB_API_URL', 'https://api.github.com').rstrip('/')
 
 
 def filter_changes(changes: list):
@@ -41,11 +46,14 @@ def filter_changes(changes: list):
     logger.info(f"SUPPORTED_EXTENSIONS: {supported_extensions}")
     logger.info(f"After filtering deleted files: {not_deleted_changes}")
     
-    # 过滤 `new_path` 以支持的扩展名结尾的元素, 仅保留diff和new_path字段
+    # 过滤 `new_path` 以支持的扩展名结尾的元素, 仅保留diff、文件路径、是否为新文件与新版本的 blob SHA
     filtered_changes = [
         {
             'diff': item.get('diff', ''),
-            'new_path': item['new_path']
+            'new_path': item['new_path'],
+            'old_path': item.get('old_path') or item['new_path'],
+            'new_file': item.get('status') == 'added',
+            'blob_id': item.get('blob_id')
         }
         for item in not_deleted_changes
         if any(item.get('new_path', '').endswith(ext) for ext in supported_extensions)
@@ -54,6 +62,27 @@ def filter_changes(changes: list):
     return filtered_changes
 
 
+def get_file_content(github_token: str, repo_full_name: str, file_path: str, ref: str) -> tuple:
+    """
+    获取文件在指定提交中的内容
+    :return: (blob SHA, 文件内容)，文件不存在、超过 1MB 或获取失败时返回 (None, None)
+    """
+    url = f"{GITHUB_API_URL}/repos/{repo_full_name}/contents/{quote(file_path)}"
+    headers = {
+        'Authorization': f'token {github_token}',
+        'Accept': 'application/vnd.github.v3+json'
+    }
+    with metrics.track_latency(metrics.GIT_API_LATENCY, platform='github', endpoint='contents'):
+        response = requests.get(url, headers=headers, params={'ref': ref}, timeout=30)
+    if response.status_code != 200:
+        logger.debug(f"Failed to get file {file_path}@{ref}: {response.status_code}")
+        return None, None
+    data = response.json()
+    if not isinstance(data, dict) or data.get('encoding') != 'base64':
+        return None, None
+    return data.get('sha'), base64.b64decode(data.get('content', '')).decode('utf-8', errors='replace')
+
+
 class PullRequestHandler:
     def __init__(self, webhook_data: dict, github_token: str, github_url: str):
         self.pull_request_number = None
@@ -63,6 +92,8 @@ class PullRequestHandler:
         self.event_type = None
         self.repo_full_name = None
         self.action = None
+        # 变更的比较范围 (旧版本的提交, 新版本的提交)
+        self.diff_refs = None
         self.parse_event_type()
 
     def parse_event_type(self):
@@ -75,7 +106,12 @@ class PullRequestHandler:
         self.pull_request_number = self.webhook_data.get('pull_request', {}).get('number')
         self.repo_full_name = self.webhook_data.get('repository', {}).get('full_name')
         self.action = self.webhook_data.get('action')
+        base_sha = self.webhook_data.get('pull_request', {}).get('base', {}).get('sha')
+        head_sha = self.webhook_data.get('pull_request', {}).get('head', {}).get('sha')
+        if base_sha and head_sha:
+            self.diff_refs = (base_sha, head_sha)
 
+    @tracing.traced('github.fetch.pull_request_changes')
     def get_pull_request_changes(self) -> list:
         # 检查是否为 Pull Request Hook 事件
         if self.event_type != 'pull_request':
@@ -87,12 +123,13 @@ class PullRequestHandler:
         retry_delay = 10  # 重试间隔时间（秒）
         for attempt in range(max_retries):
             # 调用 GitHub API 获取 Pull Request 的 files（变更）
-            url = f"https://api.github.com/repos/{self.repo_full_name}/pulls/{self.pull_request_number}/files"
+            url = f"{GITHUB_API_URL}/repos/{self.repo_full_name}/pulls/{self.pull_request_number}/files"
             headers = {
                 'Authorization': f'token {self.github_token}',
                 'Accept': 'application/vnd.github.v3+json'
             }
-            response = requests.get(url, headers=headers)
+            with metrics.track_latency(metrics.GIT_API_LATENCY, platform='github', endpoint='pull_request_files'):
+                response = requests.get(url, headers=headers)
             logger.debug(
                 f"Get changes response from GitHub (attempt {attempt + 1}): {response.status_code}, {response.text}, URL: {url}")
 
@@ -104,9 +141,11 @@ class PullRequestHandler:
                     changes = []
                     for file in files:
                         change = {
-                            'old_path': file.get('filename'),
+                            'old_path': file.get('previous_filename') or file.get('filename'),
                             'new_path': file.get('filename'),
-                            'diff': file.get('patch', '')
+                            'diff': file.get('patch', ''),
+                            'status': file.get('status', ''),
+                            'blob_id': file.get('sha')
                         }
                         changes.append(change)
                     return changes
@@ -121,18 +160,27 @@ class PullRequestHandler:
         logger.warning(f"Max retries ({max_retries}) reached. Changes is still empty.")
         return []  # 达到最大重试次数后返回空列表
 
+    def get_blob_id(self, file_path: str, ref: str):
+        # contents 接口无法只获取 blob SHA，新版本的 blob SHA 已在变更的 blob_id 中
+        return None
+
+    def get_file_content(self, file_path: str, ref: str) -> tuple:
+        return get_file_content(self.github_token, self.repo_full_name, file_path, ref)
+
+    @tracing.traced('github.fetch.pull_request_commits')
     def get_pull_request_commits(self) -> list:
         # 检查是否为 Pull Request Hook 事件
         if self.event_type != 'pull_request':
             return []
 
         # 调用 GitHub API 获取 Pull Request 的 commits
-        url = f"https://api.github.com/repos/{self.repo_full_name}/pulls/{self.pull_request_number}/commits"
+        url = f"{GITHUB_API_URL}/repos/{self.repo_full_name}/pulls/{self.pull_request_number}/commits"
         headers = {
             'Authorization': f'token {self.github_token}',
             'Accept': 'application/vnd.github.v3+json'
         }
-        response = requests.get(url, headers=headers)
+        with metrics.track_latency(metrics.GIT_API_LATENCY, platform='github', endpoint='pull_request_commits'):
+            response = requests.get(url, headers=headers)
         logger.debug(f"Get commits response from GitHub: {response.status_code}, {response.text}")
         
         # 检查请求是否成功
@@ -156,8 +204,9 @@ class PullRequestHandler:
             logger.warn(f"Failed to get commits: {response.status_code}, {response.text}")
             return []
 
+    @tracing.traced('github.note.add_pull_request_note')
     def add_pull_request_notes(self, review_result):
-        url = f"https://api.github.com/repos/{self.repo_full_name}/issues/{self.pull_request_number}/comments"
+        url = f"{GITHUB_API_URL}/repos/{self.repo_full_name}/issues/{self.pull_request_number}/comments"
         headers = {
             'Authorization': f'token {self.github_token}',
             'Accept': 'application/vnd.github.v3+json'
@@ -165,7 +214,8 @@ class PullRequestHandler:
         data = {
             'body': review_result
         }
-        response = requests.post(url, headers=headers, json=data)
+        with metrics.track_latency(metrics.GIT_API_LATENCY, platform='github', endpoint='issue_comments'):
+            response = requests.post(url, headers=headers, json=data)
         logger.debug(f"Add comment to GitHub PR {url}: {response.status_code}, {response.text}")
         if response.status_code == 201:
             logger.info("Comment successfully added to pull request.")
@@ -182,7 +232,10 @@ class PushHandler:
         self.event_type = None
         self.repo_full_name = None
         self.branch_name = None
+        self.branch_created = False
         self.commit_list = []
+        # 变更的比较范围 (旧版本的提交, 新版本的提交)，获取变更后设置
+        self.diff_refs = None
         self.parse_event_type()
 
     def parse_event_type(self):
@@ -194,6 +247,7 @@ class PushHandler:
         # 提取 Push 事件的相关参数
         self.repo_full_name = self.webhook_data.get('repository', {}).get('full_name')
         self.branch_name = self.webhook_data.get('ref', '').replace('refs/heads/', '')
+        self.branch_created = self.webhook_data.get('created', False)
         self.commit_list = self.webhook_data.get('commits', [])
 
     def get_push_commits(self) -> list:
@@ -216,6 +270,7 @@ class PushHandler:
         logger.info(f"Collected {len(commit_details)} commits from push event.")
         return commit_details
 
+    @tracing.traced('github.note.add_push_note')
     def add_push_notes(self, message: str):
         # 添加评论到 GitHub Push 请求的提交中（此处假设是在最后一次提交上添加注释）
         if not self.commit_list:
@@ -228,7 +283,7 @@ class PushHandler:
             logger.error("Last commit ID not found.")
             return
 
-        url = f"https://api.github.com/repos/{self.repo_full_name}/commits/{last_commit_id}/comments"
+        url = f"{GITHUB_API_URL}/repos/{self.repo_full_name}/commits/{last_commit_id}/comments"
         headers = {
             'Authorization': f'token {self.github_token}',
             'Accept': 'application/vnd.github.v3+json'
@@ -236,7 +291,8 @@ class PushHandler:
         data = {
             'body': message
         }
-        response = requests.post(url, headers=headers, json=data)
+        with metrics.track_latency(metrics.GIT_API_LATENCY, platform='github', endpoint='commit_comments'):
+            response = requests.post(url, headers=headers, json=data)
         logger.debug(f"Add comment to commit {last_commit_id}: {response.status_code}, {response.text}")
         if response.status_code == 201:
             logger.info("Comment successfully added to push commit.")
@@ -246,12 +302,13 @@ class PushHandler:
 
     def __repository_commits(self, sha: str = "", per_page: int = 100, page: int = 1):
         # 获取仓库提交信息
-        url = f"https://api.github.com/repos/{self.repo_full_name}/commits?sha={sha}&per_page={per_page}&page={page}"
+        url = f"{GITHUB_API_URL}/repos/{self.repo_full_name}/commits?sha={sha}&per_page={per_page}&page={page}"
         headers = {
             'Authorization': f'token {self.github_token}',
             'Accept': 'application/vnd.github.v3+json'
         }
-        response = requests.get(url, headers=headers)
+        with metrics.track_latency(metrics.GIT_API_LATENCY, platform='github', endpoint='repository_commits'):
+            response = requests.get(url, headers=headers)
         logger.debug(
             f"Get commits response from GitHub for repository_commits: {response.status_code}, {response.text}, URL: {url}")
 
@@ -262,13 +319,21 @@ class PushHandler:
                 f"Failed to get commits for sha {sha}: {response.status_code}, {response.text}")
             return []
 
+    def get_blob_id(self, file_path: str, ref: str):
+        # contents 接口无法只获取 blob SHA，新版本的 blob SHA 已在变更的 blob_id 中
+        return None
+
+    def get_file_content(self, file_path: str, ref: str) -> tuple:
+        return get_file_content(self.github_token, self.repo_full_name, file_path, ref)
+
     def get_parent_commit_id(self, commit_id: str) -> str:
-        url = f"https://api.github.com/repos/{self.repo_full_name}/commits/{commit_id}"
+        url = f"{GITHUB_API_URL}/repos/{self.repo_full_name}/commits/{commit_id}"
         headers = {
             'Authorization': f'token {self.github_token}',
             'Accept': 'application/vnd.github.v3+json'
         }
-        response = requests.get(url, headers=headers)
+        with metrics.track_latency(metrics.GIT_API_LATENCY, platform='github', endpoint='commit'):
+            response = requests.get(url, headers=headers)
         logger.debug(
             f"Get commit response from GitHub: {response.status_code}, {response.text}, URL: {url}")
 
@@ -278,12 +343,13 @@ class PushHandler:
 
     def repository_compare(self, base: str, head: str):
         # 比较两个提交之间的差异
-        url = f"https://api.github.com/repos/{self.repo_full_name}/compare/{base}...{head}"
+        url = f"{GITHUB_API_URL}/repos/{self.repo_full_name}/compare/{base}...{head}"
         headers = {
             'Authorization': f'token {self.github_token}',
             'Accept': 'application/vnd.github.v3+json'
         }
-        response = requests.get(url, headers=headers)
+        with metrics.track_latency(metrics.GIT_API_LATENCY, platform='github', endpoint='compare'):
+            response = requests.get(url, headers=headers)
         logger.debug(
             f"Get changes response from GitHub for repository_compare: {response.status_code}, {response.text}, URL: {url}")
 
@@ -293,10 +359,11 @@ class PushHandler:
             diffs = []
             for file in files:
                 diff = {
-                    'old_path': file.get('filename'),
+                    'old_path': file.get('previous_filename') or file.get('filename'),
                     'new_path': file.get('filename'),
                     'diff': file.get('patch', ''),
-                    'status': file.get('status', '')
+                    'status': file.get('status', ''),
+                    'blob_id': file.get('sha')
                 }
                 diffs.append(diff)
             return diffs
@@ -305,7 +372,12 @@ class PushHandler:
                 f"Failed to get changes for repository_compare: {response.status_code}, {response.text}")
             return []
 
-    def get_push_changes(self) -> list:
+    @tracing.traced('github.fetch.push_changes')
+    def get_push_changes(self, base: str = None) -> list:
+        """
+        获取 Push 的代码变更
+        :param base: 比较的起点，例如分支上最后一个已 Review 的提交。为空时使用 Push 事件中的 before
+        """
         # 检查是否为 Push 事件
         if self.event_type != 'push':
             logger.warn(f"Invalid event type: {self.event_type}. Only 'push' event is supported now.")
@@ -321,17 +393,20 @@ class PushHandler:
         after = self.webhook_data.get('after', '')
         if before and after:
             # GitHub没有0000000的写法，但我们可以检查是否是创建或删除分支事件
-            if self.webhook_data.get('created', False):
+            if self.webhook_data.get('deleted', False):
+                # 删除分支处理
+                return []
+            if base:
+                before = base
+            elif self.webhook_data.get('created', False):
                 # 创建分支处理
                 first_commit_id = self.commit_list[0].get('id')
                 if first_commit_id:
                     parent_commit_id = self.get_parent_commit_id(first_commit_id)
                     if parent_commit_id:
                         before = parent_commit_id
-            elif self.webhook_data.get('deleted', False):
-                # 删除分支处理
-                return []
-            
+
+            self.diff_refs = (before, after)
             return self.repository_compare(before, after)
         else:
             # 如果before和after不存在，尝试通过commits获取
@@ -1,10 +1,12 @@
+import base64
 import os
 import re
 import time
-from urllib.parse import urljoin
+from urllib.parse import quote, urljoin
 
 import requests
 
+from biz.utils import metrics, tracing
 from biz.utils.log import logger
 
 
@@ -17,11 +19,13 @@ def filter_changes(changes: list):
 
     filter_deleted_files_changes = [change for change in changes if change.get("deleted_file") == False]
 
-    # 过滤 `new_path` 以支持的扩展名结尾的元素, 仅保留diff和new_path字段
+    # 过滤 `new_path` 以支持的扩展名结尾的元素, 仅保留diff、文件路径与是否为新文件
     filtered_changes = [
         {
             'diff': item.get('diff', ''),
-            'new_path': item['new_path']
+            'new_path': item['new_path'],
+            'old_path': item.get('old_path') or item['new_path'],
+            'new_file': bool(item.get('new_file'))
         }
         for item in filter_deleted_files_changes
         if any(item.get('new_path', '').endswith(ext) for ext in supported_extensions)
@@ -48,6 +52,40 @@ def slugify_url(original_url: str) -> str:
 
 
 
+def get_blob_id(gitlab_url: str, gitlab_token: str, project_id, file_path: str, ref: str):
+    """
+    用 HEAD 请求获取文件在指定提交中的 blob SHA，不下载文件内容
+    :return: blob SHA，文件不存在或获取失败时返回 None
+    """
+    url = urljoin(f"{gitlab_url}/", f"api/v4/projects/{project_id}/repository/files/{quote(file_path, safe='')}")
+    headers = {
+        'Private-Token': gitlab_token
+    }
+    with metrics.track_latency(metrics.GIT_API_LATENCY, platform='gitlab', endpoint='repository_files_head'):
+        response = requests.head(url, headers=headers, params={'ref': ref}, verify=False, timeout=10)
+    if response.status_code != 200:
+        return None
+    return response.headers.get('X-Gitlab-Blob-Id')
+
+
+def get_file_content(gitlab_url: str, gitlab_token: str, project_id, file_path: str, ref: str) -> tuple:
+    """
+    获取文件在指定提交中的内容
+    :return: (blob SHA, 文件内容)，文件不存在或获取失败时返回 (None, None)
+    """
+    url = urljoin(f"{gitlab_url}/", f"api/v4/projects/{project_id}/repository/files/{quote(file_path, safe='')}")
+    headers = {
+        'Private-Token': gitlab_token
+    }
+    with metrics.track_latency(metrics.GIT_API_LATENCY, platform='gitlab', endpoint='repository_files'):
+        response = requests.get(url, headers=headers, params={'ref': ref}, verify=False, timeout=30)
+    if response.status_code != 200:
+        logger.debug(f"Failed to get file {file_path}@{ref}: {response.status_code}")
+        return None, None
+    data = response.json()
+    return data.get('blob_id'), base64.b64decode(data.get('content', '')).decode('utf-8', errors='replace')
+
+
 class MergeRequestHandler:
     def __init__(self, webhook_data: dict, gitlab_token: str, gitlab_url: str):
         self.merge_request_iid = None
@@ -57,6 +95,8 @@ class MergeRequestHandler:
         self.event_type = None
         self.project_id = None
         self.action = None
+        # 变更的比较范围 (旧版本的提交, 新版本的提交)，获取变更后设置
+        self.diff_refs = None
         self.parse_event_type()
 
     def parse_event_type(self):
@@ -72,6 +112,7 @@ class MergeRequestHandler:
         self.project_id = merge_request.get('target_project_id')
         self.action = merge_request.get('action')
 
+    @tracing.traced('gitlab.fetch.merge_request_changes')
     def get_merge_request_changes(self) -> list:
         # 检查是否为 Merge Request Hook 事件
         if self.event_type != 'merge_request':
@@ -88,7 +129,8 @@ class MergeRequestHandler:
             headers = {
                 'Private-Token': self.gitlab_token
             }
-            response = requests.get(url, headers=headers, verify=False)
+            with metrics.track_latency(metrics.GIT_API_LATENCY, platform='gitlab', endpoint='merge_request_changes'):
+                response = requests.get(url, headers=headers, verify=False)
             logger.debug(
                 f"Get changes response from GitLab (attempt {attempt + 1}): {response.status_code}, {response.text}, URL: {url}")
 
@@ -96,6 +138,9 @@ class MergeRequestHandler:
             if response.status_code == 200:
                 changes = response.json().get('changes', [])
                 if changes:
+                    diff_refs = response.json().get('diff_refs') or {}
+                    if diff_refs.get('base_sha') and diff_refs.get('head_sha'):
+                        self.diff_refs = (diff_refs['base_sha'], diff_refs['head_sha'])
                     return changes
                 else:
                     logger.info(
@@ -108,6 +153,13 @@ class MergeRequestHandler:
         logger.warning(f"Max retries ({max_retries}) reached. Changes is still empty.")
         return []  # 达到最大重试次数后返回空列表
 
+    def get_blob_id(self, file_path: str, ref: str):
+        return get_blob_id(self.gitlab_url, self.gitlab_token, self.project_id, file_path, ref)
+
+    def get_file_content(self, file_path: str, ref: str) -> tuple:
+        return get_file_content(self.gitlab_url, self.gitlab_token, self.project_id, file_path, ref)
+
+    @tracing.traced('gitlab.fetch.merge_request_commits')
     def get_merge_request_commits(self) -> list:
         # 检查是否为 Merge Request Hook 事件
         if self.event_type != 'merge_request':
@@ -119,7 +171,8 @@ class MergeRequestHandler:
         headers = {
             'Private-Token': self.gitlab_token
         }
-        response = requests.get(url, headers=headers, verify=False)
+        with metrics.track_latency(metrics.GIT_API_LATENCY, platform='gitlab', endpoint='merge_request_commits'):
+            response = requests.get(url, headers=headers, verify=False)
         logger.debug(f"Get commits response from gitlab: {response.status_code}, {response.text}")
         # 检查请求是否成功
         if response.status_code == 200:
@@ -128,6 +181,7 @@ class MergeRequestHandler:
             logger.warn(f"Failed to get commits: {response.status_code}, {response.text}")
             return []
 
+    @tracing.traced('gitlab.note.add_merge_request_note')
     def add_merge_request_notes(self, review_result):
         url = urljoin(f"{self.gitlab_url}/",
                       f"api/v4/projects/{self.project_id}/merge_requests/{self.merge_request_iid}/notes")
@@ -138,7 +192,8 @@ class MergeRequestHandler:
         data = {
             'body': review_result
         }
-        response = requests.post(url, headers=headers, json=data, verify=False)
+        with metrics.track_latency(metrics.GIT_API_LATENCY, platform='gitlab', endpoint='merge_request_notes'):
+            response = requests.post(url, headers=headers, json=data, verify=False)
         logger.debug(f"Add notes to gitlab {url}: {response.status_code}, {response.text}")
         if response.status_code == 201:
             logger.info("Note successfully added to merge request.")
@@ -155,7 +210,10 @@ class PushHandler:
         self.event_type = None
         self.project_id = None
         self.branch_name = None
+        self.branch_created = False
         self.commit_list = []
+        # 变更的比较范围 (旧版本的提交, 新版本的提交)，获取变更后设置
+        self.diff_refs = None
         self.parse_event_type()
 
     def parse_event_type(self):
@@ -168,6 +226,7 @@ class PushHandler:
         # 提取 Push 事件的相关参数
         self.project_id = self.webhook_data.get('project', {}).get('id')
         self.branch_name = self.webhook_data.get('ref', '').replace('refs/heads/', '')
+        self.branch_created = self.webhook_data.get('before', '').startswith('0000000')
         self.commit_list = self.webhook_data.get('commits', [])
 
     def get_push_commits(self) -> list:
@@ -190,6 +249,7 @@ class PushHandler:
         logger.info(f"Collected {len(commit_details)} commits from push event.")
         return commit_details
 
+    @tracing.traced('gitlab.note.add_push_note')
     def add_push_notes(self, message: str):
         # 添加评论到 GitLab Push 请求的提交中（此处假设是在最后一次提交上添加注释）
         if not self.commit_list:
@@ -211,7 +271,8 @@ class PushHandler:
         data = {
             'note': message
         }
-        response = requests.post(url, headers=headers, json=data, verify=False)
+        with metrics.track_latency(metrics.GIT_API_LATENCY, platform='gitlab', endpoint='commit_comments'):
+            response = requests.post(url, headers=headers, json=data, verify=False)
         logger.debug(f"Add comment to commit {last_commit_id}: {response.status_code}, {response.text}")
         if response.status_code == 201:
             logger.info("Comment successfully added to push commit.")
@@ -226,7 +287,8 @@ class PushHandler:
         headers = {
             'Private-Token': self.gitlab_token
         }
-        response = requests.get(url, headers=headers, verify=False)
+        with metrics.track_latency(metrics.GIT_API_LATENCY, platform='gitlab', endpoint='repository_commits'):
+            response = requests.get(url, headers=headers, verify=False)
         logger.debug(
             f"Get commits response from GitLab for repository_commits: {response.status_code}, {response.text}, URL: {url}")
 
@@ -237,6 +299,12 @@ class PushHandler:
                 f"Failed to get commits for ref {ref_name}: {response.status_code}, {response.text}")
             return []
 
+    def get_blob_id(self, file_path: str, ref: str):
+        return get_blob_id(self.gitlab_url, self.gitlab_token, self.project_id, file_path, ref)
+
+    def get_file_content(self, file_path: str, ref: str) -> tuple:
+        return get_file_content(self.gitlab_url, self.gitlab_token, self.project_id, file_path, ref)
+
     def get_parent_commit_id(self, commit_id: str) -> str:
         commits = self.__repository_commits(ref_name=commit_id, pre_page=1, page=1)
         if commits and commits[0].get('parent_ids', []):
@@ -249,7 +317,8 @@ class PushHandler:
         headers = {
             'Private-Token': self.gitlab_token
         }
-        response = requests.get(url, headers=headers, verify=False)
+        with metrics.track_latency(metrics.GIT_API_LATENCY, platform='gitlab', endpoint='repository_compare'):
+            response = requests.get(url, headers=headers, verify=False)
         logger.debug(
             f"Get changes response from GitLab for repository_compare: {response.status_code}, {response.text}, URL: {url}")
 
@@ -260,7 +329,12 @@ class PushHandler:
                 f"Failed to get changes for repository_compare: {response.status_code}, {response.text}")
             return []
 
-    def get_push_changes(self) -> list:
+    @tracing.traced('gitlab.fetch.push_changes')
+    def get_push_changes(self, base: str = None) -> list:
+        """
+        获取 Push 的代码变更
+        :param base: 比较的起点，例如分支上最后一个已 Review 的提交。为空时使用 Push 事件中的 before
+        """
         # 检查是否为 Push 事件
         if self.event_type != 'push':
             logger.warn(f"Invalid event type: {self.event_type}. Only 'push' event is supported now.")
@@ -281,12 +355,15 @@ class PushHandler:
             if after.startswith('0000000'):
                 # 删除分支处理
                 return []
-            if before.startswith('0000000'):
+            if base:
+                before = base
+            elif before.startswith('0000000'):
                 # 创建分支处理
                 first_commit_id = self.commit_list[0].get('id')
                 parent_commit_id = self.get_parent_commit_id(first_commit_id)
                 if parent_commit_id:
                     before = parent_commit_id
+            self.diff_refs = (before, after)
             return self.repository_compare(before, after)
         else:
             return []
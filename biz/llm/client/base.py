@@ -1,13 +1,17 @@
+import time
 from abc import abstractmethod
 from typing import List, Dict, Optional
 
-from biz.llm.types import NotGiven, NOT_GIVEN
+from biz.llm.types import NotGiven, NOT_GIVEN, CompletionResult, CompletionUsage
+from biz.utils import metrics
 from biz.utils.log import logger
 
 
 class BaseClient:
     """ Base class for chat models client. """
 
+    provider: str = ""
+
     def ping(self) -> bool:
         """Ping the model to check connectivity."""
         try:
@@ -17,10 +21,59 @@ class BaseClient:
             logger.error("尝试连接LLM失败， {e}")
             return False
 
-    @abstractmethod
     def completions(self,
                     messages: List[Dict[str, str]],
                     model: Optional[str] | NotGiven = NOT_GIVEN,
                     ) -> str:
         """Chat with the model.
         """
+        return self.completions_with_usage(messages=messages, model=model).content
+
+    def completions_with_usage(self,
+                               messages: List[Dict[str, str]],
+                               model: Optional[str] | NotGiven = NOT_GIVEN,
+                               ) -> CompletionResult:
+        """Chat with the model, returning the content together with token usage and latency.
+        """
+        start = time.perf_counter()
+        try:
+            result = self.create_completion(messages=messages, model=model)
+        except Exception:
+            metrics.LLM_ERRORS.labels(provider=self.provider).inc()
+            raise
+        elapsed = time.perf_counter() - start
+        result.latency_ms = int(elapsed * 1000)
+        result.provider = result.provider or self.provider
+        result.calls = 1
+
+        metrics.LLM_LATENCY.labels(provider=result.provider, model=result.model).observe(elapsed)
+        for token_type, count in result.usage.model_dump().items():
+            if count:
+                metrics.LLM_TOKENS.labels(provider=result.provider, model=result.model,
+                                          type=token_type.removesuffix('_tokens')).inc(count)
+        return result
+
+    @abstractmethod
+    def create_completion(self,
+                          messages: List[Dict[str, str]],
+                          model: Optional[str] | NotGiven = NOT_GIVEN,
+                          ) -> CompletionResult:
+        """Provider specific chat call.
+        """
+
+    @staticmethod
+    def parse_openai_usage(usage) -> CompletionUsage:
+        """解析 OpenAI 兼容接口返回的 usage 字段"""
+        if not usage:
+            return CompletionUsage()
+        cached_tokens = 0
+        prompt_tokens_details = getattr(usage, "prompt_tokens_details", None)
+        if prompt_tokens_details is not None:
+            cached_tokens = getattr(prompt_tokens_details, "cached_tokens", 0) or 0
+        # DeepSeek 使用 prompt_cache_hit_tokens 表示命中缓存的 token 数
+        cached_tokens = cached_tokens or getattr(usage, "prompt_cache_hit_tokens", 0) or 0
+        return CompletionUsage(
+            prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+            cached_tokens=cached_tokens,
+        )
@@ -4,11 +4,14 @@ from typing import Dict, List, Optional
 from openai import OpenAI
 
 from biz.llm.client.base import BaseClient
-from biz.llm.types import NotGiven, NOT_GIVEN
+from biz.llm.types import NotGiven, NOT_GIVEN, CompletionResult
+from biz.utils import metrics
 from biz.utils.log import logger
 
 
 class DeepSeekClient(BaseClient):
+    provider = "deepseek"
+
     def __init__(self, api_key: str = None):
         self.api_key = api_key or os.getenv("DEEPSEEK_API_KEY")
         self.base_url = os.getenv("DEEPSEEK_API_BASE_URL", "https://api.deepseek.com")
@@ -18,10 +21,10 @@ class DeepSeekClient(BaseClient):
         self.client = OpenAI(api_key=self.api_key, base_url=self.base_url) # DeepSeek supports OpenAI API SDK
         self.default_model = os.getenv("DEEPSEEK_API_MODEL", "deepseek-chat")
 
-    def completions(self,
-                    messages: List[Dict[str, str]],
-                    model: Optional[str] | NotGiven = NOT_GIVEN,
-                    ) -> str:
+    def create_completion(self,
+                          messages: List[Dict[str, str]],
+                          model: Optional[str] | NotGiven = NOT_GIVEN,
+                          ) -> CompletionResult:
         try:
             model = model or self.default_model
             logger.debug(f"Sending request to DeepSeek API. Model: {model}, Messages: {messages}")
@@ -33,16 +36,23 @@ class DeepSeekClient(BaseClient):
             
             if not completion or not completion.choices:
                 logger.error("Empty response from DeepSeek API")
-                return "AI服务返回为空，请稍后重试"
-                
-            return completion.choices[0].message.content
+                metrics.LLM_ERRORS.labels(provider=self.provider).inc()
+                return CompletionResult(content="AI服务返回为空，请稍后重试", model=model)
+
+            return CompletionResult(
+                content=completion.choices[0].message.content,
+                model=completion.model or model,
+                usage=self.parse_openai_usage(completion.usage),
+            )
             
         except Exception as e:
             logger.error(f"DeepSeek API error: {str(e)}")
+            metrics.LLM_ERRORS.labels(provider=self.provider).inc()
             # 检查是否是认证错误
             if "401" in str(e):
-                return "DeepSeek API认证失败，请检查API密钥是否正确"
+                content = "DeepSeek API认证失败，请检查API密钥是否正确"
             elif "404" in str(e):
-                return "DeepSeek API接口未找到，请检查API地址是否正确"
+                content = "DeepSeek API接口未找到，请检查API地址是否正确"
             else:
-                return f"调用DeepSeek API时出错: {str(e)}"
+                content = f"调用DeepSeek API时出错: {str(e)}"
+            return CompletionResult(content=content, model=model)
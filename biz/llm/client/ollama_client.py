@@ -6,10 +6,12 @@ from ollama import ChatResponse
 from ollama import Client
 
 from biz.llm.client.base import BaseClient
-from biz.llm.types import NotGiven, NOT_GIVEN
+from biz.llm.types import NotGiven, NOT_GIVEN, CompletionResult, CompletionUsage
 
 
 class OllamaClient(BaseClient):
+    provider = "ollama"
+
     def __init__(self, api_key: str = None):
         self.default_model = self.default_model = os.getenv("OLLAMA_API_MODEL", "deepseek-r1-8k:14b")
         self.base_url = os.getenv("OLLAMA_API_BASE_URL", "http://127.0.0.1:11434")
@@ -36,10 +38,18 @@ class OllamaClient(BaseClient):
             return re.sub(r'<think>.*?</think>', '', content, flags=re.DOTALL).strip()
         return content
 
-    def completions(self,
-                    messages: List[Dict[str, str]],
-                    model: Optional[str] | NotGiven = NOT_GIVEN,
-                    ) -> str:
-        response: ChatResponse = self.client.chat(model or self.default_model, messages)
+    def create_completion(self,
+                          messages: List[Dict[str, str]],
+                          model: Optional[str] | NotGiven = NOT_GIVEN,
+                          ) -> CompletionResult:
+        model = model or self.default_model
+        response: ChatResponse = self.client.chat(model, messages)
         content = response['message']['content']
-        return self._extract_content(content)
+        return CompletionResult(
+            content=self._extract_content(content),
+            model=model,
+            usage=CompletionUsage(
+                prompt_tokens=getattr(response, 'prompt_eval_count', 0) or 0,
+                completion_tokens=getattr(response, 'eval_count', 0) or 0,
+            ),
+        )
@@ -4,10 +4,12 @@ from typing import Dict, List, Optional
 from openai import OpenAI
 
 from biz.llm.client.base import BaseClient
-from biz.llm.types import NotGiven, NOT_GIVEN
+from biz.llm.types import NotGiven, NOT_GIVEN, CompletionResult
 
 
 class QwenClient(BaseClient):
+    provider = "qwen"
+
     def __init__(self, api_key: str = None):
         self.api_key = api_key or os.getenv("QWEN_API_KEY")
         self.base_url = os.getenv("QWEN_API_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
@@ -17,13 +19,17 @@ class QwenClient(BaseClient):
         self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
         self.default_model = os.getenv("QWEN_API_MODEL", "qwen-coder-plus")
 
-    def completions(self,
-                    messages: List[Dict[str, str]],
-                    model: Optional[str] | NotGiven = NOT_GIVEN,
-                    ) -> str:
+    def create_completion(self,
+                          messages: List[Dict[str, str]],
+                          model: Optional[str] | NotGiven = NOT_GIVEN,
+                          ) -> CompletionResult:
         model = model or self.default_model
         completion = self.client.chat.completions.create(
             model=model,
             messages=messages,
         )
-        return completion.choices[0].message.content
+        return CompletionResult(
+            content=completion.choices[0].message.content,
+            model=completion.model or model,
+            usage=self.parse_openai_usage(completion.usage),
+        )
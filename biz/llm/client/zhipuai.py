@@ -4,10 +4,12 @@ from typing import Dict, List, Optional
 from zhipuai import ZhipuAI
 
 from biz.llm.client.base import BaseClient
-from biz.llm.types import NotGiven, NOT_GIVEN
+from biz.llm.types import NotGiven, NOT_GIVEN, CompletionResult
 
 
 class ZhipuAIClient(BaseClient):
+    provider = "zhipuai"
+
     def __init__(self, api_key: str = None):
         self.api_key = api_key or os.getenv("ZHIPUAI_API_KEY")
         if not self.api_key:
@@ -16,13 +18,17 @@ class ZhipuAIClient(BaseClient):
         self.client = ZhipuAI(api_key=api_key)
         self.default_model = os.getenv("ZHIPUAI_API_MODEL", "GLM-4-Flash")
 
-    def completions(self,
-                    messages: List[Dict[str, str]],
-                    model: Optional[str] | NotGiven = NOT_GIVEN,
-                    ) -> str:
+    def create_completion(self,
+                          messages: List[Dict[str, str]],
+                          model: Optional[str] | NotGiven = NOT_GIVEN,
+                          ) -> CompletionResult:
         model = model or self.default_model
         completion = self.client.chat.completions.create(
             model=model,
             messages=messages,
         )
-        return completion.choices[0].message.content
+        return CompletionResult(
+            content=completion.choices[0].message.content,
+            model=completion.model or model,
+            usage=self.parse_openai_usage(completion.usage),
+        )
@@ -58,3 +58,40 @@ class CompletionMessage(BaseModel):
     """
     message: dict
     role: str
+
+
+class CompletionUsage(BaseModel):
+    """一次（或多次累计的）LLM 调用的 token 用量"""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+
+    def __add__(self, other: "CompletionUsage") -> "CompletionUsage":
+        return CompletionUsage(
+            prompt_tokens=self.prompt_tokens + other.prompt_tokens,
+            completion_tokens=self.completion_tokens + other.completion_tokens,
+            cached_tokens=self.cached_tokens + other.cached_tokens,
+        )
+
+
+class CompletionResult(BaseModel):
+    """
+    LLM 调用的结构化结果，除返回内容外还包含用量与耗时
+    """
+    content: str = ""
+    provider: str = ""
+    model: str = ""
+    usage: CompletionUsage = CompletionUsage()
+    latency_ms: int = 0
+    calls: int = 0
+
+    def merge(self, other: "CompletionResult") -> "CompletionResult":
+        """累计多次调用的用量与耗时，content 取最后一次调用的结果"""
+        return CompletionResult(
+            content=other.content,
+            provider=other.provider or self.provider,
+            model=other.model or self.model,
+            usage=self.usage + other.usage,
+            latency_ms=self.latency_ms + other.latency_ms,
+            calls=self.calls + other.calls,
+        )
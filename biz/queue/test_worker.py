@@ -0,0 +1,62 @@
+import os
+import tempfile
+from unittest import TestCase, main
+from unittest.mock import MagicMock, patch
+
+from biz.queue import worker
+from biz.service import database
+from biz.service.push_review_tracker import PushReviewTracker
+
+PROJECT = 'gitlab_example_com/1'
+CHANGE = {'new_path': 'app.py', 'diff': '@@ -1,2 +1,2 @@\n-x = 1\n+x = 2\n'}
+
+
+class TestReviewPushChanges(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.tmp.name, 'data.db')
+        database.migrate(self.db_file)
+        self.tracker = PushReviewTracker(self.db_file)
+        for patcher in (patch.object(worker, 'push_review_tracker', self.tracker),
+                        patch.object(worker, 'PUSH_REVIEW_INCREMENTAL', True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        database.close_connections()
+        self.tmp.cleanup()
+
+    @staticmethod
+    def _handler(commit_ids: list, changes: list):
+        handler = MagicMock()
+        handler.commit_list = [{'id': commit_id, 'message': f'commit {commit_id}'} for commit_id in commit_ids]
+        handler.branch_name = 'main'
+        handler.branch_created = False
+        handler.get_push_changes.return_value = changes
+        return handler
+
+    def test_skip_when_commits_reviewed(self):
+        """提交均已 Review 过时不 Review、不提交评论"""
+        self.tracker.record(PROJECT, 'main', ['a'], [CHANGE])
+        handler = self._handler(['a'], [CHANGE])
+        self.assertIsNone(worker.review_push_changes(handler, PROJECT, lambda changes: changes))
+        handler.add_push_notes.assert_not_called()
+
+    def test_skip_when_all_diffs_reviewed(self):
+        """rebase 后新提交中的修改均已 Review 过时跳过，并记录新提交"""
+        self.tracker.record(PROJECT, 'main', ['a'], [CHANGE])
+        handler = self._handler(['b'], [CHANGE])
+        self.assertIsNone(worker.review_push_changes(handler, PROJECT, lambda changes: changes))
+        handler.add_push_notes.assert_not_called()
+        self.assertEqual(self.tracker.plan(PROJECT, 'main', ['b']), ([], 'b'))
+
+    def test_no_watched_files(self):
+        """关注的文件没有修改时仍然提交评论，与修改已 Review 过的情况区分"""
+        handler = self._handler(['a'], [])
+        review_result, score, _, _ = worker.review_push_changes(handler, PROJECT, lambda changes: changes)
+        self.assertEqual((review_result, score), ('关注的文件没有修改', 0))
+        handler.add_push_notes.assert_called_once()
+
+
+if __name__ == '__main__':
+    main()
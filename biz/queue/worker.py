@@ -3,14 +3,94 @@ import traceback
 from datetime import datetime
 
 from biz.entity.review_entity import MergeRequestReviewEntity, PushReviewEntity
-from biz.event.event_manager import event_manager
+from biz.event.event_manager import publish_event, MERGE_REQUEST_REVIEWED, PUSH_REVIEWED
 from biz.gitlab.webhook_handler import filter_changes, MergeRequestHandler, PushHandler
 from biz.github.webhook_handler import filter_changes as filter_github_changes, PullRequestHandler as GithubPullRequestHandler, PushHandler as GithubPushHandler
+from biz.service.blob_complexity_cache import blob_complexity_cache
+from biz.service.push_review_tracker import PUSH_REVIEW_INCREMENTAL, push_review_tracker
+from biz.service.review_file_cache import REVIEW_FILE_CACHE_ENABLED, review_file_cache
 from biz.utils.code_reviewer import CodeReviewer
+from biz.utils.complexity_analyzer import REVIEW_COMPLEXITY_ENABLED, analyze_changes, format_summary
 from biz.utils.im import notifier
 from biz.utils.log import logger
 
 
+def get_review_file_cache():
+    '''按文件缓存 Review 结果的存储，未开启时返回 None'''
+    return review_file_cache if REVIEW_FILE_CACHE_ENABLED else None
+
+
+def analyze_complexity(handler, changes: list) -> dict:
+    '''Review 前分析被修改函数的复杂度变化，未开启时返回空字典'''
+    if not REVIEW_COMPLEXITY_ENABLED:
+        return {}
+    return analyze_changes(changes, handler, cache=blob_complexity_cache)
+
+
+def get_push_changes_to_review(handler, project_key: str, filter_func) -> tuple:
+    '''
+    获取 Push 中需要 Review 的变更，开启增量 Review 时跳过分支上已 Review 过的提交与文件
+    :param handler: GitLab 或 GitHub 的 PushHandler
+    :param project_key: 项目的唯一标识
+    :param filter_func: 过滤变更的函数
+    :return: (变更, 需要 Review 的提交 SHA, 已 Review 过相同修改而跳过的文件数)
+    '''
+    commit_ids = [commit.get('id') for commit in handler.commit_list if commit.get('id')]
+    if not PUSH_REVIEW_INCREMENTAL:
+        return filter_func(handler.get_push_changes()), commit_ids, 0
+
+    new_commit_ids, base = push_review_tracker.plan(project_key, handler.branch_name, commit_ids,
+                                                    created=handler.branch_created)
+    if commit_ids and not new_commit_ids:
+        return [], [], 0
+    if base:
+        logger.info(f'分支 {handler.branch_name} 上已 Review 到提交 {base}，只 Review 之后的 {len(new_commit_ids)} 个提交')
+    changes = filter_func(handler.get_push_changes(base=base))
+    new_changes = push_review_tracker.filter_reviewed_changes(project_key, handler.branch_name, changes)
+    if len(new_changes) < len(changes):
+        logger.info(f'跳过 {len(changes) - len(new_changes)} 个已 Review 过相同修改的文件')
+    return new_changes, new_commit_ids, len(changes) - len(new_changes)
+
+
+def review_push_changes(handler, project_key: str, filter_func) -> tuple:
+    '''
+    Review Push 中新增的修改并将结果提交到提交的评论中
+    :return: (review 结果, 评分, LLM 用量, 复杂度变化摘要)，提交或修改均已 Review 过时返回 None，不记录日志也不发送通知
+    '''
+    changes, new_commit_ids, skipped = get_push_changes_to_review(handler, project_key, filter_func)
+    if handler.commit_list and not new_commit_ids:
+        logger.info(f'分支 {handler.branch_name} 上本次 Push 的提交均已 Review 过，跳过 Review。')
+        return None
+    commit_ids = [commit.get('id') for commit in handler.commit_list if commit.get('id')]
+    if not changes and skipped:
+        # rebase 或重新 Push 后，新提交中的修改都已 Review 过，与“关注的文件没有修改”不同，不再提交评论和记录 0 分
+        logger.info(f'分支 {handler.branch_name} 上本次 Push 的修改均已 Review 过，跳过 Review。')
+        push_review_tracker.record(project_key, handler.branch_name, commit_ids, [])
+        return None
+
+    logger.info('changes: %s', changes)
+    if not changes:
+        logger.info('未检测到PUSH代码的修改,修改文件可能不满足SUPPORTED_EXTENSIONS。')
+    review_result = "关注的文件没有修改"
+    score = 0
+    llm_usage = None
+    complexity = {}
+    if len(changes) > 0:
+        commits_text = ';'.join(commit.get('message', '').strip() for commit in handler.commit_list
+                                if commit.get('id') in new_commit_ids)
+        complexity = analyze_complexity(handler, changes)
+        reviewer = CodeReviewer()
+        review_result = reviewer.review_changes(changes, commits_text, cache=get_review_file_cache(),
+                                                complexity=complexity)
+        score = CodeReviewer.parse_review_score(review_text=review_result)
+        llm_usage = reviewer.completion
+    # 将review结果提交到提交的评论中
+    handler.add_push_notes(f'Auto Review Result: \n{review_result}')
+    # LLM 调用失败等解析不出评分的结果不算已 Review，下次 Push 时重新 Review 这些提交
+    if PUSH_REVIEW_INCREMENTAL and (not changes or score > 0):
+        push_review_tracker.record(project_key, handler.branch_name, commit_ids, changes)
+    return review_result, score, llm_usage, format_summary(complexity)
+
 
 def handle_push_event(webhook_data: dict, gitlab_token: str, gitlab_url: str, gitlab_url_slug: str):
     push_review_enabled = os.environ.get('PUSH_REVIEW_ENABLED', '0') == '1'
@@ -24,23 +104,15 @@ def handle_push_event(webhook_data: dict, gitlab_token: str, gitlab_url: str, gi
 
         review_result = None
         score = 0
+        llm_usage = None
+        complexity_summary = None
         if push_review_enabled:
-            # 获取PUSH的changes
-            changes = handler.get_push_changes()
-            logger.info('changes: %s', changes)
-            changes = filter_changes(changes)
-            if not changes:
-                logger.info('未检测到PUSH代码的修改,修改文件可能不满足SUPPORTED_EXTENSIONS。')
-            review_result = "关注的文件没有修改"
-
-            if len(changes) > 0:
-                commits_text = ';'.join(commit.get('message', '').strip() for commit in commits)
-                review_result = CodeReviewer().review_and_strip_code(str(changes), commits_text)
-                score = CodeReviewer.parse_review_score(review_text=review_result)
-            # 将review结果提交到Gitlab的 notes
-            handler.add_push_notes(f'Auto Review Result: \n{review_result}')
-
-        event_manager['push_reviewed'].send(PushReviewEntity(
+            reviewed = review_push_changes(handler, f'{gitlab_url_slug}/{handler.project_id}', filter_changes)
+            if reviewed is None:
+                return
+            review_result, score, llm_usage, complexity_summary = reviewed
+
+        publish_event(PUSH_REVIEWED, PushReviewEntity(
             project_name=webhook_data['project']['name'],
             author=webhook_data['user_username'],
             branch=webhook_data['project']['default_branch'],
@@ -49,6 +121,8 @@ def handle_push_event(webhook_data: dict, gitlab_token: str, gitlab_url: str, gi
             score=score,
             review_result=review_result,
             url_slug=gitlab_url_slug,
+            llm_usage=llm_usage,
+            complexity_summary=complexity_summary,
         ))
 
     except Exception as e:
@@ -92,13 +166,17 @@ def handle_merge_request_event(webhook_data: dict, gitlab_token: str, gitlab_url
 
         # review 代码
         commits_text = ';'.join(commit['title'] for commit in commits)
-        review_result = CodeReviewer().review_and_strip_code(str(changes), commits_text)
+        complexity = analyze_complexity(handler, changes)
+        reviewer = CodeReviewer()
+        review_result = reviewer.review_changes(changes, commits_text, cache=get_review_file_cache(),
+                                                complexity=complexity)
 
         # 将review结果提交到Gitlab的 notes
         handler.add_merge_request_notes(f'Auto Review Result: \n{review_result}')
 
         # dispatch merge_request_reviewed event
-        event_manager['merge_request_reviewed'].send(
+        publish_event(
+            MERGE_REQUEST_REVIEWED,
             MergeRequestReviewEntity(
                 project_name=webhook_data['project']['name'],
                 author=webhook_data['user']['username'],
@@ -110,6 +188,8 @@ def handle_merge_request_event(webhook_data: dict, gitlab_token: str, gitlab_url
                 url=webhook_data['object_attributes']['url'],
                 review_result=review_result,
                 url_slug=gitlab_url_slug,
+                llm_usage=reviewer.completion,
+                complexity_summary=format_summary(complexity),
             )
         )
 
@@ -130,23 +210,15 @@ def handle_github_push_event(webhook_data: dict, github_token: str, github_url:
 
         review_result = None
         score = 0
+        llm_usage = None
+        complexity_summary = None
         if push_review_enabled:
-            # 获取PUSH的changes
-            changes = handler.get_push_changes()
-            logger.info('changes: %s', changes)
-            changes = filter_github_changes(changes)
-            if not changes:
-                logger.info('未检测到PUSH代码的修改,修改文件可能不满足SUPPORTED_EXTENSIONS。')
-            review_result = "关注的文件没有修改"
-
-            if len(changes) > 0:
-                commits_text = ';'.join(commit.get('message', '').strip() for commit in commits)
-                review_result = CodeReviewer().review_and_strip_code(str(changes), commits_text)
-                score = CodeReviewer.parse_review_score(review_text=review_result)
-            # 将review结果提交到GitHub的 notes
-            handler.add_push_notes(f'Auto Review Result: \n{review_result}')
-
-        event_manager['push_reviewed'].send(PushReviewEntity(
+            reviewed = review_push_changes(handler, f'{github_url_slug}/{handler.repo_full_name}', filter_github_changes)
+            if reviewed is None:
+                return
+            review_result, score, llm_usage, complexity_summary = reviewed
+
+        publish_event(PUSH_REVIEWED, PushReviewEntity(
             project_name=webhook_data['repository']['name'],
             author=webhook_data['sender']['login'],
             branch=webhook_data['ref'].replace('refs/heads/', ''),
@@ -155,6 +227,8 @@ def handle_github_push_event(webhook_data: dict, github_token: str, github_url:
             score=score,
             review_result=review_result,
             url_slug=github_url_slug,
+            llm_usage=llm_usage,
+            complexity_summary=complexity_summary,
         ))
 
     except Exception as e:
@@ -198,13 +272,17 @@ def handle_github_pull_request_event(webhook_data: dict, github_token: str, gith
 
         # review 代码
         commits_text = ';'.join(commit['title'] for commit in commits)
-        review_result = CodeReviewer().review_and_strip_code(str(changes), commits_text)
+        complexity = analyze_complexity(handler, changes)
+        reviewer = CodeReviewer()
+        review_result = reviewer.review_changes(changes, commits_text, cache=get_review_file_cache(),
+                                                complexity=complexity)
 
         # 将review结果提交到GitHub的 notes
         handler.add_pull_request_notes(f'Auto Review Result: \n{review_result}')
 
         # dispatch pull_request_reviewed event
-        event_manager['merge_request_reviewed'].send(
+        publish_event(
+            MERGE_REQUEST_REVIEWED,
             MergeRequestReviewEntity(
                 project_name=webhook_data['repository']['name'],
                 author=webhook_data['pull_request']['user']['login'],
@@ -215,7 +293,9 @@ def handle_github_pull_request_event(webhook_data: dict, github_token: str, gith
                 score=CodeReviewer.parse_review_score(review_text=review_result),
                 url=webhook_data['pull_request']['html_url'],
                 review_result=review_result,
-                url_slug=github_url_slug
+                url_slug=github_url_slug,
+                llm_usage=reviewer.completion,
+                complexity_summary=format_summary(complexity),
             ))
 
     except Exception as e:
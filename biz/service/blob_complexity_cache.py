@@ -0,0 +1,42 @@
+import json
+import time
+
+from biz.service import database
+from biz.service.review_service import ReviewService
+
+
+class BlobComplexityCache:
+    """
+    按文件版本缓存 lizard 的函数分析结果，同一版本的文件只下载、分析一次。
+    键为 blob SHA，无法预先获取 blob SHA 时为 "<提交 SHA>:<文件路径>"
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+
+    def get_many(self, blob_shas: list) -> dict:
+        """
+        :return: {blob_sha: [函数]}，只包含已缓存的文件
+        """
+        if not blob_shas:
+            return {}
+        placeholders = ', '.join('?' * len(blob_shas))
+        conn = database.get_connection(self.db_file)
+        rows = conn.execute(f"SELECT blob_sha, functions FROM blob_complexity_cache WHERE blob_sha IN ({placeholders})",
+                            list(blob_shas))
+        return {blob_sha: [tuple(function) for function in json.loads(functions)] for blob_sha, functions in rows}
+
+    def put_many(self, results: dict):
+        """
+        :param results: {blob_sha: [函数]}
+        """
+        if not results:
+            return
+        now = int(time.time())
+        with database.transaction(self.db_file) as conn:
+            conn.executemany("INSERT OR REPLACE INTO blob_complexity_cache (blob_sha, functions, created_at) "
+                             "VALUES (?, ?, ?)",
+                             [(blob_sha, json.dumps(functions), now) for blob_sha, functions in results.items()])
+
+
+blob_complexity_cache = BlobComplexityCache(ReviewService.DB_FILE)
@@ -0,0 +1,375 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# 等待写锁的最长时间（毫秒），多个工作进程同时写入时由 SQLite 自动重试，而不是立即抛出 database is locked
+BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', 5000))
+
+# 连接建立后执行的 PRAGMA。WAL 模式下读写互不阻塞；synchronous=NORMAL 在 WAL 下仍能保证数据库不损坏，
+# 只是掉电时可能丢失最后几个事务
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=134217728",
+)
+
+_local = threading.local()
+
+
+def _connect(db_file: str) -> sqlite3.Connection:
+    directory = os.path.dirname(db_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # 事务由 transaction() 显式控制
+    conn = sqlite3.connect(db_file, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def get_connection(db_file: str) -> sqlite3.Connection:
+    """
+    获取当前线程、当前进程复用的数据库连接。
+    SQLite 连接不能跨线程使用，也不能在 fork 之后继续使用，因此按 (进程, 线程, 数据库文件) 缓存连接。
+    :param db_file: 数据库文件路径
+    """
+    pid = os.getpid()
+    if getattr(_local, 'pid', None) != pid:
+        # fork 出来的子进程不能沿用父进程的连接，直接丢弃，重新建立
+        _local.pid = pid
+        _local.connections = {}
+    conn = _local.connections.get(db_file)
+    if conn is None:
+        conn = _connect(db_file)
+        _local.connections[db_file] = conn
+    return conn
+
+
+def close_connections():
+    """关闭当前线程持有的所有连接"""
+    if getattr(_local, 'pid', None) != os.getpid():
+        return
+    for conn in _local.connections.values():
+        conn.close()
+    _local.connections = {}
+
+
+@contextmanager
+def transaction(db_file: str, immediate: bool = False):
+    """
+    在复用的连接上开启事务，正常结束时提交，出现异常时回滚
+    :param db_file: 数据库文件路径
+    :param immediate: 是否立即获取写锁（BEGIN IMMEDIATE），写事务使用可避免读锁升级为写锁时的死锁
+    """
+    conn = get_connection(db_file)
+    conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    else:
+        conn.execute("COMMIT")
+
+
+def _add_missing_columns(conn: sqlite3.Connection, table: str, columns: dict):
+    """为已存在的表补充新增的列（早期版本通过 ALTER TABLE 加过列的数据库中这些列可能已存在）"""
+    existing_columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for column, column_type in columns.items():
+        if column not in existing_columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+
+# LLM 调用用量与耗时相关的列，mr_review_log 与 push_review_log 共用
+LLM_USAGE_COLUMNS = {
+    "llm_provider": "TEXT",
+    "llm_model": "TEXT",
+    "prompt_tokens": "INTEGER DEFAULT 0",
+    "completion_tokens": "INTEGER DEFAULT 0",
+    "cached_tokens": "INTEGER DEFAULT 0",
+    "llm_latency_ms": "INTEGER DEFAULT 0",
+}
+
+
+def _migration_1(conn: sqlite3.Connection):
+    """初始表结构"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS mr_review_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project_name TEXT,
+            author TEXT,
+            source_branch TEXT,
+            target_branch TEXT,
+            updated_at INTEGER,
+            commit_messages TEXT,
+            score INTEGER,
+            url TEXT,
+            review_result TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS push_review_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project_name TEXT,
+            author TEXT,
+            branch TEXT,
+            updated_at INTEGER,
+            commit_messages TEXT,
+            score INTEGER,
+            review_result TEXT
+        )
+    ''')
+
+
+def _migration_2(conn: sqlite3.Connection):
+    """记录 LLM 调用的 token 用量与耗时"""
+    for table in ("mr_review_log", "push_review_log"):
+        _add_missing_columns(conn, table, LLM_USAGE_COLUMNS)
+
+
+def _migration_3(conn: sqlite3.Connection):
+    """按 get_*_review_logs 的过滤条件与排序方式建立索引"""
+    for table in ("mr_review_log", "push_review_log"):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_updated_at ON {table} (updated_at)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_project_updated_at ON {table} (project_name, updated_at)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_author_updated_at ON {table} (author, updated_at)")
+
+
+# 每日汇总表中的分数分布区间：(列名, 下限, 上限)，上下限为 None 表示不限
+SCORE_BUCKETS = (
+    ("score_lt_60", None, 60),
+    ("score_60_69", 60, 70),
+    ("score_70_79", 70, 80),
+    ("score_80_89", 80, 90),
+    ("score_ge_90", 90, None),
+)
+# 审核日志表与 review_daily_rollup.log_type 的对应关系
+ROLLUP_LOG_TYPES = {"mr_review_log": "mr", "push_review_log": "push"}
+
+
+def score_bucket_condition(score: str, lower, upper) -> str:
+    conditions = [f"{score} >= {lower}" if lower is not None else None,
+                  f"{score} < {upper}" if upper is not None else None]
+    return ' AND '.join(c for c in conditions if c)
+
+
+def _migration_4(conn: sqlite3.Connection):
+    """按 (日期, 项目, 人员) 汇总的审核次数、分数合计与分数分布，插入审核日志时由触发器增量更新"""
+    bucket_columns = ', '.join(f"{column} INTEGER NOT NULL DEFAULT 0" for column, _, _ in SCORE_BUCKETS)
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS review_daily_rollup (
+            log_type TEXT NOT NULL,
+            day TEXT NOT NULL,
+            project_name TEXT NOT NULL,
+            author TEXT NOT NULL,
+            review_count INTEGER NOT NULL DEFAULT 0,
+            score_count INTEGER NOT NULL DEFAULT 0,
+            score_sum REAL NOT NULL DEFAULT 0,
+            {bucket_columns},
+            PRIMARY KEY (log_type, day, project_name, author)
+        ) WITHOUT ROWID
+    ''')
+    columns = ', '.join(column for column, _, _ in SCORE_BUCKETS)
+    values = ', '.join(f"IFNULL({score_bucket_condition('NEW.score', lower, upper)}, 0)"
+                       for _, lower, upper in SCORE_BUCKETS)
+    updates = ', '.join(f"{column} = {column} + excluded.{column}" for column, _, _ in SCORE_BUCKETS)
+    for table, log_type in ROLLUP_LOG_TYPES.items():
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_rollup AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO review_daily_rollup (log_type, day, project_name, author, review_count, score_count,
+                                                 score_sum, {columns})
+                VALUES ('{log_type}', date(NEW.updated_at, 'unixepoch', 'localtime'), IFNULL(NEW.project_name, ''),
+                        IFNULL(NEW.author, ''), 1, NEW.score IS NOT NULL, IFNULL(NEW.score, 0), {values})
+                ON CONFLICT (log_type, day, project_name, author) DO UPDATE SET
+                    review_count = review_count + 1,
+                    score_count = score_count + excluded.score_count,
+                    score_sum = score_sum + excluded.score_sum,
+                    {updates};
+            END
+        ''')
+        rebuild_rollup(conn, table)
+
+
+def rebuild_rollup(conn: sqlite3.Connection, table: str) -> int:
+    """
+    根据审核日志重新计算汇总数据。只重算审核日志中存在的日期，其他日期的汇总数据保持不变
+    :param conn: 需在事务中调用
+    :param table: mr_review_log 或 push_review_log
+    :return: 重新计算的日期数
+    """
+    log_type = ROLLUP_LOG_TYPES[table]
+    day = "date(updated_at, 'unixepoch', 'localtime')"
+    days = [row[0] for row in conn.execute(f"SELECT DISTINCT {day} FROM {table}")]
+    conn.execute(f"DELETE FROM review_daily_rollup WHERE log_type = ? AND day IN (SELECT DISTINCT {day} FROM {table})",
+                 (log_type,))
+    columns = ', '.join(column for column, _, _ in SCORE_BUCKETS)
+    values = ', '.join(f"SUM(IFNULL({score_bucket_condition('score', lower, upper)}, 0))"
+                       for _, lower, upper in SCORE_BUCKETS)
+    conn.execute(f'''
+        INSERT INTO review_daily_rollup (log_type, day, project_name, author, review_count, score_count, score_sum,
+                                         {columns})
+        SELECT ?, {day}, IFNULL(project_name, ''), IFNULL(author, ''), COUNT(*), COUNT(score), IFNULL(SUM(score), 0),
+               {values}
+        FROM {table}
+        GROUP BY 2, 3, 4
+    ''', (log_type,))
+    return len(days)
+
+
+# 全文检索的列
+FTS_COLUMNS = ("review_result", "commit_messages")
+
+
+def _migration_5(conn: sqlite3.Connection):
+    """
+    Review 结果与提交信息的全文检索索引（FTS5 外部内容表，由触发器与审核日志保持同步）。
+    使用 trigram 分词以支持中文等没有空格分隔的文本，SQLite 版本不支持时退回 unicode61
+    """
+    columns = ', '.join(FTS_COLUMNS)
+    new_values = ', '.join(f"NEW.{column}" for column in FTS_COLUMNS)
+    old_values = ', '.join(f"OLD.{column}" for column in FTS_COLUMNS)
+    for table in ("mr_review_log", "push_review_log"):
+        fts_table = f"{table}_fts"
+        try:
+            conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+                         f"{columns}, content='{table}', content_rowid='id', tokenize='trigram')")
+        except sqlite3.OperationalError:
+            conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+                         f"{columns}, content='{table}', content_rowid='id')")
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO {fts_table} (rowid, {columns}) VALUES (NEW.id, {new_values});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table}
+            BEGIN
+                INSERT INTO {fts_table} ({fts_table}, rowid, {columns}) VALUES ('delete', OLD.id, {old_values});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE ON {table}
+            BEGIN
+                INSERT INTO {fts_table} ({fts_table}, rowid, {columns}) VALUES ('delete', OLD.id, {old_values});
+                INSERT INTO {fts_table} (rowid, {columns}) VALUES (NEW.id, {new_values});
+            END
+        ''')
+        # 为已有的审核日志建立索引
+        conn.execute(f"INSERT INTO {fts_table} ({fts_table}) VALUES ('rebuild')")
+
+
+def _migration_6(conn: sqlite3.Connection):
+    """IM 通知发件箱：工作进程写入，API 进程中的后台线程按 Webhook 限流发送并重试"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel TEXT NOT NULL,
+            webhook_url TEXT NOT NULL,
+            msg_type TEXT NOT NULL,
+            title TEXT,
+            content TEXT NOT NULL,
+            is_at_all INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at INTEGER NOT NULL,
+            next_attempt_at INTEGER NOT NULL,
+            sent_at INTEGER
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_notification_outbox_status_next_attempt_at "
+                 "ON notification_outbox (status, next_attempt_at)")
+
+
+def _migration_7(conn: sqlite3.Connection):
+    """增量 Push Review：记录每个项目、分支已 Review 过的提交与文件 diff 指纹"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS reviewed_push_commit (
+            project_key TEXT NOT NULL,
+            branch TEXT NOT NULL,
+            commit_sha TEXT NOT NULL,
+            reviewed_at INTEGER NOT NULL,
+            PRIMARY KEY (project_key, branch, commit_sha)
+        ) WITHOUT ROWID
+    ''')
+    # 新建分支时需要按项目查找其他分支上已 Review 过的提交
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reviewed_push_commit_project_sha "
+                 "ON reviewed_push_commit (project_key, commit_sha)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS reviewed_push_diff (
+            project_key TEXT NOT NULL,
+            branch TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            diff_hash TEXT NOT NULL,
+            reviewed_at INTEGER NOT NULL,
+            PRIMARY KEY (project_key, branch, file_path, diff_hash)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _migration_8(conn: sqlite3.Connection):
+    """按文件缓存的 Review 结果，同一文件修改出现在 Push、MR 或 cherry-pick 中时复用"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS review_file_cache (
+            diff_key TEXT NOT NULL,
+            prompt_version TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            review_result TEXT NOT NULL,
+            score INTEGER NOT NULL DEFAULT 0,
+            created_at INTEGER NOT NULL,
+            PRIMARY KEY (diff_key, prompt_version)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _migration_9(conn: sqlite3.Connection):
+    """Review 前的复杂度分析：按 blob SHA 缓存 lizard 的函数分析结果，审核日志中保存复杂度变化摘要"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS blob_complexity_cache (
+            blob_sha TEXT PRIMARY KEY,
+            functions TEXT NOT NULL,
+            created_at INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    for table in ("mr_review_log", "push_review_log"):
+        _add_missing_columns(conn, table, {"complexity_summary": "TEXT"})
+
+
+# 数据库结构版本迁移，版本号记录在 PRAGMA user_version 中。新增迁移时只能追加，不能修改已发布的迁移
+MIGRATIONS = [
+    (1, _migration_1),
+    (2, _migration_2),
+    (3, _migration_3),
+    (4, _migration_4),
+    (5, _migration_5),
+    (6, _migration_6),
+    (7, _migration_7),
+    (8, _migration_8),
+    (9, _migration_9),
+]
+
+
+def migrate(db_file: str) -> int:
+    """
+    将数据库升级到最新版本
+    :param db_file: 数据库文件路径
+    :return: 升级后的版本号
+    """
+    # BEGIN IMMEDIATE 保证多个进程同时启动时只有一个进程执行迁移
+    with transaction(db_file, immediate=True) as conn:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for target_version, migration in MIGRATIONS:
+            if target_version > version:
+                migration(conn)
+                conn.execute(f"PRAGMA user_version={target_version}")
+                version = target_version
+    # 建立索引后更新统计信息，便于查询优化器选择索引
+    get_connection(db_file).execute("PRAGMA optimize")
+    return version
@@ -0,0 +1,213 @@
+import os
+import time
+
+from biz.service import database
+from biz.utils.log import logger
+
+# 审核日志保留天数，超过的记录归档后从数据库中删除。0 表示不归档
+RETENTION_DAYS = int(os.getenv('REVIEW_LOG_RETENTION_DAYS', 0))
+# 归档文件目录：<ARCHIVE_DIR>/<table>/month=YYYYMM/data.parquet（zstd 压缩），每月一个文件
+ARCHIVE_DIR = os.getenv('REVIEW_LOG_ARCHIVE_DIR', 'data/archive')
+# 每批归档的记录数
+ARCHIVE_BATCH_SIZE = 2000
+# 已发送或最终失败的 IM 通知在发件箱中保留的天数
+OUTBOX_RETENTION_DAYS = 7
+# 增量 Push Review 记录的已 Review 提交与 diff 指纹的保留天数
+PUSH_REVIEW_HISTORY_DAYS = int(os.getenv('PUSH_REVIEW_HISTORY_DAYS', 90))
+# 按文件缓存的 Review 结果与复杂度分析结果的保留天数
+REVIEW_FILE_CACHE_DAYS = int(os.getenv('REVIEW_FILE_CACHE_DAYS', 30))
+
+
+class MaintenanceService:
+    """审核日志数据库的定期维护：归档过期记录、回收空间、更新统计信息"""
+
+    @staticmethod
+    def _database_size(db_file: str) -> int:
+        return sum(os.path.getsize(path) for path in (db_file, f'{db_file}-wal') if os.path.exists(path))
+
+    @staticmethod
+    def _write_parquet(table, path: str):
+        """写入临时文件并落盘后再替换，中途崩溃不会留下不完整的归档文件"""
+        import pyarrow.parquet as pq
+
+        tmp_path = os.path.join(os.path.dirname(path), f'.tmp-{os.getpid()}-{os.path.basename(path)}')
+        pq.write_table(table, tmp_path, compression='zstd')
+        with open(tmp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _write_archive(table: str, rows: list, columns: list, archive_dir: str) -> list:
+        """
+        按月写入本批记录的归档文件，文件名由 id 范围决定，重复归档同一批记录时会覆盖而不会重复
+        :return: 写入的月份目录
+        """
+        import pyarrow as pa
+
+        partitions = {}
+        for row in rows:
+            record = dict(zip(columns, row))
+            month = time.strftime('%Y%m', time.localtime(record['updated_at'] or 0))
+            partitions.setdefault(month, []).append(record)
+
+        partition_dirs = []
+        for month, records in partitions.items():
+            partition_dir = os.path.join(archive_dir, table, f'month={month}')
+            os.makedirs(partition_dir, exist_ok=True)
+            # 确保归档文件落盘后才删除数据库中的记录
+            MaintenanceService._write_parquet(
+                pa.Table.from_pylist(records),
+                os.path.join(partition_dir, f"part-{records[0]['id']}-{records[-1]['id']}.parquet"))
+            partition_dirs.append(partition_dir)
+        return partition_dirs
+
+    @staticmethod
+    def _merge_archive(partition_dir: str) -> int:
+        """
+        把月份目录中各批次的归档文件合并到该月的 data.parquet，按 id 去重排序后删除批次文件。
+        合并后的文件落盘后才删除批次文件，中途崩溃时下次合并会重新合并剩余的批次文件
+        :return: 合并后的记录数
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        parts = sorted(os.path.join(partition_dir, file_name) for file_name in os.listdir(partition_dir)
+                       if file_name.startswith('part-') and file_name.endswith('.parquet'))
+        merged_path = os.path.join(partition_dir, 'data.parquet')
+        if not parts:
+            return 0
+        sources = ([merged_path] if os.path.exists(merged_path) else []) + parts
+        merged = pa.concat_tables([pq.read_table(path) for path in sources], promote_options='default')
+        merged = merged.sort_by('id')
+        # 重复归档的记录 id 相同，保留第一条
+        ids = merged.column('id').to_pylist()
+        merged = merged.filter(pa.array([i == 0 or ids[i] != ids[i - 1] for i in range(len(ids))]))
+        MaintenanceService._write_parquet(merged, merged_path)
+        for path in parts:
+            os.remove(path)
+        return merged.num_rows
+
+    @staticmethod
+    def archive(db_file: str, retention_days: int, archive_dir: str = ARCHIVE_DIR) -> dict:
+        """
+        把早于 retention_days 天的审核日志写入归档文件后从数据库中删除。
+        按本地时间的整天归档，与每日汇总表（review_daily_rollup）的日期划分一致：一天的记录要么全部保留，要么全部归档，
+        rebuild_rollup 只重算仍有记录的日期，汇总数据不受影响，Dashboard 的历史统计仍然完整
+        :return: {表名: 归档的记录数}
+        """
+        cutoff_day = time.localtime(time.time() - retention_days * 86400)
+        cutoff = int(time.mktime((cutoff_day.tm_year, cutoff_day.tm_mon, cutoff_day.tm_mday, 0, 0, 0, 0, 0, -1)))
+        conn = database.get_connection(db_file)
+        archived = {}
+        partition_dirs = set()
+        for table in database.ROLLUP_LOG_TYPES:
+            columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+            archived[table] = 0
+            while True:
+                rows = conn.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE updated_at < ? "
+                                    f"ORDER BY id LIMIT ?", (cutoff, ARCHIVE_BATCH_SIZE)).fetchall()
+                if not rows:
+                    break
+                partition_dirs.update(MaintenanceService._write_archive(table, rows, columns, archive_dir))
+                ids = [row[columns.index('id')] for row in rows]
+                with database.transaction(db_file, immediate=True) as write_conn:
+                    write_conn.execute(f"DELETE FROM {table} WHERE id BETWEEN ? AND ? AND updated_at < ?",
+                                       (ids[0], ids[-1], cutoff))
+                archived[table] += len(rows)
+        for partition_dir in sorted(partition_dirs):
+            MaintenanceService._merge_archive(partition_dir)
+        return archived
+
+    @staticmethod
+    def purge_outbox(db_file: str, retention_days: int = OUTBOX_RETENTION_DAYS) -> int:
+        """
+        删除发件箱中已处理完毕的过期通知
+        :return: 删除的记录数
+        """
+        cutoff = int(time.time()) - retention_days * 86400
+        with database.transaction(db_file, immediate=True) as conn:
+            return conn.execute("DELETE FROM notification_outbox WHERE status != 'pending' AND created_at < ?",
+                                (cutoff,)).rowcount
+
+    @staticmethod
+    def purge_push_history(db_file: str, retention_days: int = PUSH_REVIEW_HISTORY_DAYS) -> int:
+        """
+        删除过期的已 Review 提交与 diff 指纹，分支长期没有 Push 时再次 Push 会重新完整 Review
+        :return: 删除的记录数
+        """
+        cutoff = int(time.time()) - retention_days * 86400
+        with database.transaction(db_file, immediate=True) as conn:
+            return (conn.execute("DELETE FROM reviewed_push_commit WHERE reviewed_at < ?", (cutoff,)).rowcount
+                    + conn.execute("DELETE FROM reviewed_push_diff WHERE reviewed_at < ?", (cutoff,)).rowcount)
+
+    @staticmethod
+    def purge_review_file_cache(db_file: str, retention_days: int = REVIEW_FILE_CACHE_DAYS) -> int:
+        """
+        删除过期的按文件缓存的 Review 结果与复杂度分析结果
+        :return: 删除的记录数
+        """
+        cutoff = int(time.time()) - retention_days * 86400
+        with database.transaction(db_file, immediate=True) as conn:
+            return (conn.execute("DELETE FROM review_file_cache WHERE created_at < ?", (cutoff,)).rowcount
+                    + conn.execute("DELETE FROM blob_complexity_cache WHERE created_at < ?", (cutoff,)).rowcount)
+
+    @staticmethod
+    def compact(db_file: str, full_vacuum: bool = False) -> int:
+        """
+        回收空闲页并更新统计信息
+        :param full_vacuum: 数据库尚未切换为增量回收模式时，是否切换并执行一次完整的 VACUUM。
+            完整的 VACUUM 会重写整个数据库并在执行期间阻塞所有写入，只在命令行（python -m biz.cmd.db maintain）中执行，
+            定时任务中跳过
+        :return: 回收的页数
+        """
+        conn = database.get_connection(db_file)
+        # 合并全文检索索引的 b-tree 段
+        for table in database.ROLLUP_LOG_TYPES:
+            conn.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('optimize')")
+        freelist_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            # 通过 execute 执行时只会释放一页，executescript 才会执行到结束
+            conn.executescript("PRAGMA incremental_vacuum;")
+        elif full_vacuum:
+            # 切换为增量回收模式，需要执行一次完整的 VACUUM 才能生效
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+        else:
+            logger.info("数据库尚未切换为增量回收模式，跳过空间回收，"
+                        "可在低峰期执行 python -m biz.cmd.db maintain 完成切换")
+        conn.execute("ANALYZE")
+        busy = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()[0]
+        if busy:
+            logger.warning("WAL 检查点未能完成，有其他连接正在读写数据库")
+        return freelist_before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+    @staticmethod
+    def run(db_file: str, retention_days: int = RETENTION_DAYS, archive_dir: str = ARCHIVE_DIR,
+            full_vacuum: bool = False) -> dict:
+        """
+        执行一次维护任务
+        :param retention_days: 审核日志保留天数，0 表示不归档
+        :param full_vacuum: 数据库尚未切换为增量回收模式时，是否切换并执行一次完整的 VACUUM
+        :return: 维护结果，包括各表归档的记录数、清理的通知数、Push Review 记录数与 Review 缓存数、回收的页数和字节数
+        """
+        start = time.time()
+        size_before = MaintenanceService._database_size(db_file)
+        archived = MaintenanceService.archive(db_file, retention_days, archive_dir) if retention_days > 0 else {}
+        purged_notifications = MaintenanceService.purge_outbox(db_file)
+        purged_push_history = MaintenanceService.purge_push_history(db_file)
+        purged_review_cache = MaintenanceService.purge_review_file_cache(db_file)
+        reclaimed_pages = MaintenanceService.compact(db_file, full_vacuum)
+        size_after = MaintenanceService._database_size(db_file)
+        report = {
+            'archived': archived,
+            'purged_notifications': purged_notifications,
+            'purged_push_history': purged_push_history,
+            'purged_review_cache': purged_review_cache,
+            'reclaimed_pages': reclaimed_pages,
+            'size_before': size_before,
+            'size_after': size_after,
+            'reclaimed_bytes': size_before - size_after,
+            'elapsed_seconds': round(time.time() - start, 2),
+        }
+        logger.info(f"数据库维护完成: {report}")
+        return report
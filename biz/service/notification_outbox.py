@@ -0,0 +1,234 @@
+import atexit
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from biz.service import database
+from biz.service.review_service import ReviewService
+from biz.utils.heartbeat import Heartbeat
+from biz.utils.im import notifier
+from biz.utils.im.splitter import max_message_bytes
+from biz.utils.log import logger
+
+# 是否通过发件箱异步发送 IM 通知。关闭后在调用方直接发送
+OUTBOX_ENABLED = os.getenv('NOTIFY_OUTBOX_ENABLED', '1') == '1'
+# 每个 Webhook 每分钟最多发送的消息数（钉钉、企业微信机器人均为 20 条/分钟）
+RATE_LIMIT = int(os.getenv('NOTIFY_RATE_LIMIT', 20))
+# 发送失败后的最大尝试次数，第 n 次失败后等待 RETRY_BACKOFF * 2^(n-1) 秒（最长 10 分钟）再重试
+MAX_ATTEMPTS = int(os.getenv('NOTIFY_MAX_ATTEMPTS', 5))
+RETRY_BACKOFF = 10
+# 发件箱的轮询间隔（秒）
+POLL_INTERVAL = 1
+# 发送线程每轮更新心跳文件，超过该时间（秒）未更新时认为没有进程在发送，调用方直接发送通知
+HEARTBEAT_TIMEOUT = 30
+# 汇总消息中各条消息之间的分隔
+DIGEST_SEPARATOR = '\n\n---\n\n'
+
+
+class TokenBucket:
+    """令牌桶：容量为每分钟的消息数，按固定速率补充"""
+
+    def __init__(self, rate_per_minute: int):
+        self.capacity = rate_per_minute
+        self.rate = rate_per_minute / 60
+        self.tokens = float(rate_per_minute)
+        self.updated_at = time.monotonic()
+
+    def available(self) -> int:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        return int(self.tokens)
+
+    def consume(self, count: int = 1):
+        self.tokens -= count
+
+
+class NotificationOutbox:
+    """
+    IM 通知发件箱。
+    工作进程只把消息写入 notification_outbox 表，不等待 IM 平台响应；API 进程中的后台线程按 Webhook 发送：
+    超过渠道长度限制的消息按切分后的每一部分分别写入，每条记录对应一次 Webhook 请求；
+    每个 Webhook 一个令牌桶限流，每次请求消耗一个令牌，令牌不足以逐条发送时，把积压的消息合并为一条汇总消息；
+    发送失败的消息按指数退避重试，超过 MAX_ATTEMPTS 次后标记为 failed。
+    发送线程通过心跳文件表明自己在运行，以 WSGI 服务器或只启动工作进程等方式部署时没有发送线程，调用方应直接发送。
+    """
+
+    def __init__(self, db_file: str, rate_limit: int = RATE_LIMIT, max_attempts: int = MAX_ATTEMPTS):
+        self.db_file = db_file
+        self.rate_limit = rate_limit
+        self.max_attempts = max_attempts
+        self.heartbeat = Heartbeat(os.path.join(os.path.dirname(db_file), 'notification_outbox.heartbeat'),
+                                   timeout=HEARTBEAT_TIMEOUT)
+        self._buckets = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._executor = None
+        self._dispatcher_pid = None
+
+    def enqueue(self, targets: list, content: str, msg_type: str = 'text', title: str = None,
+                is_at_all: bool = False) -> dict:
+        """
+        写入待发送的消息
+        :param targets: [(渠道, Webhook URL)]
+        :return: 写入结果 {渠道: {'status': 'queued', 'elapsed_ms': 0}}
+        """
+        now = int(time.time())
+        # 切分后的每一部分单独发送、单独重试，某一部分发送失败时不会重复发送其他部分
+        rows = [(channel, webhook_url, msg_type, chunk_title, chunk, int(is_at_all), now, now)
+                for channel, webhook_url in targets
+                for chunk, chunk_title in notifier.split_chunks(channel, content, msg_type=msg_type, title=title)]
+        with database.transaction(self.db_file) as conn:
+            conn.executemany(
+                "INSERT INTO notification_outbox (channel, webhook_url, msg_type, title, content, is_at_all, "
+                "created_at, next_attempt_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return {channel: {'status': 'queued', 'elapsed_ms': 0} for channel, _ in targets}
+
+    @staticmethod
+    def _take_digest(channel: str, rows: list) -> list:
+        """
+        从积压的消息中取出合并为一条汇总消息的部分，至少取一条。
+        汇总消息不超过渠道单条消息的长度限制，发送时不会再被切分为多次请求
+        """
+        max_bytes = max_message_bytes(channel, 'markdown')
+        batch, size = [], 0
+        for row in rows:
+            row_size = len(NotificationOutbox._digest_section(row).encode('utf-8')) + len(DIGEST_SEPARATOR)
+            if batch and size + row_size > max_bytes:
+                break
+            batch.append(row)
+            size += row_size
+        # 渠道还会为标题等预留空间，按渠道的切分方式确认汇总消息只有一部分
+        while len(batch) > 1 and len(notifier.split_chunks(channel, **NotificationOutbox._digest_message(batch))) > 1:
+            batch.pop()
+        return batch
+
+    def _plan(self, channel: str, rows: list, tokens: int) -> list:
+        """
+        根据可用令牌数决定本轮发送的批次，每个批次对应一次 Webhook 请求，消耗一个令牌
+        :return: [[row, ...], ...]，多条记录的批次合并为一条汇总消息发送
+        """
+        if tokens <= 0:
+            return []
+        if len(rows) <= tokens:
+            return [[row] for row in rows]
+        batches = [[row] for row in rows[:tokens - 1]]
+        batches.append(self._take_digest(channel, rows[tokens - 1:]))
+        return batches
+
+    @staticmethod
+    def _digest_section(row: dict) -> str:
+        return f"#### {row['title'] or '通知'}\n\n{row['content']}"
+
+    @staticmethod
+    def _digest_message(batch: list) -> dict:
+        return dict(content=DIGEST_SEPARATOR.join(NotificationOutbox._digest_section(row) for row in batch),
+                    msg_type='markdown', title=f'{len(batch)} 条通知汇总')
+
+    @staticmethod
+    def _build_message(batch: list) -> dict:
+        if len(batch) == 1:
+            row = batch[0]
+            return dict(content=row['content'], msg_type=row['msg_type'], title=row['title'],
+                        is_at_all=bool(row['is_at_all']))
+        return dict(**NotificationOutbox._digest_message(batch), is_at_all=any(row['is_at_all'] for row in batch))
+
+    def _deliver(self, channel: str, webhook_url: str, batches: list):
+        for batch in batches:
+            success = notifier.deliver(channel, webhook_url, **self._build_message(batch))
+            self._record_result(batch, success)
+
+    def _record_result(self, batch: list, success: bool):
+        now = int(time.time())
+        with database.transaction(self.db_file) as conn:
+            if success:
+                conn.executemany("UPDATE notification_outbox SET status = 'sent', attempts = attempts + 1, "
+                                 "sent_at = ?, last_error = NULL WHERE id = ?", [(now, row['id']) for row in batch])
+                return
+            for row in batch:
+                attempts = row['attempts'] + 1
+                if attempts >= self.max_attempts:
+                    logger.error(f"IM 通知发送失败且已达到最大重试次数: id={row['id']}, channel={row['channel']}")
+                    conn.execute("UPDATE notification_outbox SET status = 'failed', attempts = ?, "
+                                 "last_error = 'send failed' WHERE id = ?", (attempts, row['id']))
+                else:
+                    next_attempt_at = now + min(RETRY_BACKOFF * 2 ** (attempts - 1), 600)
+                    conn.execute("UPDATE notification_outbox SET attempts = ?, next_attempt_at = ?, "
+                                 "last_error = 'send failed' WHERE id = ?", (attempts, next_attempt_at, row['id']))
+
+    def dispatch(self) -> int:
+        """
+        发送一轮到期的消息，多个 Webhook 之间并发发送
+        :return: 本轮发送的消息条数（合并发送的消息按原始条数计）
+        """
+        conn = database.get_connection(self.db_file)
+        cursor = conn.execute("SELECT id, channel, webhook_url, msg_type, title, content, is_at_all, attempts "
+                              "FROM notification_outbox WHERE status = 'pending' AND next_attempt_at <= ? "
+                              "ORDER BY id LIMIT 1000", (int(time.time()),))
+        columns = [column[0] for column in cursor.description]
+        groups = defaultdict(list)
+        for values in cursor.fetchall():
+            row = dict(zip(columns, values))
+            groups[(row['channel'], row['webhook_url'])].append(row)
+
+        futures = []
+        count = 0
+        for (channel, webhook_url), rows in groups.items():
+            bucket = self._buckets.setdefault((channel, webhook_url), TokenBucket(self.rate_limit))
+            batches = self._plan(channel, rows, bucket.available())
+            if not batches:
+                continue
+            bucket.consume(len(batches))
+            count += sum(len(batch) for batch in batches)
+            if any(len(batch) > 1 for batch in batches):
+                logger.info(f"{channel} Webhook 达到发送频率限制，合并发送积压的 IM 通知: {webhook_url}")
+            if self._executor:
+                futures.append(self._executor.submit(self._deliver, channel, webhook_url, batches))
+            else:
+                self._deliver(channel, webhook_url, batches)
+        for future in futures:
+            future.result()
+        return count
+
+    def dispatcher_alive(self) -> bool:
+        """是否有进程中的发送线程在运行（心跳文件在 HEARTBEAT_TIMEOUT 秒内更新过）"""
+        return self.heartbeat.alive()
+
+    def _run(self):
+        while not self._stop_event.wait(POLL_INTERVAL):
+            try:
+                self.heartbeat.beat()
+            except OSError as e:
+                logger.error(f"更新 IM 通知发件箱心跳失败: {e}")
+            try:
+                self.dispatch()
+            except Exception as e:
+                logger.error(f"发送 IM 通知失败: {e}")
+
+    def start(self):
+        """在当前进程中启动后台发送线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._dispatcher_pid = os.getpid()
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='notification-outbox')
+        self._stop_event.clear()
+        self.heartbeat.beat()
+        self._thread = threading.Thread(target=self._run, name='notification-outbox', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        # fork 出的子进程继承了 atexit 注册，但后台线程只在启动它的进程中存在
+        if os.getpid() != self._dispatcher_pid:
+            return
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._executor.shutdown(wait=True)
+        # 停止后新的通知不再写入发件箱，未发送的消息在下次启动时继续发送
+        self.heartbeat.clear()
+
+
+notification_outbox = NotificationOutbox(ReviewService.DB_FILE)
@@ -0,0 +1,92 @@
+import hashlib
+import os
+import re
+import time
+
+from biz.service import database
+from biz.service.review_service import ReviewService
+
+# 是否只 Review 分支上尚未 Review 过的提交与文件
+PUSH_REVIEW_INCREMENTAL = os.getenv('PUSH_REVIEW_INCREMENTAL', '1') == '1'
+
+# diff 中的 hunk 头，rebase 后行号会变化，计算指纹时忽略
+HUNK_HEADER_PATTERN = re.compile(r'^@@ [^@]* @@', re.MULTILINE)
+
+
+def diff_fingerprint(diff: str) -> str:
+    """文件 diff 的指纹，忽略 hunk 头中的行号，rebase 或 cherry-pick 后内容相同的修改指纹相同"""
+    return hashlib.sha1(HUNK_HEADER_PATTERN.sub('@@', diff or '').encode('utf-8')).hexdigest()
+
+
+class PushReviewTracker:
+    """
+    记录每个项目、分支已 Review 过的提交 SHA 与文件 diff 指纹，Push 时只 Review 新增的部分：
+      - Push 的提交中开头一段已 Review 过时（重复 Push、force push 保留了部分提交），从最后一个已 Review 的提交开始比较；
+      - 新建分支时，项目中任意分支上已 Review 过的提交都视为已 Review；
+      - 比较得到的文件 diff 与该分支上已 Review 过的 diff 相同时（如 rebase 后重新 Push）跳过该文件。
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+
+    def get_reviewed_commits(self, project_key: str, branch: str, commit_ids: list,
+                             include_other_branches: bool = False) -> set:
+        """
+        :param include_other_branches: 是否包含项目中其他分支上已 Review 过的提交
+        :return: commit_ids 中已 Review 过的提交
+        """
+        if not commit_ids:
+            return set()
+        placeholders = ', '.join('?' * len(commit_ids))
+        query = f"SELECT commit_sha FROM reviewed_push_commit WHERE project_key = ? AND commit_sha IN ({placeholders})"
+        params = [project_key, *commit_ids]
+        if not include_other_branches:
+            query += " AND branch = ?"
+            params.append(branch)
+        conn = database.get_connection(self.db_file)
+        return {row[0] for row in conn.execute(query, params)}
+
+    def plan(self, project_key: str, branch: str, commit_ids: list, created: bool = False) -> tuple:
+        """
+        计算本次 Push 需要 Review 的提交
+        :param commit_ids: Push 中的提交 SHA，按提交顺序排列
+        :param created: 是否为新建分支
+        :return: (需要 Review 的提交, 比较的起点)。起点为 None 时使用 Push 事件中的 before
+        """
+        reviewed = self.get_reviewed_commits(project_key, branch, commit_ids, include_other_branches=created)
+        new_commit_ids = [commit_id for commit_id in commit_ids if commit_id not in reviewed]
+        base = None
+        for commit_id in commit_ids:
+            if commit_id not in reviewed:
+                break
+            base = commit_id
+        return new_commit_ids, base
+
+    def filter_reviewed_changes(self, project_key: str, branch: str, changes: list) -> list:
+        """去掉该分支上已 Review 过相同 diff 的文件"""
+        if not changes:
+            return changes
+        fingerprints = [(change['new_path'], diff_fingerprint(change.get('diff'))) for change in changes]
+        conn = database.get_connection(self.db_file)
+        reviewed = set()
+        for file_path, diff_hash in fingerprints:
+            if conn.execute("SELECT 1 FROM reviewed_push_diff WHERE project_key = ? AND branch = ? "
+                            "AND file_path = ? AND diff_hash = ?",
+                            (project_key, branch, file_path, diff_hash)).fetchone():
+                reviewed.add((file_path, diff_hash))
+        return [change for change, fingerprint in zip(changes, fingerprints) if fingerprint not in reviewed]
+
+    def record(self, project_key: str, branch: str, commit_ids: list, changes: list):
+        """记录本次 Review 过的提交与文件 diff"""
+        now = int(time.time())
+        with database.transaction(self.db_file) as conn:
+            conn.executemany("INSERT OR REPLACE INTO reviewed_push_commit (project_key, branch, commit_sha, "
+                             "reviewed_at) VALUES (?, ?, ?, ?)",
+                             [(project_key, branch, commit_id, now) for commit_id in commit_ids])
+            conn.executemany("INSERT OR REPLACE INTO reviewed_push_diff (project_key, branch, file_path, diff_hash, "
+                             "reviewed_at) VALUES (?, ?, ?, ?, ?)",
+                             [(project_key, branch, change['new_path'], diff_fingerprint(change.get('diff')), now)
+                              for change in changes])
+
+
+push_review_tracker = PushReviewTracker(ReviewService.DB_FILE)
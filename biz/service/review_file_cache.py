@@ -0,0 +1,46 @@
+import hashlib
+import os
+import time
+
+from biz.service import database
+from biz.service.review_service import ReviewService
+
+# 是否按文件缓存 Review 结果。关闭后每次 Review 把所有文件的修改合并为一次 LLM 调用
+REVIEW_FILE_CACHE_ENABLED = os.getenv('REVIEW_FILE_CACHE_ENABLED', '1') == '1'
+
+
+class ReviewFileCache:
+    """按 (文件修改, 提示词版本) 缓存的单文件 Review 结果，提示词模板或 Review 风格变化后自动失效"""
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+
+    @staticmethod
+    def key(change: dict) -> str:
+        """
+        文件修改的缓存键。GitLab 返回的 diff 中没有 blob SHA，而同一对新旧 blob 生成的 diff 相同，
+        因此用文件路径与 diff 内容计算
+        """
+        return hashlib.sha1(f"{change.get('new_path', '')}\0{change.get('diff', '')}".encode('utf-8')).hexdigest()
+
+    def get_many(self, diff_keys: list, prompt_version: str) -> dict:
+        """
+        :return: {diff_key: (review_result, score)}，只包含已缓存的文件
+        """
+        if not diff_keys:
+            return {}
+        placeholders = ', '.join('?' * len(diff_keys))
+        conn = database.get_connection(self.db_file)
+        rows = conn.execute(f"SELECT diff_key, review_result, score FROM review_file_cache "
+                            f"WHERE prompt_version = ? AND diff_key IN ({placeholders})",
+                            [prompt_version, *diff_keys])
+        return {diff_key: (review_result, score) for diff_key, review_result, score in rows}
+
+    def put(self, diff_key: str, prompt_version: str, file_path: str, review_result: str, score: int):
+        with database.transaction(self.db_file) as conn:
+            conn.execute("INSERT OR REPLACE INTO review_file_cache (diff_key, prompt_version, file_path, "
+                         "review_result, score, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                         (diff_key, prompt_version, file_path, review_result, score, int(time.time())))
+
+
+review_file_cache = ReviewFileCache(ReviewService.DB_FILE)
@@ -0,0 +1,123 @@
+import base64
+import json
+
+import pandas as pd
+
+from biz.service import database
+from biz.service.review_log_writer import ReviewLogWriter, WRITE_BEHIND_ENABLED
+from biz.utils import metrics
+
+
+def build_filters(authors: list = None, project_names: list = None, updated_at_gte: int = None,
+                  updated_at_lte: int = None, alias: str = None):
+    """
+    生成 WHERE 子句及参数
+    :param alias: 多表查询时审核日志表的别名
+    :return: (where_sql, params)
+    """
+    prefix = f"{alias}." if alias else ""
+    query = " WHERE 1=1"
+    params = []
+
+    if authors:
+        placeholders = ','.join(['?'] * len(authors))
+        query += f" AND {prefix}author IN ({placeholders})"
+        params.extend(authors)
+
+    if project_names:
+        placeholders = ','.join(['?'] * len(project_names))
+        query += f" AND {prefix}project_name IN ({placeholders})"
+        params.extend(project_names)
+
+    if updated_at_gte is not None:
+        query += f" AND {prefix}updated_at >= ?"
+        params.append(updated_at_gte)
+
+    if updated_at_lte is not None:
+        query += f" AND {prefix}updated_at <= ?"
+        params.append(updated_at_lte)
+    return query, params
+
+
+def encode_cursor(sort_value, review_id: int) -> str:
+    """把上一页最后一条记录的 (排序值, id) 编码为分页游标"""
+    return base64.urlsafe_b64encode(json.dumps([sort_value, review_id]).encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        sort_value, review_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return sort_value, int(review_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+class ReviewLogStore:
+    """Review 日志的写入与查询。Dashboard 的统计查询使用每日汇总表（review_daily_rollup），不读取明细"""
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self.writer = ReviewLogWriter(db_file)
+
+    def insert(self, table: str, columns: tuple, values: tuple):
+        """
+        写入一条 Review 日志
+        :param table: mr_review_log 或 push_review_log
+        :param columns: 列名
+        :param values: 与 columns 对应的值
+        """
+        # 开启批量写入且合并线程在运行时先追加到日志文件，由后台线程合并写入
+        if WRITE_BEHIND_ENABLED and self.writer.collector_alive():
+            self.writer.enqueue(table, columns, values)
+            return
+        placeholders = ','.join(['?'] * len(columns))
+        with metrics.track_latency(metrics.DB_WRITE_LATENCY, table=table), \
+                database.transaction(self.db_file, immediate=True) as conn:
+            conn.execute(f"INSERT INTO {table} ({','.join(columns)}) VALUES ({placeholders})", values)
+
+    def query_logs(self, table: str, columns: tuple, **filters) -> pd.DataFrame:
+        """
+        查询 Review 日志明细，按 updated_at 降序
+        :param filters: authors、project_names、updated_at_gte、updated_at_lte
+        """
+        where, params = build_filters(**filters)
+        query = f"SELECT {', '.join(columns)} FROM {table}{where} ORDER BY updated_at DESC"
+        return pd.read_sql_query(sql=query, con=database.get_connection(self.db_file), params=params)
+
+    def query_page(self, table: str, columns: tuple, sort_by: str = 'updated_at', descending: bool = True,
+                   limit: int = 50, cursor: str = None, **filters):
+        """
+        基于游标（排序值, id）分页查询 Review 日志，每页的查询开销与翻到第几页无关
+        :param sort_by: 排序列
+        :param descending: 是否降序
+        :param limit: 每页条数
+        :param cursor: 上一页返回的 next_cursor，为 None 时查询第一页
+        :return: (DataFrame, next_cursor)，没有下一页时 next_cursor 为 None
+        """
+        where, params = build_filters(**filters)
+        direction, operator = ('DESC', '<') if descending else ('ASC', '>')
+        if cursor:
+            sort_value, review_id = decode_cursor(cursor)
+            # 行值比较，可以直接利用 (sort_by, id) 上的索引定位到上一页结束的位置
+            where += f" AND ({sort_by}, id) {operator} (?, ?)"
+            params.extend([sort_value, review_id])
+        # 游标需要 id 与排序列，未查询时额外查出来再去掉
+        select_columns = list(columns) + [c for c in (sort_by, 'id') if c not in columns]
+        query = (f"SELECT {', '.join(select_columns)} FROM {table}{where} "
+                 f"ORDER BY {sort_by} {direction}, id {direction} LIMIT ?")
+        # 多查一条用于判断是否还有下一页
+        df = pd.read_sql_query(sql=query, con=database.get_connection(self.db_file), params=params + [limit + 1])
+        next_cursor = None
+        if len(df) > limit:
+            df = df.iloc[:limit]
+            sort_value = df[sort_by].iloc[-1]
+            # numpy 标量转换为 Python 类型后才能序列化
+            next_cursor = encode_cursor(sort_value.item() if hasattr(sort_value, 'item') else sort_value,
+                                        int(df['id'].iloc[-1]))
+        return df[list(columns)], next_cursor
+
+    def fetch_by_ids(self, table: str, ids: list, columns: tuple) -> pd.DataFrame:
+        """按 id 查询 Review 日志，用于按需加载 Review 结果等大文本"""
+        placeholders = ','.join(['?'] * len(ids))
+        query = f"SELECT {', '.join(columns)} FROM {table} WHERE id IN ({placeholders})"
+        return pd.read_sql_query(sql=query, con=database.get_connection(self.db_file), params=list(ids))
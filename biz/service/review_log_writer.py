@@ -0,0 +1,248 @@
+import atexit
+import json
+import os
+import socket
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from biz.service import database
+from biz.utils import metrics
+from biz.utils.heartbeat import Heartbeat
+from biz.utils.log import logger
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# 是否启用批量写入。API 进程中的合并线程未运行时（如以 WSGI 服务器或只启动工作进程的方式部署）仍直接写入数据库
+WRITE_BEHIND_ENABLED = os.getenv('REVIEW_LOG_WRITE_BEHIND', '1') == '1'
+# 日志文件目录：工作进程追加写入 journal.jsonl，合并时封存为按时间命名的 .jsonl 文件
+SPOOL_DIR = os.getenv('REVIEW_LOG_SPOOL_DIR', 'data/review_log_spool')
+# 攒够多少条待写入的记录后立即写入
+BATCH_SIZE = int(os.getenv('REVIEW_LOG_BATCH_SIZE', 50))
+# 最长多久写入一次（秒）。每次写入前把日志文件 fsync 到磁盘，掉电时最多丢失这段时间内追加的记录
+FLUSH_INTERVAL = float(os.getenv('REVIEW_LOG_FLUSH_INTERVAL', 2))
+# 已认领但超过该时间（秒）仍未删除的文件视为合并进程崩溃时遗留，重新合并
+STALE_CLAIM_SECONDS = 300
+
+JOURNAL_FILE = 'journal.jsonl'
+SPOOL_EXT = '.jsonl'
+CLAIMED_EXT = '.claimed'
+
+
+class ReviewLogWriter:
+    """
+    Review 日志的批量写入器。
+    工作进程（async 模式下每个任务 fork 一个进程，rq 的 work-horse 同理，可能在其他容器中）不占用数据库写锁，
+    持有文件锁把记录追加到同一个日志文件（journal.jsonl），不 fsync、不创建新文件；
+    API 进程中的后台线程每隔 flush_interval 秒（或攒够 batch_size 条记录时）持有文件锁把日志文件重命名封存，
+    fsync 文件与目录后认领，用一个 synchronous=FULL 的事务 executemany 写入数据库，再删除文件。
+    一次 fsync 覆盖所有进程在这段时间内追加的记录；写入数据库与删除已认领文件之间崩溃时，
+    这批记录会在 STALE_CLAIM_SECONDS 后被重复写入一次（至少一次语义）。
+    """
+
+    def __init__(self, db_file: str, spool_dir: str = SPOOL_DIR, batch_size: int = BATCH_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL):
+        self.db_file = db_file
+        self.spool_dir = spool_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.heartbeat = Heartbeat(os.path.join(spool_dir, 'collector.heartbeat'),
+                                   timeout=max(flush_interval * 5, 30))
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._collector_pid = None
+        # fork 时后台线程可能正持有锁，子进程需要重新创建
+        os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self):
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _journal_lock(self):
+        """追加记录与封存日志文件互斥，避免封存后仍有进程写入已重命名的文件"""
+        os.makedirs(self.spool_dir, exist_ok=True)
+        with open(os.path.join(self.spool_dir, '.lock'), 'a') as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def collector_alive(self) -> bool:
+        """API 进程中的合并线程是否在运行，未运行时写入的记录不会被合并"""
+        return self.heartbeat.alive()
+
+    def enqueue(self, table: str, columns: tuple, values: tuple):
+        """
+        追加一条待合并的记录
+        :param table: 表名
+        :param columns: 列名
+        :param values: 与 columns 对应的值
+        """
+        line = json.dumps({'table': table, 'columns': list(columns), 'values': list(values)},
+                          ensure_ascii=False) + '\n'
+        with self._journal_lock(), open(os.path.join(self.spool_dir, JOURNAL_FILE), 'a', encoding='utf-8') as f:
+            f.write(line)
+
+    def _fsync_dir(self):
+        if not hasattr(os, 'O_DIRECTORY'):
+            return
+        fd = os.open(self.spool_dir, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _seal_journal(self):
+        """把日志文件重命名封存为按时间命名的文件，fsync 后再合并，之后追加的记录写入新的日志文件"""
+        journal_path = os.path.join(self.spool_dir, JOURNAL_FILE)
+        with self._journal_lock():
+            if not os.path.exists(journal_path) or os.path.getsize(journal_path) == 0:
+                return
+            # 以时间开头，合并时按写入的先后顺序；主机名与进程号区分不同容器中的合并进程
+            sealed_path = os.path.join(self.spool_dir,
+                                       f'{time.time_ns()}-{socket.gethostname()}-{os.getpid()}{SPOOL_EXT}')
+            os.rename(journal_path, sealed_path)
+        with open(sealed_path, 'rb') as f:
+            os.fsync(f.fileno())
+        self._fsync_dir()
+
+    def _pending_count(self) -> int:
+        """日志文件中待合并的记录数"""
+        try:
+            with open(os.path.join(self.spool_dir, JOURNAL_FILE), 'rb') as f:
+                return sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(65536), b''))
+        except FileNotFoundError:
+            return 0
+
+    def _ready_files(self) -> list:
+        """已封存、等待合并的日志文件，按封存的先后排序"""
+        if not os.path.isdir(self.spool_dir):
+            return []
+        return sorted(os.path.join(self.spool_dir, file_name) for file_name in os.listdir(self.spool_dir)
+                      if file_name.endswith(SPOOL_EXT) and file_name != JOURNAL_FILE)
+
+    def _recover_stale_claims(self):
+        """把合并进程崩溃时遗留的已认领文件恢复为待合并状态"""
+        if not os.path.isdir(self.spool_dir):
+            return
+        deadline = time.time() - STALE_CLAIM_SECONDS
+        for file_name in os.listdir(self.spool_dir):
+            if not file_name.endswith(CLAIMED_EXT):
+                continue
+            path = os.path.join(self.spool_dir, file_name)
+            try:
+                if os.path.getmtime(path) < deadline:
+                    os.rename(path, path[:-len(CLAIMED_EXT)] + SPOOL_EXT)
+            except FileNotFoundError:
+                # 已被其他合并进程恢复
+                continue
+
+    @staticmethod
+    def _claim(path: str):
+        """
+        重命名为 .claimed 认领文件，rename 是原子操作，同一个文件只会被一个合并进程认领
+        :return: 认领后的路径，已被其他进程认领时返回 None
+        """
+        claimed_path = path[:-len(SPOOL_EXT)] + CLAIMED_EXT
+        try:
+            os.rename(path, claimed_path)
+        except FileNotFoundError:
+            return None
+        # rename 不改变修改时间，更新后用于判断认领是否已过期
+        os.utime(claimed_path)
+        return claimed_path
+
+    @staticmethod
+    def _read_rows(path: str, batches: dict) -> int:
+        count = 0
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    # 磁盘写满等情况下文件内容可能不完整
+                    logger.warning(f"忽略无法解析的 Review 日志记录: {path}")
+                    continue
+                batches[(row['table'], tuple(row['columns']))].append(tuple(row['values']))
+                count += 1
+        return count
+
+    def flush(self) -> int:
+        """
+        把日志文件中的记录写入数据库
+        :return: 写入的记录数
+        """
+        with self._lock:
+            self._recover_stale_claims()
+            self._seal_journal()
+            files = [claimed for claimed in map(self._claim, self._ready_files()) if claimed]
+            if not files:
+                return 0
+            batches = defaultdict(list)
+            try:
+                count = sum(self._read_rows(path, batches) for path in files)
+                if count:
+                    conn = database.get_connection(self.db_file)
+                    # 写入后会删除日志文件，这个事务需要在提交时落盘（WAL 模式下 NORMAL 只在检查点时 fsync）
+                    conn.execute("PRAGMA synchronous=FULL")
+                    try:
+                        with database.transaction(self.db_file, immediate=True) as conn:
+                            for (table, columns), rows in batches.items():
+                                with metrics.track_latency(metrics.DB_WRITE_LATENCY, table=table):
+                                    placeholders = ','.join(['?'] * len(columns))
+                                    conn.executemany(
+                                        f"INSERT INTO {table} ({','.join(columns)}) VALUES ({placeholders})", rows)
+                    finally:
+                        conn.execute("PRAGMA synchronous=NORMAL")
+            except Exception:
+                # 写入失败时放回待合并状态，下次重试
+                for path in files:
+                    os.rename(path, path[:-len(CLAIMED_EXT)] + SPOOL_EXT)
+                raise
+            for path in files:
+                os.remove(path)
+            return count
+
+    def _run(self):
+        last_flush = time.monotonic()
+        # 按固定的间隔检查，攒够 batch_size 条记录或距上次写入超过 flush_interval 时写入
+        poll_interval = min(self.flush_interval, 0.5)
+        while not self._stop_event.wait(poll_interval):
+            try:
+                self.heartbeat.beat()
+                if time.monotonic() - last_flush < self.flush_interval and self._pending_count() < self.batch_size:
+                    continue
+                self.flush()
+            except Exception as e:
+                logger.error(f"批量写入 Review 日志失败: {e}")
+            last_flush = time.monotonic()
+
+    def start(self):
+        """在当前进程中启动后台合并线程，退出时写入剩余的记录"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._collector_pid = os.getpid()
+        self._stop_event.clear()
+        self.heartbeat.beat()
+        self._thread = threading.Thread(target=self._run, name='review-log-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        # fork 出的子进程继承了 atexit 注册，但后台线程只在启动它的进程中存在
+        if os.getpid() != self._collector_pid:
+            return
+        self._stop_event.set()
+        # 先停止心跳，之后写入的记录直接写入数据库
+        self.heartbeat.clear()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.flush()
@@ -1,166 +1,314 @@
 import sqlite3
+import time
 
 import pandas as pd
 
 from biz.entity.review_entity import MergeRequestReviewEntity, PushReviewEntity
+from biz.service import database
+from biz.service.maintenance_service import MaintenanceService
+from biz.service.review_log_store import ReviewLogStore, build_filters
+from biz.utils import tracing
 
 
 class ReviewService:
     DB_FILE = "data/data.db"
 
+    MR_REVIEW_LOG_COLUMNS = ("project_name", "author", "source_branch", "target_branch", "updated_at",
+                             "commit_messages", "score", "url", "review_result",
+                             "llm_provider", "llm_model", "prompt_tokens", "completion_tokens", "cached_tokens",
+                             "llm_latency_ms", "complexity_summary")
+    PUSH_REVIEW_LOG_COLUMNS = ("project_name", "author", "branch", "updated_at", "commit_messages", "score",
+                               "review_result",
+                               "llm_provider", "llm_model", "prompt_tokens", "completion_tokens", "cached_tokens",
+                               "llm_latency_ms", "complexity_summary")
+    # 体积较大的列，查询时默认不返回，需要时显式指定或按 id 单独获取
+    LAZY_COLUMNS = ("review_result", "complexity_summary", "commit_messages")
+    # 分页查询支持的排序列
+    SORTABLE_COLUMNS = ("updated_at", "score")
+    # 审核日志类型与表、列的对应关系
+    LOG_TABLES = {
+        "mr": ("mr_review_log", MR_REVIEW_LOG_COLUMNS),
+        "push": ("push_review_log", PUSH_REVIEW_LOG_COLUMNS),
+    }
+
+    @staticmethod
+    def _projection(table_columns: tuple, columns: list = None) -> tuple:
+        """
+        校验并返回要查询的列
+        :param table_columns: 表中的列
+        :param columns: 要查询的列，为 None 时返回 id 与除 LAZY_COLUMNS 以外的所有列
+        """
+        available_columns = ("id",) + table_columns
+        if columns is None:
+            return tuple(column for column in available_columns if column not in ReviewService.LAZY_COLUMNS)
+        unknown_columns = [column for column in columns if column not in available_columns]
+        if unknown_columns:
+            raise ValueError(f"Unknown columns: {', '.join(unknown_columns)}")
+        return tuple(columns)
+
+    @staticmethod
+    def get_review_log_page(log_type: str, authors: list = None, project_names: list = None,
+                            updated_at_gte: int = None, updated_at_lte: int = None, columns: list = None,
+                            sort_by: str = "updated_at", descending: bool = True, limit: int = 50,
+                            cursor: str = None):
+        """
+        分页获取审核日志
+        :param log_type: mr 或 push
+        :param columns: 要查询的列，默认同 get_mr_review_logs
+        :param sort_by: 排序列，见 SORTABLE_COLUMNS，相同时按 id 排序
+        :param descending: 是否降序
+        :param limit: 每页条数
+        :param cursor: 上一页返回的 next_cursor，为 None 时查询第一页
+        :return: (DataFrame, next_cursor)，没有下一页时 next_cursor 为 None
+        """
+        if log_type not in ReviewService.LOG_TABLES:
+            raise ValueError(f"Unknown log type: {log_type}")
+        if sort_by not in ReviewService.SORTABLE_COLUMNS:
+            raise ValueError(f"Unsupported sort column: {sort_by}")
+        table, table_columns = ReviewService.LOG_TABLES[log_type]
+        try:
+            return review_log_store.query_page(table, ReviewService._projection(table_columns, columns),
+                                               sort_by=sort_by, descending=descending, limit=limit, cursor=cursor,
+                                               authors=authors, project_names=project_names,
+                                               updated_at_gte=updated_at_gte, updated_at_lte=updated_at_lte)
+        except sqlite3.DatabaseError as e:
+            print(f"Error retrieving review log page: {e}")
+            return pd.DataFrame(), None
+
+    @staticmethod
+    def get_review_rollups(log_type: str, group_by: str, authors: list = None, project_names: list = None,
+                           updated_at_gte: int = None, updated_at_lte: int = None) -> pd.DataFrame:
+        """
+        从每日汇总表中按项目或人员统计审核次数与平均分，查询开销只与天数、项目数、人员数有关
+        :param log_type: mr 或 push
+        :param group_by: project_name 或 author
+        :param updated_at_gte: 开始时间戳，按所在日期过滤
+        :param updated_at_lte: 结束时间戳，按所在日期过滤
+        :return: 列为 group_by、count、score_count、score_sum、average_score 及各分数区间的数量
+        """
+        if group_by not in ("project_name", "author"):
+            raise ValueError(f"Unsupported group by column: {group_by}")
+        bucket_columns = [column for column, _, _ in database.SCORE_BUCKETS]
+        query = f"""
+            SELECT {group_by}, SUM(review_count) AS count, SUM(score_count) AS score_count,
+                   SUM(score_sum) AS score_sum, SUM(score_sum) / NULLIF(SUM(score_count), 0) AS average_score,
+                   {', '.join(f'SUM({column}) AS {column}' for column in bucket_columns)}
+            FROM review_daily_rollup
+            WHERE log_type = ?
+        """
+        params = [log_type]
+        if authors:
+            query += f" AND author IN ({','.join(['?'] * len(authors))})"
+            params.extend(authors)
+        if project_names:
+            query += f" AND project_name IN ({','.join(['?'] * len(project_names))})"
+            params.extend(project_names)
+        if updated_at_gte is not None:
+            query += " AND day >= ?"
+            params.append(time.strftime('%Y-%m-%d', time.localtime(updated_at_gte)))
+        if updated_at_lte is not None:
+            query += " AND day <= ?"
+            params.append(time.strftime('%Y-%m-%d', time.localtime(updated_at_lte)))
+        query += f" GROUP BY {group_by} ORDER BY {group_by}"
+        try:
+            return pd.read_sql_query(sql=query, con=database.get_connection(ReviewService.DB_FILE), params=params)
+        except sqlite3.DatabaseError as e:
+            print(f"Error retrieving review rollups: {e}")
+            return pd.DataFrame(columns=[group_by, "count", "score_count", "score_sum", "average_score"]
+                                + bucket_columns)
+
+    @staticmethod
+    def get_filter_options(log_type: str, updated_at_gte: int = None, updated_at_lte: int = None) -> dict:
+        """
+        从每日汇总表中查询时间范围内出现过的人员与项目，用于筛选项
+        :param log_type: mr 或 push
+        :param updated_at_gte: 开始时间戳，按所在日期过滤
+        :param updated_at_lte: 结束时间戳，按所在日期过滤
+        :return: {"author": [...], "project_name": [...]}，均已排序
+        """
+        where = " WHERE log_type = ?"
+        params = [log_type]
+        if updated_at_gte is not None:
+            where += " AND day >= ?"
+            params.append(time.strftime('%Y-%m-%d', time.localtime(updated_at_gte)))
+        if updated_at_lte is not None:
+            where += " AND day <= ?"
+            params.append(time.strftime('%Y-%m-%d', time.localtime(updated_at_lte)))
+        options = {}
+        try:
+            conn = database.get_connection(ReviewService.DB_FILE)
+            for column in ("author", "project_name"):
+                rows = conn.execute(f"SELECT DISTINCT {column} FROM review_daily_rollup{where} AND {column} != '' "
+                                    f"ORDER BY {column}", params).fetchall()
+                options[column] = [row[0] for row in rows]
+        except sqlite3.DatabaseError as e:
+            print(f"Error retrieving filter options: {e}")
+            return {"author": [], "project_name": []}
+        return options
+
+    @staticmethod
+    def run_maintenance(retention_days: int = None, full_vacuum: bool = False) -> dict:
+        """
+        归档过期的审核日志并回收数据库空间
+        :param retention_days: 审核日志保留天数，默认读取 REVIEW_LOG_RETENTION_DAYS
+        :param full_vacuum: 数据库尚未切换为增量回收模式时，是否切换并执行一次完整的 VACUUM（阻塞写入，只在命令行中执行）
+        """
+        if retention_days is None:
+            return MaintenanceService.run(ReviewService.DB_FILE, full_vacuum=full_vacuum)
+        return MaintenanceService.run(ReviewService.DB_FILE, retention_days, full_vacuum=full_vacuum)
+
+    @staticmethod
+    def rebuild_rollups() -> int:
+        """根据审核日志重新计算每日汇总数据，返回重新计算的日期数"""
+        with database.transaction(ReviewService.DB_FILE, immediate=True) as conn:
+            return sum(database.rebuild_rollup(conn, table) for table in database.ROLLUP_LOG_TYPES)
+
+    @staticmethod
+    def search_reviews(keywords: str, log_type: str = "mr", authors: list = None, project_names: list = None,
+                       updated_at_gte: int = None, updated_at_lte: int = None, limit: int = 20) -> pd.DataFrame:
+        """
+        在 Review 结果与提交信息中全文检索，按相关度排序
+        :param keywords: 以空格分隔的关键词，需同时包含所有关键词
+        :param log_type: mr 或 push
+        :param limit: 最多返回的条数
+        :return: 列为 id、project_name、author、updated_at、score、snippet（命中片段，关键词以 ** 标记）
+        """
+        if log_type not in ReviewService.LOG_TABLES:
+            raise ValueError(f"Unknown log type: {log_type}")
+        table = ReviewService.LOG_TABLES[log_type][0]
+        terms = keywords.split()
+        if not terms:
+            return pd.DataFrame(columns=["id", "project_name", "author", "updated_at", "score", "snippet"])
+
+        # trigram 索引只能匹配不少于 3 个字符的关键词，更短的关键词使用 LIKE 过滤
+        match_terms = ['"' + term.replace('"', '""') + '"' for term in terms if len(term) >= 3]
+        like_terms = [term for term in terms if len(term) < 3]
+        where, params = build_filters(authors=authors, project_names=project_names, updated_at_gte=updated_at_gte,
+                                      updated_at_lte=updated_at_lte, alias="l")
+        for term in like_terms:
+            where += " AND (" + " OR ".join(f"l.{column} LIKE ?" for column in database.FTS_COLUMNS) + ")"
+            params.extend([f"%{term}%"] * len(database.FTS_COLUMNS))
+
+        if match_terms:
+            query = f"""
+                SELECT l.id, l.project_name, l.author, l.updated_at, l.score,
+                       snippet({table}_fts, -1, '**', '**', '…', 24) AS snippet
+                FROM {table}_fts JOIN {table} l ON l.id = {table}_fts.rowid
+                {where} AND {table}_fts MATCH ?
+                ORDER BY bm25({table}_fts)
+                LIMIT ?
+            """
+            params.append(' '.join(match_terms))
+        else:
+            query = f"""
+                SELECT l.id, l.project_name, l.author, l.updated_at, l.score,
+                       substr(IFNULL(l.review_result, ''), 1, 200) AS snippet
+                FROM {table} l
+                {where}
+                ORDER BY l.updated_at DESC
+                LIMIT ?
+            """
+        params.append(limit)
+        try:
+            return pd.read_sql_query(sql=query, con=database.get_connection(ReviewService.DB_FILE), params=params)
+        except sqlite3.DatabaseError as e:
+            print(f"Error searching reviews: {e}")
+            return pd.DataFrame(columns=["id", "project_name", "author", "updated_at", "score", "snippet"])
+
+    @staticmethod
+    def _get_review_result(table: str, review_id: int):
+        df = review_log_store.fetch_by_ids(table, [review_id], ("review_result",))
+        return None if df.empty else df.iloc[0]["review_result"]
+
     @staticmethod
     def init_db():
-        """初始化数据库及表结构"""
+        """初始化数据库及表结构，并执行未应用的结构迁移"""
         try:
-            with sqlite3.connect(ReviewService.DB_FILE) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                        CREATE TABLE IF NOT EXISTS mr_review_log (
-                            id INTEGER PRIMARY KEY AUTOINCREMENT,
-                            project_name TEXT,
-                            author TEXT,
-                            source_branch TEXT,
-                            target_branch TEXT,
-                            updated_at INTEGER,
-                            commit_messages TEXT,
-                            score INTEGER,
-                            url TEXT,
-                            review_result TEXT
-                        )
-                    ''')
-                cursor.execute('''
-                        CREATE TABLE IF NOT EXISTS push_review_log (
-                            id INTEGER PRIMARY KEY AUTOINCREMENT,
-                            project_name TEXT,
-                            author TEXT,
-                            branch TEXT,
-                            updated_at INTEGER,
-                            commit_messages TEXT,
-                            score INTEGER,
-                            review_result TEXT
-                        )
-                    ''')
-                conn.commit()
+            database.migrate(ReviewService.DB_FILE)
         except sqlite3.DatabaseError as e:
             print(f"Database initialization failed: {e}")
 
     @staticmethod
+    @tracing.traced('db.insert_mr_review_log')
     def insert_mr_review_log(entity: MergeRequestReviewEntity):
         """插入合并请求审核日志"""
         try:
-            with sqlite3.connect(ReviewService.DB_FILE) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                                INSERT INTO mr_review_log (project_name,author, source_branch, target_branch, updated_at, commit_messages, score, url,review_result)
-                                VALUES (?,?, ?, ?, ?, ?, ?, ?, ?)
-                            ''',
-                               (entity.project_name, entity.author, entity.source_branch,
-                                entity.target_branch,
-                                entity.updated_at, entity.commit_messages, entity.score,
-                                entity.url, entity.review_result))
-                conn.commit()
-        except sqlite3.DatabaseError as e:
+            review_log_store.insert('mr_review_log', ReviewService.MR_REVIEW_LOG_COLUMNS,
+                                    (entity.project_name, entity.author, entity.source_branch, entity.target_branch,
+                                     entity.updated_at, entity.commit_messages, entity.score, entity.url,
+                                     entity.review_result,
+                                     entity.llm_provider, entity.llm_model, entity.prompt_tokens,
+                                     entity.completion_tokens, entity.cached_tokens, entity.llm_latency_ms,
+                                     entity.complexity_summary))
+        except (sqlite3.DatabaseError, OSError) as e:
             print(f"Error inserting review log: {e}")
 
     @staticmethod
     def get_mr_review_logs(authors: list = None, project_names: list = None, updated_at_gte: int = None,
-                           updated_at_lte: int = None) -> pd.DataFrame:
-        """获取符合条件的合并请求审核日志"""
+                           updated_at_lte: int = None, columns: list = None) -> pd.DataFrame:
+        """
+        获取符合条件的合并请求审核日志
+        :param columns: 要查询的列，默认返回 id 与除 review_result 以外的所有列，review_result 可通过
+                        get_mr_review_result 按 id 获取
+        """
         try:
-            with sqlite3.connect(ReviewService.DB_FILE) as conn:
-                query = """
-                            SELECT project_name, author, source_branch, target_branch, updated_at, commit_messages, score, url, review_result
-                            FROM mr_review_log
-                            WHERE 1=1
-                            """
-                params = []
-
-                if authors:
-                    placeholders = ','.join(['?'] * len(authors))
-                    query += f" AND author IN ({placeholders})"
-                    params.extend(authors)
-
-                if project_names:
-                    placeholders = ','.join(['?'] * len(project_names))
-                    query += f" AND project_name IN ({placeholders})"
-                    params.extend(project_names)
-
-                if updated_at_gte is not None:
-                    query += " AND updated_at >= ?"
-                    params.append(updated_at_gte)
-
-                if updated_at_lte is not None:
-                    query += " AND updated_at <= ?"
-                    params.append(updated_at_lte)
-                query += " ORDER BY updated_at DESC"
-                df = pd.read_sql_query(sql=query, con=conn, params=params)
-            return df
+            columns = ReviewService._projection(ReviewService.MR_REVIEW_LOG_COLUMNS, columns)
+            return review_log_store.query_logs('mr_review_log', columns, authors=authors, project_names=project_names,
+                                               updated_at_gte=updated_at_gte, updated_at_lte=updated_at_lte)
         except sqlite3.DatabaseError as e:
             print(f"Error retrieving review logs: {e}")
             return pd.DataFrame()
 
     @staticmethod
+    def get_mr_review_result(review_id: int):
+        """根据 id 获取合并请求审核日志的 Review 结果，不存在时返回 None"""
+        try:
+            return ReviewService._get_review_result('mr_review_log', review_id)
+        except sqlite3.DatabaseError as e:
+            print(f"Error retrieving review result: {e}")
+            return None
+
+    @staticmethod
+    @tracing.traced('db.insert_push_review_log')
     def insert_push_review_log(entity: PushReviewEntity):
         """插入推送审核日志"""
         try:
-            with sqlite3.connect(ReviewService.DB_FILE) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                                INSERT INTO push_review_log (project_name,author, branch, updated_at, commit_messages, score,review_result)
-                                 VALUES (?, ?, ?, ?, ?, ?, ?)
-                            ''',
-                               (entity.project_name, entity.author, entity.branch,
-                                entity.updated_at, entity.commit_messages, entity.score,
-                                entity.review_result))
-                conn.commit()
-        except sqlite3.DatabaseError as e:
+            review_log_store.insert('push_review_log', ReviewService.PUSH_REVIEW_LOG_COLUMNS,
+                                    (entity.project_name, entity.author, entity.branch, entity.updated_at,
+                                     entity.commit_messages, entity.score, entity.review_result,
+                                     entity.llm_provider, entity.llm_model, entity.prompt_tokens,
+                                     entity.completion_tokens, entity.cached_tokens, entity.llm_latency_ms,
+                                     entity.complexity_summary))
+        except (sqlite3.DatabaseError, OSError) as e:
             print(f"Error inserting review log: {e}")
 
     @staticmethod
     def get_push_review_logs(authors: list = None, project_names: list = None, updated_at_gte: int = None,
-                             updated_at_lte: int = None) -> pd.DataFrame:
-        """获取符合条件的推送审核日志"""
+                             updated_at_lte: int = None, columns: list = None) -> pd.DataFrame:
+        """
+        获取符合条件的推送审核日志
+        :param columns: 要查询的列，默认返回 id 与除 review_result 以外的所有列，review_result 可通过
+                        get_push_review_result 按 id 获取
+        """
         try:
-            with sqlite3.connect(ReviewService.DB_FILE) as conn:
-                # 基础查询
-                query = """
-                    SELECT project_name, author, branch, updated_at, commit_messages, score, review_result
-                    FROM push_review_log
-                    WHERE 1=1
-                """
-                params = []
-
-                # 动态添加 authors 条件
-                if authors:
-                    placeholders = ','.join(['?'] * len(authors))
-                    query += f" AND author IN ({placeholders})"
-                    params.extend(authors)
-
-                if project_names:
-                    placeholders = ','.join(['?'] * len(project_names))
-                    query += f" AND project_name IN ({placeholders})"
-                    params.extend(project_names)
-
-                # 动态添加 updated_at_gte 条件
-                if updated_at_gte is not None:
-                    query += " AND updated_at >= ?"
-                    params.append(updated_at_gte)
-
-                # 动态添加 updated_at_lte 条件
-                if updated_at_lte is not None:
-                    query += " AND updated_at <= ?"
-                    params.append(updated_at_lte)
-
-                # 按 updated_at 降序排序
-                query += " ORDER BY updated_at DESC"
-
-                # 执行查询
-                df = pd.read_sql_query(sql=query, con=conn, params=params)
-                return df
+            columns = ReviewService._projection(ReviewService.PUSH_REVIEW_LOG_COLUMNS, columns)
+            return review_log_store.query_logs('push_review_log', columns, authors=authors, project_names=project_names,
+                                               updated_at_gte=updated_at_gte, updated_at_lte=updated_at_lte)
         except sqlite3.DatabaseError as e:
             print(f"Error retrieving push review logs: {e}")
             return pd.DataFrame()
 
+    @staticmethod
+    def get_push_review_result(review_id: int):
+        """根据 id 获取推送审核日志的 Review 结果，不存在时返回 None"""
+        try:
+            return ReviewService._get_review_result('push_review_log', review_id)
+        except sqlite3.DatabaseError as e:
+            print(f"Error retrieving review result: {e}")
+            return None
+
 
 # Initialize database
 ReviewService.init_db()
+review_log_store = ReviewLogStore(ReviewService.DB_FILE)
+review_log_writer = review_log_store.writer
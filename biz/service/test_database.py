@@ -0,0 +1,106 @@
+import os
+import tempfile
+import time
+from unittest import TestCase, main
+
+from biz.service import database
+
+
+class TestMigrate(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.tmp.name, 'data.db')
+
+    def tearDown(self):
+        database.close_connections()
+        self.tmp.cleanup()
+
+    def test_migrate_to_latest_version(self):
+        """新数据库升级到最新版本，并创建各迁移中的表"""
+        self.assertEqual(database.migrate(self.db_file), database.MIGRATIONS[-1][0])
+        conn = database.get_connection(self.db_file)
+        self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], database.MIGRATIONS[-1][0])
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for table in ("mr_review_log", "push_review_log", "review_daily_rollup", "notification_outbox",
+                      "reviewed_push_commit", "reviewed_push_diff", "review_file_cache", "blob_complexity_cache"):
+            self.assertIn(table, tables)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(mr_review_log)")}
+        self.assertIn("complexity_summary", columns)
+
+    def test_migrate_is_idempotent(self):
+        """重复执行迁移不会报错，也不会丢失已有数据"""
+        database.migrate(self.db_file)
+        with database.transaction(self.db_file, immediate=True) as conn:
+            conn.execute("INSERT INTO push_review_log (project_name, author, branch, updated_at, score) "
+                         "VALUES ('demo', 'alice', 'main', 1700000000, 80)")
+        self.assertEqual(database.migrate(self.db_file), database.MIGRATIONS[-1][0])
+        conn = database.get_connection(self.db_file)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM push_review_log").fetchone()[0], 1)
+
+    def test_upgrade_from_old_version(self):
+        """从旧版本升级时只执行未执行过的迁移，旧数据保留"""
+        with database.transaction(self.db_file, immediate=True) as conn:
+            database._migration_1(conn)
+            conn.execute("PRAGMA user_version=1")
+            conn.execute("INSERT INTO mr_review_log (project_name, author, updated_at, score, review_result) "
+                         "VALUES ('demo', 'alice', 1700000000, 90, '旧的审核结果')")
+        self.assertEqual(database.migrate(self.db_file), database.MIGRATIONS[-1][0])
+        conn = database.get_connection(self.db_file)
+        row = conn.execute("SELECT score, complexity_summary FROM mr_review_log").fetchone()
+        self.assertEqual(row, (90, None))
+        # 已有数据在迁移时写入汇总表和全文索引
+        self.assertEqual(conn.execute("SELECT review_count FROM review_daily_rollup").fetchone()[0], 1)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM mr_review_log_fts WHERE mr_review_log_fts MATCH '审核结果'")
+                         .fetchone()[0], 1)
+
+
+class TestRollup(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.tmp.name, 'data.db')
+        database.migrate(self.db_file)
+        self.day_start = int(time.mktime((2024, 5, 1, 0, 0, 0, 0, 0, -1)))
+
+    def tearDown(self):
+        database.close_connections()
+        self.tmp.cleanup()
+
+    def _insert(self, author, updated_at, score):
+        with database.transaction(self.db_file, immediate=True) as conn:
+            conn.execute("INSERT INTO push_review_log (project_name, author, branch, updated_at, score) "
+                         "VALUES ('demo', ?, 'main', ?, ?)", (author, updated_at, score))
+
+    def _rollup(self):
+        conn = database.get_connection(self.db_file)
+        return conn.execute("SELECT day, author, review_count, score_count, score_sum, score_lt_60, score_80_89, "
+                            "score_ge_90 FROM review_daily_rollup WHERE log_type = 'push' "
+                            "ORDER BY day, author").fetchall()
+
+    def test_trigger_aggregates_inserts(self):
+        """插入审核日志时触发器按 (日期, 项目, 人员) 累加次数、分数合计与分数分布"""
+        self._insert('alice', self.day_start + 60, 85)
+        self._insert('alice', self.day_start + 86399, 95)
+        self._insert('alice', self.day_start + 86400, 50)
+        self._insert('bob', self.day_start + 3600, None)
+        self.assertEqual(self._rollup(), [
+            ('2024-05-01', 'alice', 2, 2, 180.0, 0, 1, 1),
+            ('2024-05-01', 'bob', 1, 0, 0.0, 0, 0, 0),
+            ('2024-05-02', 'alice', 1, 1, 50.0, 1, 0, 0),
+        ])
+
+    def test_rebuild_recomputes_rollup(self):
+        """删除审核日志后重算汇总数据，结果与按日志重新插入一致"""
+        for offset, score in ((60, 85), (120, 95), (86400, 50)):
+            self._insert('alice', self.day_start + offset, score)
+        with database.transaction(self.db_file, immediate=True) as conn:
+            conn.execute("DELETE FROM push_review_log WHERE score = 95")
+            conn.execute("UPDATE review_daily_rollup SET review_count = 100")
+            self.assertEqual(database.rebuild_rollup(conn, "push_review_log"), 2)
+        self.assertEqual(self._rollup(), [
+            ('2024-05-01', 'alice', 1, 1, 85.0, 0, 1, 0),
+            ('2024-05-02', 'alice', 1, 1, 50.0, 1, 0, 0),
+        ])
+
+
+if __name__ == '__main__':
+    main()
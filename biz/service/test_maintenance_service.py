@@ -0,0 +1,83 @@
+import os
+import tempfile
+import time
+from unittest import TestCase, main
+
+import pyarrow.parquet as pq
+
+from biz.service import database
+from biz.service.maintenance_service import MaintenanceService
+from biz.service.review_log_store import ReviewLogStore
+
+COLUMNS = ("project_name", "author", "branch", "updated_at", "score", "commit_messages")
+
+
+class TestMaintenanceService(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.tmp.name, 'data.db')
+        self.archive_dir = os.path.join(self.tmp.name, 'archive')
+        database.migrate(self.db_file)
+        self.store = ReviewLogStore(self.db_file)
+
+    def tearDown(self):
+        database.close_connections()
+        self.tmp.cleanup()
+
+    def _insert(self, count: int, updated_at: int):
+        for i in range(count):
+            self.store.insert('push_review_log', COLUMNS,
+                              ('demo', 'alice', 'main', updated_at + i, 80, 'x' * 2000))
+
+    def _month_dir(self, updated_at: int) -> str:
+        return os.path.join(self.archive_dir, 'push_review_log',
+                            f"month={time.strftime('%Y%m', time.localtime(updated_at))}")
+
+    def test_archive_merges_each_month_into_one_file(self):
+        """多批归档的记录合并为每月一个文件，再次归档时追加到同一个文件"""
+        old = int(time.mktime((2024, 3, 10, 12, 0, 0, 0, 0, -1)))
+        self._insert(5, old)
+        self.assertEqual(MaintenanceService.archive(self.db_file, 30, self.archive_dir)['push_review_log'], 5)
+        self._insert(3, old + 100)
+        self.assertEqual(MaintenanceService.archive(self.db_file, 30, self.archive_dir)['push_review_log'], 3)
+
+        month_dir = self._month_dir(old)
+        self.assertEqual(os.listdir(month_dir), ['data.parquet'])
+        ids = pq.read_table(os.path.join(month_dir, 'data.parquet')).column('id').to_pylist()
+        self.assertEqual(ids, list(range(1, 9)))
+        conn = database.get_connection(self.db_file)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM push_review_log").fetchone()[0], 0)
+
+    def test_merge_skips_records_archived_twice(self):
+        """删除数据库记录前崩溃导致同一批记录重复归档时，合并后不重复"""
+        old = int(time.mktime((2024, 3, 10, 12, 0, 0, 0, 0, -1)))
+        self._insert(4, old)
+        conn = database.get_connection(self.db_file)
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(push_review_log)")]
+        rows = conn.execute("SELECT * FROM push_review_log ORDER BY id").fetchall()
+        MaintenanceService._write_archive('push_review_log', rows[:2], columns, self.archive_dir)
+        month_dir = MaintenanceService._write_archive('push_review_log', rows, columns, self.archive_dir)[0]
+        self.assertEqual(MaintenanceService._merge_archive(month_dir), 4)
+
+    def test_compact_skips_full_vacuum_by_default(self):
+        """定时任务不切换增量回收模式，命令行执行时切换并回收空闲页"""
+        self._insert(200, int(time.time()))
+        with database.transaction(self.db_file, immediate=True) as conn:
+            conn.execute("DELETE FROM push_review_log")
+        conn = database.get_connection(self.db_file)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        self.assertGreater(freelist, 0)
+
+        # ANALYZE 等会复用少量空闲页，但空闲页不会被回收
+        self.assertLess(MaintenanceService.compact(self.db_file), freelist)
+        self.assertGreater(conn.execute("PRAGMA freelist_count").fetchone()[0], 0)
+        self.assertNotEqual(conn.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+
+        self.assertGreater(MaintenanceService.compact(self.db_file, full_vacuum=True), 0)
+        self.assertEqual(conn.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+        self.assertEqual(conn.execute("PRAGMA freelist_count").fetchone()[0], 0)
+
+
+if __name__ == '__main__':
+    main()
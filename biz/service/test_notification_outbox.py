@@ -0,0 +1,157 @@
+import os
+import tempfile
+import time
+from unittest import TestCase, main
+from unittest.mock import patch
+
+from biz.service import database
+from biz.service.notification_outbox import HEARTBEAT_TIMEOUT, NotificationOutbox, TokenBucket
+from biz.utils.im import notifier
+from biz.utils.im.dingtalk import DingTalkNotifier
+
+WEBHOOK_URL = 'https://oapi.dingtalk.com/robot/send?access_token=test'
+
+
+class TestNotificationOutbox(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.tmp.name, 'data.db')
+        database.migrate(self.db_file)
+        self.outbox = NotificationOutbox(self.db_file, rate_limit=3, max_attempts=2)
+        patcher = patch.object(notifier, 'deliver', return_value=True)
+        self.deliver = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        database.close_connections()
+        self.tmp.cleanup()
+
+    def _enqueue(self, count: int, url: str = WEBHOOK_URL):
+        for i in range(count):
+            self.outbox.enqueue([('dingtalk', url)], f'消息内容 {i}', msg_type='markdown', title=f'标题 {i}')
+
+    def _statuses(self) -> dict:
+        conn = database.get_connection(self.db_file)
+        return dict(conn.execute("SELECT status, COUNT(*) FROM notification_outbox GROUP BY status").fetchall())
+
+    def test_send_each_message_within_rate_limit(self):
+        """未超过频率限制时逐条发送"""
+        self._enqueue(3)
+        self.assertEqual(self.outbox.dispatch(), 3)
+        self.assertEqual(self.deliver.call_count, 3)
+        self.assertEqual(self.deliver.call_args.kwargs['title'], '标题 2')
+        self.assertEqual(self._statuses(), {'sent': 3})
+
+    def test_backlog_is_merged_into_digest(self):
+        """超过频率限制时，积压的消息合并为一条汇总消息，且发送次数不超过令牌数"""
+        self._enqueue(8)
+        self.assertEqual(self.outbox.dispatch(), 8)
+        self.assertEqual(self.deliver.call_count, 3)
+        digest = self.deliver.call_args.kwargs
+        self.assertEqual(digest['title'], '6 条通知汇总')
+        self.assertEqual(digest['msg_type'], 'markdown')
+        self.assertIn('#### 标题 7\n\n消息内容 7', digest['content'])
+        self.assertEqual(self._statuses(), {'sent': 8})
+        # 令牌已用完，新消息等待下一轮
+        self._enqueue(1)
+        self.assertEqual(self.outbox.dispatch(), 0)
+        self.assertEqual(self.deliver.call_count, 3)
+
+    def test_rate_limit_is_per_webhook(self):
+        """每个 Webhook 单独限流"""
+        self._enqueue(3)
+        self._enqueue(3, url=WEBHOOK_URL + '2')
+        self.assertEqual(self.outbox.dispatch(), 6)
+        self.assertEqual(self.deliver.call_count, 6)
+
+    def test_failed_message_is_retried_then_marked_failed(self):
+        """发送失败后延后重试，达到最大尝试次数后标记为 failed"""
+        self.deliver.return_value = False
+        self._enqueue(1)
+        self.outbox.dispatch()
+        conn = database.get_connection(self.db_file)
+        status, attempts, next_attempt_at, created_at = conn.execute(
+            "SELECT status, attempts, next_attempt_at, created_at FROM notification_outbox").fetchone()
+        self.assertEqual((status, attempts), ('pending', 1))
+        self.assertGreater(next_attempt_at, created_at)
+        # 未到重试时间时不会再次发送
+        self.assertEqual(self.outbox.dispatch(), 0)
+        with database.transaction(self.db_file) as conn:
+            conn.execute("UPDATE notification_outbox SET next_attempt_at = 0")
+        self.outbox.dispatch()
+        self.assertEqual(self._statuses(), {'failed': 1})
+        self.assertEqual(self.deliver.call_count, 2)
+
+    def test_dispatcher_heartbeat(self):
+        """发送线程运行时更新心跳，停止或心跳超时后认为没有发送线程"""
+        self.assertFalse(self.outbox.dispatcher_alive())
+        self.outbox.start()
+        try:
+            self.assertTrue(self.outbox.dispatcher_alive())
+            stale = time.time() - HEARTBEAT_TIMEOUT - 1
+            os.utime(self.outbox.heartbeat.path, (stale, stale))
+            self.assertFalse(self.outbox.dispatcher_alive())
+        finally:
+            self.outbox.stop()
+        self.assertFalse(os.path.exists(self.outbox.heartbeat.path))
+
+    def test_send_directly_without_dispatcher(self):
+        """没有发送线程时 send_notification 直接发送，不写入发件箱"""
+        with patch.dict(os.environ, {'DINGTALK_ENABLED': '1', 'DINGTALK_WEBHOOK_URL': WEBHOOK_URL}), \
+                patch('biz.service.notification_outbox.notification_outbox', self.outbox), \
+                patch('biz.service.notification_outbox.OUTBOX_ENABLED', True), \
+                patch.object(DingTalkNotifier, 'send_message', return_value=True) as send_message:
+            report = notifier.send_notification('消息内容')
+            self.assertEqual(report['dingtalk']['status'], 'sent')
+            self.assertEqual(send_message.call_count, 1)
+            self.assertEqual(self._statuses(), {})
+
+            self.outbox.heartbeat.beat()
+            report = notifier.send_notification('消息内容')
+            self.assertEqual(report['dingtalk']['status'], 'queued')
+            self.assertEqual(send_message.call_count, 1)
+            self.assertEqual(self._statuses(), {'pending': 1})
+
+    def test_digest_respects_message_size(self):
+        """汇总消息不超过渠道单条消息的长度限制，发送时不会再被切分，至少包含一条"""
+        rows = [{'title': f'标题 {i}', 'content': 'a' * 1500, 'is_at_all': 0} for i in range(5)]
+        batch = NotificationOutbox._take_digest('wecom', rows)
+        self.assertEqual(len(batch), 2)
+        self.assertEqual(len(notifier.split_chunks('wecom', **NotificationOutbox._digest_message(batch))), 1)
+        self.assertEqual(len(NotificationOutbox._take_digest('wecom', [{'title': None, 'content': 'a' * 9000}])), 1)
+
+    def test_long_message_is_queued_per_chunk(self):
+        """超过长度限制的消息按切分后的每一部分写入，每部分消耗一个令牌，失败时只重试失败的部分"""
+        content = '\n\n'.join(f'#### 问题 {i}\n' + '描述' * 300 for i in range(10))
+        chunks = notifier.split_chunks('wecom', content, msg_type='markdown', title='Review')
+        self.assertGreater(len(chunks), 3)
+        self.outbox.enqueue([('wecom', WEBHOOK_URL)], content, msg_type='markdown', title='Review')
+        self.deliver.side_effect = lambda channel, webhook_url, **kwargs: kwargs['title'] != chunks[1][1]
+        self.assertEqual(self.outbox.dispatch(), 3)
+        self.assertEqual([call.kwargs['title'] for call in self.deliver.call_args_list],
+                         [title for _, title in chunks[:3]])
+        self.assertEqual(self._statuses(), {'sent': 2, 'pending': len(chunks) - 2})
+
+        # 失败的部分到期后单独重试，已发送的部分不会重复发送
+        self.outbox._buckets.clear()
+        self.deliver.side_effect = None
+        with database.transaction(self.db_file) as conn:
+            conn.execute("UPDATE notification_outbox SET next_attempt_at = 0")
+        self.outbox.dispatch()
+        titles = [call.kwargs['title'] for call in self.deliver.call_args_list]
+        self.assertEqual(sorted(titles[3:]), sorted(title for _, title in [chunks[1]] + chunks[3:]))
+        self.assertEqual(self._statuses(), {'sent': len(chunks)})
+
+    def test_token_bucket_refills(self):
+        """令牌桶按每分钟的速率补充，不超过容量"""
+        bucket = TokenBucket(60)
+        self.assertEqual(bucket.available(), 60)
+        bucket.consume(60)
+        bucket.updated_at -= 2
+        self.assertEqual(bucket.available(), 2)
+        bucket.updated_at -= 3600
+        self.assertEqual(bucket.available(), 60)
+
+
+if __name__ == '__main__':
+    main()
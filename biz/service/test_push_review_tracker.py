@@ -0,0 +1,74 @@
+import os
+import tempfile
+from unittest import TestCase, main
+
+from biz.service import database
+from biz.service.push_review_tracker import PushReviewTracker, diff_fingerprint
+
+PROJECT = 'group/demo'
+
+
+class TestDiffFingerprint(TestCase):
+    def test_ignore_hunk_line_numbers(self):
+        """rebase 后只有 hunk 头中的行号变化时指纹相同"""
+        diff = '@@ -10,3 +10,4 @@ def main():\n a = 1\n+b = 2\n'
+        rebased = '@@ -20,3 +25,4 @@ def main():\n a = 1\n+b = 2\n'
+        self.assertEqual(diff_fingerprint(diff), diff_fingerprint(rebased))
+        self.assertNotEqual(diff_fingerprint(diff), diff_fingerprint(diff.replace('b = 2', 'b = 3')))
+        self.assertEqual(diff_fingerprint(None), diff_fingerprint(''))
+
+
+class TestPushReviewTracker(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.tmp.name, 'data.db')
+        database.migrate(self.db_file)
+        self.tracker = PushReviewTracker(self.db_file)
+
+    def tearDown(self):
+        database.close_connections()
+        self.tmp.cleanup()
+
+    def test_plan_new_commits(self):
+        """重复 Push 时只 Review 新提交，并从最后一个已 Review 的提交开始比较"""
+        self.assertEqual(self.tracker.plan(PROJECT, 'main', ['a', 'b']), (['a', 'b'], None))
+        self.tracker.record(PROJECT, 'main', ['a', 'b'], [])
+        self.assertEqual(self.tracker.plan(PROJECT, 'main', ['a', 'b', 'c', 'd']), (['c', 'd'], 'b'))
+        self.assertEqual(self.tracker.plan(PROJECT, 'main', ['a', 'b']), ([], 'b'))
+
+    def test_plan_force_push(self):
+        """force push 改写了中间的提交时，起点为最后一个连续已 Review 的提交"""
+        self.tracker.record(PROJECT, 'main', ['a', 'b', 'c'], [])
+        self.assertEqual(self.tracker.plan(PROJECT, 'main', ['a', 'x', 'c']), (['x'], 'a'))
+
+    def test_plan_new_branch(self):
+        """新建分支时，其他分支上已 Review 过的提交也视为已 Review，已有分支则不会"""
+        self.tracker.record(PROJECT, 'main', ['a', 'b'], [])
+        self.assertEqual(self.tracker.plan(PROJECT, 'feature', ['a', 'b', 'c'], created=True), (['c'], 'b'))
+        self.assertEqual(self.tracker.plan(PROJECT, 'feature', ['a', 'b', 'c']), (['a', 'b', 'c'], None))
+        self.assertEqual(self.tracker.plan('group/other', 'feature', ['a'], created=True), (['a'], None))
+
+    def test_filter_reviewed_changes(self):
+        """同一分支上已 Review 过相同 diff 的文件被跳过，diff 变化或其他分支仍需 Review"""
+        reviewed = {'new_path': 'app.py', 'diff': '@@ -1,2 +1,3 @@\n+import os\n'}
+        self.tracker.record(PROJECT, 'main', ['a'], [reviewed])
+        rebased = {'new_path': 'app.py', 'diff': '@@ -5,2 +5,3 @@\n+import os\n'}
+        modified = {'new_path': 'app.py', 'diff': '@@ -1,2 +1,3 @@\n+import sys\n'}
+        other_file = {'new_path': 'util.py', 'diff': '@@ -1,2 +1,3 @@\n+import os\n'}
+        self.assertEqual(self.tracker.filter_reviewed_changes(PROJECT, 'main', [rebased, modified, other_file]),
+                         [modified, other_file])
+        self.assertEqual(self.tracker.filter_reviewed_changes(PROJECT, 'feature', [rebased]), [rebased])
+        self.assertEqual(self.tracker.filter_reviewed_changes(PROJECT, 'main', []), [])
+
+    def test_record_is_idempotent(self):
+        """重复记录相同的提交与 diff 不会报错"""
+        change = {'new_path': 'app.py', 'diff': '+x = 1\n'}
+        self.tracker.record(PROJECT, 'main', ['a'], [change])
+        self.tracker.record(PROJECT, 'main', ['a'], [change])
+        conn = database.get_connection(self.db_file)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM reviewed_push_commit").fetchone()[0], 1)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM reviewed_push_diff").fetchone()[0], 1)
+
+
+if __name__ == '__main__':
+    main()
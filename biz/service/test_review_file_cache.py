@@ -0,0 +1,111 @@
+import os
+import tempfile
+from unittest import TestCase, main
+from unittest.mock import patch
+
+from biz.service import database
+from biz.service.review_file_cache import ReviewFileCache
+from biz.utils.code_reviewer import MULTI_FILE_INSTRUCTION, CodeReviewer
+from biz.utils.diff_encoder import encode_file, render_files
+from biz.utils.token_util import count_tokens
+
+APP_CHANGE = {'new_path': 'app.py', 'diff': '@@ -1,2 +1,3 @@\n import os\n+import sys\n'}
+UTIL_CHANGE = {'new_path': 'util.py', 'diff': '@@ -1 +1 @@\n-x = 1\n+x = 2\n'}
+
+
+class TestReviewFileCache(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.tmp.name, 'data.db')
+        database.migrate(self.db_file)
+        self.cache = ReviewFileCache(self.db_file)
+
+    def tearDown(self):
+        database.close_connections()
+        self.tmp.cleanup()
+
+    def test_key_depends_on_path_and_diff(self):
+        """相同路径与 diff 的修改缓存键相同"""
+        self.assertEqual(ReviewFileCache.key(dict(APP_CHANGE)), ReviewFileCache.key(APP_CHANGE))
+        self.assertNotEqual(ReviewFileCache.key(APP_CHANGE), ReviewFileCache.key({**APP_CHANGE, 'new_path': 'b.py'}))
+        self.assertNotEqual(ReviewFileCache.key(APP_CHANGE), ReviewFileCache.key(UTIL_CHANGE))
+
+    def test_get_many_by_prompt_version(self):
+        """只返回当前提示词版本下已缓存的文件"""
+        app_key, util_key = ReviewFileCache.key(APP_CHANGE), ReviewFileCache.key(UTIL_CHANGE)
+        self.cache.put(app_key, 'v1', 'app.py', '没有问题。总分:90分', 90)
+        self.assertEqual(self.cache.get_many([app_key, util_key], 'v1'), {app_key: ('没有问题。总分:90分', 90)})
+        self.assertEqual(self.cache.get_many([app_key], 'v2'), {})
+        self.assertEqual(self.cache.get_many([], 'v1'), {})
+        self.cache.put(app_key, 'v1', 'app.py', '总分:80分', 80)
+        self.assertEqual(self.cache.get_many([app_key], 'v1'), {app_key: ('总分:80分', 80)})
+
+
+class TestReviewChangesWithCache(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.tmp.name, 'data.db')
+        database.migrate(self.db_file)
+        self.cache = ReviewFileCache(self.db_file)
+        with patch('biz.utils.code_reviewer.Factory'):
+            self.reviewer = CodeReviewer()
+
+    def tearDown(self):
+        database.close_connections()
+        self.tmp.cleanup()
+
+    def test_files_reviewed_in_one_call_and_reused(self):
+        """未缓存的多个文件合并为一次调用，按文件拆分后缓存，再次出现时不再调用 LLM"""
+        review = "#### 📄 app.py\n\n新增的导入未使用。总分:70分\n\n---\n\n#### 📄 util.py\n\n没有问题。总分:90分"
+        with patch.object(self.reviewer, 'review_code', return_value=review) as review_code:
+            result = self.reviewer.review_changes([APP_CHANGE, UTIL_CHANGE], cache=self.cache)
+            self.assertEqual(review_code.call_count, 1)
+            self.assertIn('请按文件分别输出审查报告', review_code.call_args.args[0])
+            # 总分按 diff 长度加权：(70 * 39 + 90 * 26) / 65
+            self.assertEqual(CodeReviewer.parse_review_score(result), 78)
+            self.assertIn('共 2 个文件，其中 0 个文件复用了之前的 Review 结果', result)
+
+            # 同一修改出现在其他 Push 或 MR 中时直接复用
+            result = self.reviewer.review_changes([UTIL_CHANGE], cache=self.cache)
+            self.assertEqual(review_code.call_count, 1)
+            self.assertEqual(result, '没有问题。总分:90分')
+
+    def test_only_misses_are_sent(self):
+        """部分文件已缓存时只 Review 未缓存的文件"""
+        self.cache.put(ReviewFileCache.key(APP_CHANGE), self.reviewer.prompts['version'], 'app.py', '总分:60分', 60)
+        with patch.object(self.reviewer, 'review_code', return_value='没有问题。总分:100分') as review_code:
+            result = self.reviewer.review_changes([APP_CHANGE, UTIL_CHANGE], cache=self.cache)
+        self.assertNotIn('app.py', review_code.call_args.args[0])
+        self.assertIn('其中 1 个文件复用了之前的 Review 结果', result)
+
+    def test_unsplittable_result_is_not_cached(self):
+        """无法按文件拆分时返回整体结果，且不写入缓存"""
+        with patch.object(self.reviewer, 'review_code', return_value='整体没有问题。总分:85分'):
+            result = self.reviewer.review_changes([APP_CHANGE, UTIL_CHANGE], cache=self.cache)
+        self.assertEqual(result, '整体没有问题。总分:85分')
+        keys = [ReviewFileCache.key(APP_CHANGE), ReviewFileCache.key(UTIL_CHANGE)]
+        self.assertEqual(self.cache.get_many(keys, self.reviewer.prompts['version']), {})
+
+    def test_files_without_hunks_not_counted(self):
+        """空文件、二进制文件不计入文件数，只剩一个文件时不要求按文件输出"""
+        binary_change = {'new_path': 'logo.png', 'diff': ''}
+        with patch.object(self.reviewer, 'review_code', return_value='没有问题。总分:90分') as review_code:
+            result = self.reviewer.review_changes([APP_CHANGE, binary_change], cache=self.cache)
+        self.assertNotIn('请按文件分别输出审查报告', review_code.call_args.args[0])
+        self.assertEqual(result, '没有问题。总分:90分')
+
+    def test_instruction_kept_within_budget(self):
+        """预算不足时少选修改，按文件输出的说明不会被截断"""
+        changes = [{'new_path': f'module_{i}.py', 'diff': '@@ -1 +1,8 @@\n' + ''.join(
+            f'+value_{i}_{j} = compute({j}, {i})\n' for j in range(8))} for i in range(3)]
+        budget = count_tokens(render_files([encode_file(change) for change in changes])) + 10
+        with patch.dict(os.environ, {'REVIEW_MAX_TOKENS': str(budget)}), \
+                patch.object(self.reviewer, 'review_code', return_value='总分:80分') as review_code:
+            self.reviewer.review_changes(changes, cache=self.cache)
+        prompt = review_code.call_args.args[0]
+        self.assertTrue(prompt.endswith(MULTI_FILE_INSTRUCTION.format(count=2)))
+        self.assertLessEqual(count_tokens(prompt), budget)
+
+
+if __name__ == '__main__':
+    main()
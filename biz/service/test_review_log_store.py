@@ -0,0 +1,66 @@
+import os
+import tempfile
+from unittest import TestCase, main
+
+from biz.service import database
+from biz.service.review_log_store import ReviewLogStore, decode_cursor, encode_cursor
+
+COLUMNS = ("project_name", "author", "branch", "updated_at", "score")
+
+
+class TestQueryPage(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.tmp.name, 'data.db')
+        database.migrate(self.db_file)
+        self.store = ReviewLogStore(self.db_file)
+        # 分数与时间都有大量重复，验证相同排序值时按 id 区分
+        for i in range(23):
+            self.store.insert('push_review_log', COLUMNS,
+                              ('demo' if i % 2 else 'other', 'alice', 'main', 1700000000 + i // 4, 60 + i % 3 * 10))
+
+    def tearDown(self):
+        database.close_connections()
+        self.tmp.cleanup()
+
+    def _all_pages(self, **kwargs):
+        pages, cursor = [], None
+        while True:
+            df, cursor = self.store.query_page('push_review_log', ("id",) + COLUMNS, cursor=cursor, **kwargs)
+            pages.append(df)
+            if cursor is None:
+                return pages
+
+    def test_pages_cover_all_rows_without_duplicates(self):
+        """依次翻页取到所有记录，没有重复和遗漏，顺序与一次性查询一致"""
+        for sort_by in ("updated_at", "score"):
+            for descending in (True, False):
+                pages = self._all_pages(sort_by=sort_by, descending=descending, limit=5)
+                self.assertEqual([len(df) for df in pages], [5, 5, 5, 5, 3])
+                rows = [(row[sort_by], row["id"]) for df in pages for _, row in df.iterrows()]
+                self.assertEqual(rows, sorted(rows, reverse=descending))
+                self.assertEqual(len({review_id for _, review_id in rows}), 23)
+
+    def test_filters_apply_to_every_page(self):
+        """过滤条件在每一页都生效"""
+        pages = self._all_pages(limit=4, project_names=['demo'])
+        ids = [review_id for df in pages for review_id in df["id"]]
+        self.assertEqual(sorted(ids, reverse=True), ids)
+        self.assertEqual(ids, list(range(22, 0, -2)))
+        self.assertTrue(all((df["project_name"] == 'demo').all() for df in pages))
+
+    def test_only_requested_columns_returned(self):
+        """排序列与 id 只用于生成游标，不在结果中返回未请求的列"""
+        df, cursor = self.store.query_page('push_review_log', ("author",), sort_by='score', limit=3)
+        self.assertEqual(list(df.columns), ["author"])
+        self.assertEqual(decode_cursor(cursor), (80, 15))
+
+    def test_invalid_cursor(self):
+        """无法解析的游标抛出 ValueError"""
+        self.assertEqual(decode_cursor(encode_cursor(1700000000, 5)), (1700000000, 5))
+        with self.assertRaises(ValueError):
+            decode_cursor('not-a-cursor')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import os
+import tempfile
+from unittest import TestCase, main
+from unittest.mock import patch
+
+from biz.service import database, review_log_store
+from biz.service.review_log_store import ReviewLogStore
+from biz.service.review_log_writer import CLAIMED_EXT, JOURNAL_FILE, SPOOL_EXT, ReviewLogWriter
+
+COLUMNS = ("project_name", "author", "branch", "updated_at", "score")
+
+
+class TestReviewLogWriter(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.tmp.name, 'data.db')
+        self.spool_dir = os.path.join(self.tmp.name, 'spool')
+        database.migrate(self.db_file)
+        self.writer = ReviewLogWriter(self.db_file, spool_dir=self.spool_dir)
+
+    def tearDown(self):
+        database.close_connections()
+        self.tmp.cleanup()
+
+    def _count(self) -> int:
+        conn = database.get_connection(self.db_file)
+        return conn.execute("SELECT COUNT(*) FROM push_review_log").fetchone()[0]
+
+    def _enqueue(self, count: int):
+        for i in range(count):
+            self.writer.enqueue('push_review_log', COLUMNS, ('demo', 'alice', 'main', 1700000000 + i, 80))
+
+    def test_records_appended_to_single_journal(self):
+        """多条记录追加到同一个日志文件，不为每条记录创建文件"""
+        self._enqueue(5)
+        self.assertEqual(sorted(f for f in os.listdir(self.spool_dir) if not f.startswith('.')), [JOURNAL_FILE])
+        self.assertEqual(self.writer._pending_count(), 5)
+
+    def test_flush_writes_all_records_and_removes_files(self):
+        """合并后记录写入数据库，日志文件被删除，之后追加的记录写入新的日志文件"""
+        self._enqueue(3)
+        self.assertEqual(self.writer.flush(), 3)
+        self.assertEqual(self._count(), 3)
+        self.assertEqual([f for f in os.listdir(self.spool_dir) if not f.startswith('.')], [])
+
+        self._enqueue(2)
+        self.assertEqual(self.writer.flush(), 2)
+        self.assertEqual(self._count(), 5)
+
+    def test_failed_flush_keeps_records_for_retry(self):
+        """写入数据库失败时封存的文件放回待合并状态，下次合并时写入"""
+        self._enqueue(2)
+        with patch.object(database, 'transaction', side_effect=RuntimeError('database is locked')):
+            with self.assertRaises(RuntimeError):
+                self.writer.flush()
+        self.assertEqual(self._count(), 0)
+        self.assertEqual(len([f for f in os.listdir(self.spool_dir) if f.endswith(SPOOL_EXT)]), 1)
+        self.assertEqual(self.writer.flush(), 2)
+        self.assertEqual(self._count(), 2)
+
+    def test_stale_claim_recovered(self):
+        """合并进程崩溃时遗留的已认领文件超时后重新合并"""
+        self._enqueue(2)
+        self.writer._seal_journal()
+        sealed = [f for f in os.listdir(self.spool_dir) if f.endswith(SPOOL_EXT)][0]
+        claimed_path = self.writer._claim(os.path.join(self.spool_dir, sealed))
+        self.assertTrue(claimed_path.endswith(CLAIMED_EXT))
+        self.assertEqual(self.writer.flush(), 0)
+
+        os.utime(claimed_path, (0, 0))
+        self.assertEqual(self.writer.flush(), 2)
+        self.assertEqual(self._count(), 2)
+
+
+class TestReviewLogStoreInsert(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.tmp.name, 'data.db')
+        database.migrate(self.db_file)
+        self.store = ReviewLogStore(self.db_file)
+        self.store.writer = ReviewLogWriter(self.db_file, spool_dir=os.path.join(self.tmp.name, 'spool'))
+        patcher = patch.object(review_log_store, 'WRITE_BEHIND_ENABLED', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        database.close_connections()
+        self.tmp.cleanup()
+
+    def _count(self) -> int:
+        conn = database.get_connection(self.db_file)
+        return conn.execute("SELECT COUNT(*) FROM push_review_log").fetchone()[0]
+
+    def test_write_directly_without_collector(self):
+        """合并线程未运行时直接写入数据库"""
+        self.store.insert('push_review_log', COLUMNS, ('demo', 'alice', 'main', 1700000000, 80))
+        self.assertEqual(self._count(), 1)
+
+    def test_enqueue_when_collector_alive(self):
+        """合并线程运行时追加到日志文件，合并后写入数据库"""
+        self.store.writer.heartbeat.beat()
+        self.store.insert('push_review_log', COLUMNS, ('demo', 'alice', 'main', 1700000000, 80))
+        self.assertEqual(self._count(), 0)
+        self.assertEqual(self.store.writer.flush(), 1)
+        self.assertEqual(self._count(), 1)
+
+
+if __name__ == '__main__':
+    main()
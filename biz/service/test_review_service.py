@@ -0,0 +1,79 @@
+import os
+import tempfile
+from unittest import TestCase, main
+from unittest.mock import patch
+
+from biz.service import database, review_service
+from biz.service.review_log_store import ReviewLogStore
+from biz.service.review_service import ReviewService
+
+
+class TestSearchReviews(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.tmp.name, 'data.db')
+        database.migrate(self.db_file)
+        patcher = patch.object(ReviewService, 'DB_FILE', self.db_file)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        rows = [
+            ('demo', 'alice', 1700000000, 'fix: 修复登录接口', 70, '存在 SQL 注入风险，建议使用参数化查询。'),
+            ('demo', 'bob', 1700000100, 'feat: 新增导出功能', 90, '代码结构清晰，没有明显问题。'),
+            ('other', 'alice', 1700000200, 'refactor: 重构缓存', 80, '缓存失效时存在并发问题，建议加锁。'),
+        ]
+        with database.transaction(self.db_file, immediate=True) as conn:
+            conn.executemany("INSERT INTO mr_review_log (project_name, author, updated_at, commit_messages, score, "
+                             "review_result) VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def tearDown(self):
+        database.close_connections()
+        self.tmp.cleanup()
+
+    def test_match_review_result_and_commit_messages(self):
+        """关键词可以命中 Review 结果或提交信息，命中片段中标记关键词"""
+        df = ReviewService.search_reviews('SQL 注入')
+        self.assertEqual(list(df['id']), [1])
+        df = ReviewService.search_reviews('导出功能')
+        self.assertEqual(list(df['id']), [2])
+        self.assertIn('**导出功能**', df['snippet'].iloc[0])
+
+    def test_all_keywords_required(self):
+        """多个关键词需同时命中"""
+        self.assertEqual(sorted(ReviewService.search_reviews('存在 建议')['id']), [1, 3])
+        self.assertEqual(list(ReviewService.search_reviews('存在 并发问题')['id']), [3])
+        self.assertTrue(ReviewService.search_reviews('并发问题 参数化')['id'].empty)
+
+    def test_filters(self):
+        """检索结果按人员、项目过滤"""
+        self.assertEqual(list(ReviewService.search_reviews('建议', authors=['alice'], project_names=['other'])['id']),
+                         [3])
+
+    def test_index_follows_updates_and_deletes(self):
+        """修改和删除审核日志后，全文索引同步更新"""
+        with database.transaction(self.db_file, immediate=True) as conn:
+            conn.execute("UPDATE mr_review_log SET review_result = '需要补充单元测试。' WHERE id = 2")
+            conn.execute("DELETE FROM mr_review_log WHERE id = 1")
+        self.assertEqual(list(ReviewService.search_reviews('单元测试')['id']), [2])
+        self.assertTrue(ReviewService.search_reviews('没有明显问题')['id'].empty)
+        self.assertTrue(ReviewService.search_reviews('参数化查询')['id'].empty)
+
+    def test_empty_keywords(self):
+        """没有关键词时返回空结果"""
+        df = ReviewService.search_reviews('   ')
+        self.assertTrue(df.empty)
+        self.assertIn('snippet', df.columns)
+
+    def test_page_omits_lazy_columns_by_default(self):
+        """分页查询默认不返回体积较大的列，显式指定时返回"""
+        patcher = patch.object(review_service, 'review_log_store', ReviewLogStore(self.db_file))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        df, _ = ReviewService.get_review_log_page('mr')
+        for column in ReviewService.LAZY_COLUMNS:
+            self.assertNotIn(column, df.columns)
+        df, _ = ReviewService.get_review_log_page('mr', columns=['id', 'commit_messages'])
+        self.assertEqual(list(df['commit_messages']), ['refactor: 重构缓存', 'feat: 新增导出功能', 'fix: 修复登录接口'])
+
+
+if __name__ == '__main__':
+    main()
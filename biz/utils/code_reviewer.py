@@ -3,50 +3,50 @@ import os
 import re
 from typing import Dict, Any, List
 
-import yaml
-from jinja2 import Template
-
 from biz.llm.factory import Factory
+from biz.llm.types import CompletionResult
+from biz.utils import metrics, tracing
+from biz.utils.complexity_analyzer import complexity_increase, format_file_summary
+from biz.utils.diff_encoder import encode_file, render_files
 from biz.utils.log import logger
+from biz.utils.prompt_registry import prompt_registry
+from biz.utils.review_budget import allocate, format_omitted
 from biz.utils.token_util import count_tokens, truncate_text_by_tokens
 
+# 多个未缓存的文件合并为一次 LLM 调用时，要求按文件输出 Review 结果，拆分后按文件缓存
+MULTI_FILE_INSTRUCTION = ("（以上共 {count} 个文件。请按文件分别输出审查报告，涉及多个文件的问题写在相关文件的报告中："
+                          "每个文件的报告以“#### 📄 文件路径”单独一行开头，并以该文件的“总分:XX分”结尾。）")
+FILE_SECTION_PATTERN = re.compile(r'^#{2,4}\s*📄\s*`?(.+?)`?\s*$', re.MULTILINE)
+
 
 class BaseReviewer(abc.ABC):
     """代码审查基类"""
 
     def __init__(self, prompt_key: str):
         self.client = Factory().getClient()
+        # 累计本次 Review 中所有 LLM 调用的 token 用量与耗时
+        self.completion = CompletionResult()
         self.prompts = self._load_prompts(prompt_key,os.getenv("REVIEW_STYLE", "professional"))
 
     def _load_prompts(self, prompt_key: str, style="professional") -> Dict[str, Any]:
-        """加载提示词配置"""
-        prompt_templates_file = "conf/prompt_templates.yml"
-        try:
-            # 在打开 YAML 文件时显式指定编码为 UTF-8，避免使用系统默认的 GBK 编码。
-            with open(prompt_templates_file, "r", encoding="utf-8") as file:
-                prompts = yaml.safe_load(file).get(prompt_key, {})
-
-                # 使用Jinja2渲染模板
-                def render_template(template_str: str) -> str:
-                    return Template(template_str).render(style=style)
-
-                system_prompt = render_template(prompts["system_prompt"])
-                user_prompt = render_template(prompts["user_prompt"])
-
-                return {
-                    "system_message": {"role": "system", "content": system_prompt},
-                    "user_message": {"role": "user", "content": user_prompt},
-                }
-        except (FileNotFoundError, KeyError, yaml.YAMLError) as e:
-            logger.error(f"加载提示词配置失败: {e}")
-            raise Exception(f"提示词配置加载失败: {e}")
+        """加载提示词配置（由进程级的 prompt_registry 缓存，模板文件修改后自动重新加载）"""
+        return prompt_registry.get_prompts(prompt_key, style)
 
     def call_llm(self, messages: List[Dict[str, Any]]) -> str:
         """调用 LLM 进行代码审核"""
         logger.info(f"向 AI 发送代码 Review 请求, messages: {messages}")
-        review_result = self.client.completions(messages=messages)
-        logger.info(f"收到 AI 返回结果: {review_result}")
-        return review_result
+        with tracing.start_span('llm.completion', provider=self.client.provider) as span:
+            completion = self.client.completions_with_usage(messages=messages)
+            span.set_attributes({
+                'llm.model': completion.model,
+                'llm.prompt_bytes': sum(len(str(message.get('content', '')).encode('utf-8')) for message in messages),
+                'llm.prompt_tokens': completion.usage.prompt_tokens,
+                'llm.completion_tokens': completion.usage.completion_tokens,
+                'llm.cached_tokens': completion.usage.cached_tokens,
+            })
+        self.completion = self.completion.merge(completion)
+        logger.info(f"收到 AI 返回结果: {completion.content}, usage: {completion.usage}, latency_ms: {completion.latency_ms}")
+        return completion.content
 
     @abc.abstractmethod
     def review_code(self, *args, **kwargs) -> str:
@@ -60,6 +60,7 @@ class CodeReviewer(BaseReviewer):
     def __init__(self):
         super().__init__("code_review_prompt")
 
+    @tracing.traced('review.code')
     def review_and_strip_code(self, changes_text: str, commits_text: str = "") -> str:
         """
         Review判断changes_text超出取前REVIEW_MAX_TOKENS个token，超出则截断changes_text，
@@ -85,15 +86,142 @@ class CodeReviewer(BaseReviewer):
             return review_result[11:-3].strip()
         return review_result
 
+    @tracing.traced('review.changes')
+    def review_changes(self, changes: list, commits_text: str = "", cache=None, complexity: dict = None) -> str:
+        """
+        Review 变更。超过 REVIEW_MAX_TOKENS 时按 review_budget 选择最值得 Review 的 hunk，未选中的修改列在结果末尾。
+        开启缓存时已缓存的文件直接复用之前的 Review 结果且不占用 token 预算，未缓存的文件合并为一次 LLM 调用，
+        并要求按文件输出结果，拆分后逐个文件缓存，同一文件修改出现在 Push、MR 或 cherry-pick 中时只 Review 一次
+        :param changes: 过滤后的变更 [{'new_path': ..., 'diff': ...}]
+        :param commits_text: 提交信息，只用于未缓存文件的 Review
+        :param cache: 按文件缓存 Review 结果的存储（ReviewFileCache），为 None 时不缓存
+        :param complexity: complexity_analyzer.analyze_changes 的结果，复杂度变化附在 Prompt 中对应文件的标题之后，
+                           圈复杂度增加的修改优先 Review
+        :return: Review 结果，复用了缓存或按文件拆分时包含按修改量加权的总分与各文件的 Review 结果
+        """
+        review_max_tokens = int(os.getenv("REVIEW_MAX_TOKENS", 10000))
+        complexity = complexity or {}
+        complexity_deltas = {path: complexity_increase(deltas) for path, deltas in complexity.items()}
+        if cache is None or not changes:
+            files, omitted = allocate([self._encode_file(change, complexity) for change in changes],
+                                      review_max_tokens, complexity_deltas)
+            return self._append_omitted(self.review_and_strip_code(render_files(files), commits_text), omitted)
+
+        prompt_version = self.prompts["version"]
+        keys = [cache.key(change) for change in changes]
+        reviews = cache.get_many(list(set(keys)), prompt_version)
+        misses = {key: change for key, change in zip(keys, changes) if key not in reviews}
+        reused = len(reviews)
+        metrics.REVIEW_FILE_CACHE.labels(result='hit').inc(reused)
+        metrics.REVIEW_FILE_CACHE.labels(result='miss').inc(len(misses))
+        logger.info(f"按文件缓存 Review: 共 {len(set(keys))} 个文件修改，{len(misses)} 个需要调用 LLM")
+
+        # 空文件、二进制文件等没有可 Review 的 hunk，不计入文件数，也不要求 LLM 输出它们的报告
+        pending = []
+        for key, change in misses.items():
+            file = self._encode_file(change, complexity)
+            if file['hunks']:
+                pending.append({**file, 'key': key})
+        if len(pending) > 1:
+            # 为按文件输出的说明预留 token，避免超出预算时被截断
+            review_max_tokens -= count_tokens(MULTI_FILE_INSTRUCTION.format(count=len(pending))) + 2
+        files, omitted = allocate(pending, review_max_tokens, complexity_deltas)
+        # 按文件拆分失败时，未缓存文件的整体 Review 结果 (Review 结果, 得分)
+        combined = None
+        if files:
+            changes_text = render_files(files)
+            if len(files) > 1:
+                changes_text += "\n\n" + MULTI_FILE_INSTRUCTION.format(count=len(files))
+            review_result = self.review_and_strip_code(changes_text, commits_text)
+            file_reviews = self._split_file_reviews(review_result, files)
+            if file_reviews is None:
+                logger.info("未能按文件拆分 Review 结果，不缓存本次结果")
+                combined = (review_result, self.parse_review_score(review_text=review_result))
+                file_reviews = {}
+            partial = {file['key'] for file, _ in omitted}
+            for key, (file_review, score) in file_reviews.items():
+                reviews[key] = (file_review, score)
+                # 只 Review 了部分修改或解析不出总分的结果不完整，不缓存
+                if score > 0 and key not in partial:
+                    cache.put(key, prompt_version, misses[key]['new_path'], file_review, score)
+            if combined and not reused:
+                return self._append_omitted(review_result, omitted)
+
+        entries, seen = [], set()
+        for change, key in zip(changes, keys):
+            if key in seen or key not in reviews:
+                continue
+            seen.add(key)
+            entries.append((change['new_path'], *reviews[key], max(len(change.get('diff') or ''), 1)))
+        if combined:
+            paths = [file['path'] for file in files]
+            entries.append(('、'.join(paths), *combined,
+                            sum(max(len(misses[file['key']].get('diff') or ''), 1) for file in files)))
+            seen.update(file['key'] for file in files)
+        if not entries:
+            return "代码为空"
+        if len(entries) == 1 and not omitted:
+            return entries[0][1]
+        return self._append_omitted(self._merge_file_reviews(entries, len(seen), reused), omitted)
+
+    @staticmethod
+    def _split_file_reviews(review_result: str, files: list):
+        """
+        按“#### 📄 文件路径”标题把多个文件的 Review 结果拆分为各文件的结果
+        :param files: 本次 Review 的文件（encode_file 的结果，附带缓存键 key）
+        :return: {key: (Review 结果, 得分)}，有文件缺少标题或总分时返回 None
+        """
+        if len(files) == 1:
+            return {files[0]['key']: (review_result, CodeReviewer.parse_review_score(review_text=review_result))}
+        keys_by_path = {file['path']: file['key'] for file in files}
+        matches = [match for match in FILE_SECTION_PATTERN.finditer(review_result)
+                   if match.group(1) in keys_by_path]
+        file_reviews = {}
+        for index, match in enumerate(matches):
+            end = matches[index + 1].start() if index + 1 < len(matches) else len(review_result)
+            section = review_result[match.end():end].strip().rstrip('-').strip()
+            score = CodeReviewer.parse_review_score(review_text=section)
+            if score > 0:
+                file_reviews.setdefault(keys_by_path[match.group(1)], (section, score))
+        if len(file_reviews) != len(files):
+            return None
+        return file_reviews
+
+    @staticmethod
+    def _encode_file(change: dict, complexity: dict) -> dict:
+        file = encode_file(change)
+        if complexity.get(file['path']):
+            file['header'] += f"\n{format_file_summary(complexity[file['path']])}"
+        return file
+
+    @staticmethod
+    def _append_omitted(review_result: str, omitted: list) -> str:
+        """在 Review 结果之后列出超出 token 预算而未 Review 的修改"""
+        if not omitted:
+            return review_result
+        return f"{review_result}\n\n---\n\n{format_omitted(omitted)}"
+
+    @staticmethod
+    def _merge_file_reviews(entries: list, file_count: int, reused: int) -> str:
+        """
+        合并各文件的 Review 结果，总分为各文件得分按 diff 长度加权的平均值
+        :param entries: [(文件路径, Review 结果, 得分, diff 长度)]
+        """
+        total_weight = sum(weight for _, _, _, weight in entries)
+        weighted_score = sum(score * weight for _, _, score, weight in entries)
+        sections = [f"#### 📄 {path}\n\n{review_result}" for path, review_result, _, _ in entries]
+        header = (f"### 总分:{round(weighted_score / total_weight)}分\n\n"
+                  f"共 {file_count} 个文件，其中 {reused} 个文件复用了之前的 Review 结果，总分为各文件得分按修改量加权的平均值。")
+        # 总分放在最前面，parse_review_score 取第一个匹配的总分
+        return '\n\n---\n\n'.join([header, *sections])
+
     def review_code(self, diffs_text: str, commits_text: str = "") -> str:
         """Review 代码并返回结果"""
         messages = [
             self.prompts["system_message"],
             {
                 "role": "user",
-                "content": self.prompts["user_message"]["content"].format(
-                    diffs_text=diffs_text, commits_text=commits_text
-                ),
+                "content": self.prompts["user_template"](diffs_text=diffs_text, commits_text=commits_text),
             },
         ]
         return self.call_llm(messages)
@@ -0,0 +1,159 @@
+import os
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+
+import lizard
+
+from biz.utils import tracing
+from biz.utils.diff_encoder import changed_line_numbers
+from biz.utils.log import logger
+
+# 是否在 Review 前用 lizard 分析被修改函数的复杂度变化
+REVIEW_COMPLEXITY_ENABLED = os.getenv('REVIEW_COMPLEXITY_ENABLED', '1') == '1'
+# 超过该大小的文件不分析
+MAX_FILE_BYTES = 512 * 1024
+# 同时请求 blob SHA 与文件内容的数量
+FETCH_CONCURRENCY = 8
+# Prompt 中每个文件最多列出的函数数
+MAX_FUNCTIONS_PER_FILE = 5
+
+
+def analyze_source(file_path: str, content: str) -> list:
+    """
+    用 lizard 分析文件中的函数
+    :return: [(函数名, 起始行, 结束行, 圈复杂度, 代码行数)]
+    """
+    file_info = lizard.analyze_file.analyze_source_code(file_path, content)
+    return [(function.name, function.start_line, function.end_line, function.cyclomatic_complexity, function.nloc)
+            for function in file_info.function_list]
+
+
+def _touched(functions: list, lines: list) -> set:
+    """包含修改行的函数名，lines 已排序"""
+    touched = set()
+    for name, start, end, _, _ in functions:
+        index = bisect_left(lines, start)
+        if index < len(lines) and lines[index] <= end:
+            touched.add(name)
+    return touched
+
+
+def _function_deltas(old_functions: list, new_functions: list, diff: str) -> list:
+    """
+    被修改的函数在修改前后的圈复杂度与代码行数
+    :return: [{'name': 函数名, 'old': (圈复杂度, 代码行数) 或 None, 'new': ...}]，圈复杂度增加最多的在前
+    """
+    removed, added = changed_line_numbers(diff)
+    names = _touched(old_functions, sorted(removed)) | _touched(new_functions, sorted(added))
+    # 同名函数（重载）只取第一个
+    old_metrics, new_metrics = {}, {}
+    for name, _, _, ccn, nloc in old_functions:
+        old_metrics.setdefault(name, (ccn, nloc))
+    for name, _, _, ccn, nloc in new_functions:
+        new_metrics.setdefault(name, (ccn, nloc))
+    deltas = [{'name': name, 'old': old_metrics.get(name), 'new': new_metrics.get(name)} for name in names
+              if old_metrics.get(name) != new_metrics.get(name)]
+    deltas.sort(key=lambda delta: (-_ccn_increase(delta), delta['name']))
+    return deltas
+
+
+def _ccn_increase(delta: dict) -> int:
+    return (delta['new'][0] if delta['new'] else 0) - (delta['old'][0] if delta['old'] else 0)
+
+
+def _blob_key(handler, file_path: str, ref: str, blob_id: str = None) -> str:
+    """
+    文件版本的缓存键：blob SHA，无法预先获取时为 "<提交 SHA>:<文件路径>"（同样不会变化）
+    :param blob_id: 变更中已带有的 blob SHA（GitHub 的 files[].sha）
+    """
+    return blob_id or handler.get_blob_id(file_path, ref) or f'{ref}:{file_path}'
+
+
+@tracing.traced('review.complexity')
+def analyze_changes(changes: list, handler, cache=None) -> dict:
+    """
+    用 lizard 分析修改涉及的函数在修改前后的圈复杂度与代码行数变化。
+    先获取各文件版本的 blob SHA 查询缓存，只下载未缓存版本的文件内容；重命名的文件按 old_path 获取旧版本。
+    分析失败时返回空字典，不影响 Review
+    :param changes: 过滤后的变更 [{'new_path': ..., 'old_path': ..., 'new_file': ..., 'blob_id': ..., 'diff': ...}]
+    :param handler: 已获取变更的 GitLab/GitHub handler，提供 diff_refs、get_blob_id 与 get_file_content
+    :param cache: 按 blob SHA 缓存分析结果的存储（BlobComplexityCache）
+    :return: {文件路径: 函数的复杂度变化}，见 _function_deltas
+    """
+    if not changes or not getattr(handler, 'diff_refs', None):
+        return {}
+    old_ref, new_ref = handler.diff_refs
+    targets = [change for change in changes if lizard.get_reader_for(change['new_path'])]
+    if not targets:
+        return {}
+
+    try:
+        # 每个文件的 (旧版本, 新版本)，新文件没有旧版本
+        versions = [((change.get('old_path') or change['new_path'], old_ref, None) if not change.get('new_file')
+                     else None, (change['new_path'], new_ref, change.get('blob_id')))
+                    for change in targets]
+        file_versions = [version for pair in versions for version in pair if version]
+        with ThreadPoolExecutor(max_workers=min(FETCH_CONCURRENCY, len(file_versions))) as executor:
+            keys = dict(zip(file_versions, executor.map(lambda version: _blob_key(handler, *version),
+                                                        file_versions)))
+            functions = cache.get_many(list(set(keys.values()))) if cache else {}
+            misses = {}
+            for version, key in keys.items():
+                if key not in functions:
+                    misses.setdefault(key, version)
+            contents = list(executor.map(lambda version: handler.get_file_content(*version[:2]), misses.values()))
+
+        # lizard 分析几个文件只需几毫秒到几十毫秒，直接在当前进程中执行
+        analyzed = {key: analyze_source(version[0], content)
+                    for (key, version), (_, content) in zip(misses.items(), contents)
+                    if content is not None and len(content) <= MAX_FILE_BYTES}
+        if cache:
+            cache.put_many(analyzed)
+        functions.update(analyzed)
+
+        result = {}
+        for change, (old_version, new_version) in zip(targets, versions):
+            new_functions = functions.get(keys[new_version])
+            # 获取失败或超过大小的版本无法比较
+            if new_functions is None or (old_version and keys[old_version] not in functions):
+                continue
+            old_functions = functions[keys[old_version]] if old_version else []
+            deltas = _function_deltas(old_functions, new_functions, change.get('diff'))
+            if deltas:
+                result[change['new_path']] = deltas
+        logger.info(f"复杂度分析: {len(targets)} 个文件，下载并分析 {len(analyzed)} 个版本，"
+                    f"{len(result)} 个文件的函数复杂度有变化")
+        return result
+    except Exception as e:
+        logger.warning(f"复杂度分析失败，跳过: {e}")
+        return {}
+
+
+def complexity_increase(deltas: list) -> int:
+    """文件中被修改函数的圈复杂度增加量之和"""
+    return sum(max(_ccn_increase(delta), 0) for delta in deltas)
+
+
+def _format_delta(delta: dict) -> str:
+    old, new = delta['old'], delta['new']
+    if old is None:
+        return f"{delta['name']}(新增, CCN {new[0]}, {new[1]} 行)"
+    if new is None:
+        return f"{delta['name']}(删除)"
+    return f"{delta['name']}(CCN {old[0]}→{new[0]}, {old[1]}→{new[1]} 行)"
+
+
+def format_file_summary(deltas: list) -> str:
+    """单个文件的复杂度变化，放在 Prompt 中该文件的标题之后"""
+    summary = '; '.join(_format_delta(delta) for delta in deltas[:MAX_FUNCTIONS_PER_FILE])
+    if len(deltas) > MAX_FUNCTIONS_PER_FILE:
+        summary += f"; 等 {len(deltas)} 个函数"
+    return f"复杂度变化(lizard): {summary}"
+
+
+def format_summary(analysis: dict) -> str:
+    """所有文件的复杂度变化，保存到审核日志中，没有变化时返回 None"""
+    if not analysis:
+        return None
+    return '\n'.join(f"{path}: {'; '.join(_format_delta(delta) for delta in deltas)}"
+                     for path, deltas in analysis.items())
@@ -0,0 +1,163 @@
+import os
+import re
+from typing import List, Tuple
+
+# 每处修改前后保留的上下文行数（GitLab/GitHub 返回的 diff 默认为 3 行）
+REVIEW_DIFF_CONTEXT_LINES = int(os.getenv('REVIEW_DIFF_CONTEXT_LINES', 2))
+
+HUNK_HEADER_PATTERN = re.compile(r'^@@ -(\d+)(?:,\d+)? \+(\d+)(?:,\d+)? @@(.*)$')
+# 缩进有语义的文件，只修改缩进的 hunk 同样需要 Review（如把语句移入或移出代码块）
+INDENT_SENSITIVE_EXTENSIONS = ('.py', '.pyi', '.yml', '.yaml', '.mk', '.coffee', '.pug', '.haml', '.sass', '.nim')
+INDENT_SENSITIVE_NAMES = ('Makefile', 'GNUmakefile', 'makefile')
+
+
+def _parse_hunks(diff: str) -> List[Tuple[int, int, str, list]]:
+    """
+    解析 unified diff
+    :return: [(旧文件起始行号, 新文件起始行号, hunk 头中的函数名等信息, [(标记, 内容)])]，标记为 ' '、'-' 或 '+'
+    """
+    hunks = []
+    for line in diff.split('\n'):
+        match = HUNK_HEADER_PATTERN.match(line)
+        if match:
+            hunks.append((int(match.group(1)), int(match.group(2)), match.group(3).rstrip(), []))
+            continue
+        if not hunks or line.startswith('\\'):
+            # hunk 之前的文件头，以及 "\ No newline at end of file"
+            continue
+        tag = line[:1] if line[:1] in ('-', '+') else ' '
+        hunks[-1][3].append((tag, line[1:].rstrip()))
+    # 去掉 diff 末尾换行产生的空上下文行
+    for hunk in hunks:
+        lines = hunk[3]
+        while lines and lines[-1] == (' ', ''):
+            lines.pop()
+    return hunks
+
+
+def changed_line_numbers(diff: str) -> Tuple[set, set]:
+    """
+    :return: (旧文件中删除的行号, 新文件中新增的行号)
+    """
+    removed, added = set(), set()
+    for old_no, new_no, _, lines in _parse_hunks(diff or ''):
+        for tag, _ in lines:
+            if tag == '-':
+                removed.add(old_no)
+            elif tag == '+':
+                added.add(new_no)
+            old_no += tag != '+'
+            new_no += tag != '-'
+    return removed, added
+
+
+def _indent_sensitive(path: str) -> bool:
+    file_name = os.path.basename(path)
+    return file_name in INDENT_SENSITIVE_NAMES or file_name.lower().endswith(INDENT_SENSITIVE_EXTENSIONS)
+
+
+def _whitespace_only(lines: list, keep_indent: bool = False) -> bool:
+    """
+    修改前后的内容去掉所有空白字符后相同
+    :param keep_indent: 为 True 时只忽略空行与行尾空白，缩进或行内空白的修改不算仅空白字符的修改
+    """
+    if keep_indent:
+        removed = [text for tag, text in lines if tag == '-' and text.strip()]
+        added = [text for tag, text in lines if tag == '+' and text.strip()]
+        return removed == added
+    removed = ''.join(''.join(text.split()) for tag, text in lines if tag == '-')
+    added = ''.join(''.join(text.split()) for tag, text in lines if tag == '+')
+    return removed == added
+
+
+def _encode_hunk(old_start: int, new_start: int, section: str, lines: list, context_lines: int,
+                 keep_indent: bool = False) -> Tuple[list, int]:
+    """
+    按上下文行数把一个 hunk 拆分为更小的 hunk，去掉只修改了空白字符的部分
+    :param keep_indent: 缩进有语义的文件，只修改缩进的部分不去掉
+    :return: ([{'text': 编码后的 hunk, 'lines': [(标记, 内容)], 'new_start': 新文件起始行号, 'new_count': 新文件行数}],
+              省略的仅空白字符修改的处数)
+    """
+    changed = [index for index, (tag, _) in enumerate(lines) if tag != ' ']
+    if not changed:
+        return [], 0
+
+    # 相邻修改之间的上下文不超过 2 * context_lines 行时合并为一组
+    groups = [[changed[0], changed[0]]]
+    for index in changed[1:]:
+        if index - groups[-1][1] - 1 <= 2 * context_lines:
+            groups[-1][1] = index
+        else:
+            groups.append([index, index])
+
+    # 每一行在旧文件、新文件中的行号
+    old_numbers, new_numbers = [], []
+    old_no, new_no = old_start, new_start
+    for tag, _ in lines:
+        old_numbers.append(old_no)
+        new_numbers.append(new_no)
+        old_no += tag != '+'
+        new_no += tag != '-'
+
+    hunks, skipped = [], 0
+    for first, last in groups:
+        start, end = max(first - context_lines, 0), min(last + context_lines, len(lines) - 1)
+        group_lines = lines[start:end + 1]
+        if _whitespace_only(group_lines, keep_indent):
+            skipped += 1
+            continue
+        old_count = sum(1 for tag, _ in group_lines if tag != '+')
+        new_count = sum(1 for tag, _ in group_lines if tag != '-')
+        header = f'@@ -{old_numbers[start]},{old_count} +{new_numbers[start]},{new_count} @@{section}'
+        hunks.append({'text': '\n'.join([header, *(tag + text for tag, text in group_lines)]), 'lines': group_lines,
+                      'new_start': new_numbers[start], 'new_count': new_count})
+    return hunks, skipped
+
+
+def encode_file(change: dict, context_lines: int = REVIEW_DIFF_CONTEXT_LINES) -> dict:
+    """
+    把单个文件的变更编码为 hunk 列表：
+      - 每处修改只保留前后 context_lines 行上下文，相距较远的修改拆分为多个 hunk；
+      - 只修改了空白字符（缩进、换行位置等）的 hunk 不输出，只在文件标题中注明省略的处数；
+        Python、YAML、Makefile 等缩进有语义的文件只省略空行与行尾空白的修改；
+      - 新文件省略 hunk 头与每行的 "+"；
+      - 去掉行尾空白与 "\\ No newline at end of file"。
+    :param change: 过滤后的变更 {'new_path': ..., 'diff': ...}
+    :return: {'path': 文件路径, 'header': 文件标题, 'hunks': [hunk]}，hunk 的格式见 _encode_hunk
+    """
+    path = change['new_path']
+    hunks = _parse_hunks(change.get('diff') or '')
+    if len(hunks) == 1 and hunks[0][0] == 0 and all(tag == '+' for tag, _ in hunks[0][3]):
+        # 新文件只有新增的行
+        lines = hunks[0][3]
+        return {'path': path, 'header': f"### {path}（新文件）",
+                'hunks': [{'text': '\n'.join(text for _, text in lines), 'lines': lines,
+                           'new_start': 1, 'new_count': len(lines)}], 'skipped': 0}
+
+    encoded, skipped = [], 0
+    keep_indent = _indent_sensitive(path)
+    for old_start, new_start, section, lines in hunks:
+        hunk_encoded, hunk_skipped = _encode_hunk(old_start, new_start, section, lines, context_lines, keep_indent)
+        encoded.extend(hunk_encoded)
+        skipped += hunk_skipped
+    header = f"### {path}"
+    if skipped:
+        header += f"（省略 {skipped} 处仅空白字符的修改）"
+    return {'path': path, 'header': header, 'hunks': encoded, 'skipped': skipped}
+
+
+def render_files(files: list) -> str:
+    """把 encode_file 的结果拼接为发送给 LLM 的文本，没有任何修改的文件不输出"""
+    return '\n\n'.join('\n'.join([file['header'], *(hunk['text'] for hunk in file['hunks'])])
+                        for file in files if file['hunks'] or file['skipped'])
+
+
+def encode_changes(changes: list, context_lines: int = REVIEW_DIFF_CONTEXT_LINES) -> str:
+    """
+    把变更列表编码为发送给 LLM 的文本：每个文件一个标题，后面是精简后的 unified diff（见 encode_file）。
+    与 str(changes) 相比没有字典的引号、键名与转义的换行符，截断时也不会切断转义序列
+    :param changes: 过滤后的变更 [{'new_path': ..., 'diff': ...}]
+    :param context_lines: 上下文行数
+    :return: 编码后的文本
+    """
+    return render_files([encode_file(change, context_lines) for change in changes])
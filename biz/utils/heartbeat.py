@@ -0,0 +1,40 @@
+import os
+import time
+
+
+class Heartbeat:
+    """
+    用文件的修改时间表示某个进程中的后台线程仍在运行。
+    工作进程（async 模式 fork 的子进程、其他容器中的 rq worker）据此判断是否可以把写入交给该线程，
+    以 WSGI 服务器或只启动工作进程等方式部署、没有启动后台线程时直接处理
+    """
+
+    def __init__(self, path: str, timeout: float = 30):
+        """
+        :param path: 心跳文件路径
+        :param timeout: 超过该时间（秒）未更新时认为后台线程已停止
+        """
+        self.path = path
+        self.timeout = timeout
+
+    def beat(self):
+        """更新心跳，后台线程每轮调用"""
+        try:
+            os.utime(self.path)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            open(self.path, 'a').close()
+
+    def alive(self) -> bool:
+        """心跳文件在 timeout 秒内更新过"""
+        try:
+            return time.time() - os.path.getmtime(self.path) < self.timeout
+        except OSError:
+            return False
+
+    def clear(self):
+        """后台线程停止时删除心跳文件"""
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -6,8 +6,9 @@ import os
 import time
 import urllib.parse
 
-import requests
-
+from biz.utils.im.session import get_session, get_timeout
+from biz.utils.im.splitter import split_message, max_message_bytes, chunk_title
+from biz.utils.im.webhook_router import webhook_router
 from biz.utils.log import logger
 
 
@@ -15,6 +16,7 @@ class DingTalkNotifier:
     def __init__(self, webhook_url=None):
         self.enabled = os.environ.get('DINGTALK_ENABLED', '0') == '1'
         self.default_webhook_url = webhook_url or os.environ.get('DINGTALK_WEBHOOK_URL')
+        self.timeout = get_timeout('dingtalk')
 
     def _get_webhook_url(self, project_name=None, url_slug=None):
         """
@@ -31,19 +33,12 @@ class DingTalkNotifier:
             else:
                 raise ValueError("未提供项目名称，且未设置默认的钉钉 Webhook URL。")
 
-        # 构造目标键
-        target_key_project = f"DINGTALK_WEBHOOK_URL_{project_name.upper()}"
-        target_key_url_slug = f"DINGTALK_WEBHOOK_URL_{url_slug.upper()}"
-
-        # 遍历环境变量
-        for env_key, env_value in os.environ.items():
-            env_key_upper = env_key.upper()
-            if env_key_upper == target_key_project:
-                return env_value  # 找到项目名称对应的 Webhook URL，直接返回
-            if env_key_upper == target_key_url_slug:
-                return env_value  # 找到 GitLab URL 对应的 Webhook URL，直接返回
+        # 按项目名、url_slug 查找路由表
+        webhook_url = webhook_router.resolve('dingtalk', project_name=project_name, url_slug=url_slug)
+        if webhook_url:
+            return webhook_url
 
-        # 如果未找到匹配的环境变量，降级使用全局的 Webhook URL
+        # 如果未找到匹配的路由，降级使用全局的 Webhook URL
         if self.default_webhook_url:
             return self.default_webhook_url
 
@@ -51,42 +46,77 @@ class DingTalkNotifier:
         raise ValueError(f"未找到项目 '{project_name}' 对应的钉钉Webhook URL，且未设置默认的 Webhook URL。")
 
     def send_message(self, content: str, msg_type='text', title='通知', is_at_all=False, project_name=None, url_slug = None):
+        """
+        发送钉钉消息
+        :return: 是否发送成功，未启用时返回 None
+        """
         if not self.enabled:
             logger.info("钉钉推送未启用")
-            return
+            return None
 
         try:
             post_url = self._get_webhook_url(project_name=project_name, url_slug=url_slug)
-            headers = {
-                "Content-Type": "application/json",
-                "Charset": "UTF-8"
-            }
-            if msg_type == 'markdown':
-                message = {
-                    "msgtype": "markdown",
-                    "markdown": {
-                        "title": title,  # Customize as needed
-                        "text": content
-                    },
-                    "at": {
-                        "isAtAll": is_at_all
-                    }
-                }
-            else:
-                message = {
-                    "msgtype": "text",
-                    "text": {
-                        "content": content
-                    },
-                    "at": {
-                        "isAtAll": is_at_all
-                    }
+            chunks = self.split_chunks(content, msg_type, title)
+            if len(chunks) > 1:
+                logger.warning(f"钉钉消息内容超过长度限制，将分割为{len(chunks)}部分发送。")
+            success = True
+            for chunk, chunk_title_text in chunks:
+                success = self.post_chunk(post_url, chunk, msg_type, chunk_title_text, is_at_all) and success
+            return success
+        except Exception as e:
+            logger.error(f"钉钉消息发送失败! {e}")
+        return False
+
+    def split_chunks(self, content, msg_type='text', title='通知') -> list:
+        """
+        超过长度限制时按 markdown 块切分，分多条发送
+        :return: [(内容, 标题)]，切分为多部分时标题附带序号
+        """
+        chunks = split_message(content, max_message_bytes('dingtalk', msg_type))
+        if len(chunks) == 1:
+            return [(content, title)]
+        return [(chunk, chunk_title(title, i + 1, len(chunks))) for i, chunk in enumerate(chunks)]
+
+    def post_chunk(self, post_url, content, msg_type='text', title='通知', is_at_all=False) -> bool:
+        """发送 split_chunks 切分后的一部分"""
+        return self._post(post_url, self._build_message(content, msg_type, title, is_at_all))
+
+    @staticmethod
+    def _build_message(content, msg_type, title, is_at_all):
+        if msg_type == 'markdown':
+            return {
+                "msgtype": "markdown",
+                "markdown": {
+                    "title": title,  # Customize as needed
+                    "text": content
+                },
+                "at": {
+                    "isAtAll": is_at_all
                 }
-            response = requests.post(url=post_url, data=json.dumps(message), headers=headers)
+            }
+        return {
+            "msgtype": "text",
+            "text": {
+                "content": content
+            },
+            "at": {
+                "isAtAll": is_at_all
+            }
+        }
+
+    def _post(self, post_url, message) -> bool:
+        headers = {
+            "Content-Type": "application/json",
+            "Charset": "UTF-8"
+        }
+        try:
+            data = json.dumps(message, ensure_ascii=False).encode('utf-8')
+            response = get_session('dingtalk').post(url=post_url, data=data, headers=headers, timeout=self.timeout)
             response_data = response.json()
             if response_data.get('errmsg') == 'ok':
                 logger.info(f"钉钉消息发送成功! webhook_url:{post_url}")
-            else:
-                logger.error(f"钉钉消息发送失败! webhook_url:{post_url},errmsg:{response_data.get('errmsg')}")
+                return True
+            logger.error(f"钉钉消息发送失败! webhook_url:{post_url},errmsg:{response_data.get('errmsg')}")
         except Exception as e:
-            logger.error(f"钉钉消息发送失败! ", e)
+            logger.error(f"钉钉消息发送失败! {e}")
+        return False
@@ -1,7 +1,10 @@
 import json
-import requests
 import os
 import re
+
+from biz.utils.im.session import get_session, get_timeout
+from biz.utils.im.splitter import split_message, max_message_bytes, chunk_title
+from biz.utils.im.webhook_router import webhook_router
 from biz.utils.log import logger
 
 
@@ -13,6 +16,7 @@ class FeishuNotifier:
         """
         self.default_webhook_url = webhook_url or os.environ.get('FEISHU_WEBHOOK_URL', '')
         self.enabled = os.environ.get('FEISHU_ENABLED', '0') == '1'
+        self.timeout = get_timeout('feishu')
 
     def _get_webhook_url(self, project_name=None, url_slug=None):
         """
@@ -28,19 +32,12 @@ class FeishuNotifier:
             else:
                 raise ValueError("未提供项目名称，且未设置默认的 飞书 Webhook URL。")
 
-        # 构造目标键
-        target_key_project = f"FEISHU_WEBHOOK_URL_{project_name.upper()}"
-        target_key_url_slug = f"FEISHU_WEBHOOK_URL_{url_slug.upper()}"
-
-        # 遍历环境变量
-        for env_key, env_value in os.environ.items():
-            env_key_upper = env_key.upper()
-            if env_key_upper == target_key_project:
-                return env_value  # 找到项目名称对应的 Webhook URL，直接返回
-            if env_key_upper == target_key_url_slug:
-                return env_value  # 找到 GitLab URL 对应的 Webhook URL，直接返回
+        # 按项目名、url_slug 查找路由表
+        webhook_url = webhook_router.resolve('feishu', project_name=project_name, url_slug=url_slug)
+        if webhook_url:
+            return webhook_url
 
-        # 如果未找到匹配的环境变量，降级使用全局的 Webhook URL
+        # 如果未找到匹配的路由，降级使用全局的 Webhook URL
         if self.default_webhook_url:
             return self.default_webhook_url
 
@@ -55,76 +52,111 @@ class FeishuNotifier:
         :param title: 消息标题(markdown类型时使用)
         :param is_at_all: 是否@所有人
         :param project_name: 项目名称
+        :return: 是否发送成功，未启用时返回 None
         """
         if not self.enabled:
             logger.info("飞书推送未启用")
-            return
+            return None
 
         try:
             post_url = self._get_webhook_url(project_name=project_name, url_slug=url_slug)
-            if msg_type == 'markdown':
-                data = {
-                    "msg_type": "interactive",
-                    "card": {
-                        "schema": "2.0",
-                        "config": {
-                            "update_multi": True,
-                            "style": {
-                                "text_size": {
-                                    "normal_v2": {
-                                        "default": "normal",
-                                        "pc": "normal",
-                                        "mobile": "heading"
-                                    }
+            chunks = self.split_chunks(content, msg_type, title)
+            if len(chunks) > 1:
+                logger.warning(f"飞书消息内容超过长度限制，将分割为{len(chunks)}部分发送。")
+            success = True
+            for chunk, chunk_title_text in chunks:
+                success = self.post_chunk(post_url, chunk, msg_type, chunk_title_text, is_at_all) and success
+            return success
+
+        except Exception as e:
+            logger.error(f"飞书消息发送失败! {e}")
+            return False
+
+    def split_chunks(self, content, msg_type='text', title=None) -> list:
+        """
+        超过长度限制时按 markdown 块切分，分多条发送
+        :return: [(内容, 标题)]，切分为多部分时标题附带序号
+        """
+        chunks = split_message(content, max_message_bytes('feishu', msg_type))
+        if len(chunks) == 1:
+            return [(content, title)]
+        return [(chunk, chunk_title(title, i + 1, len(chunks))) for i, chunk in enumerate(chunks)]
+
+    def post_chunk(self, post_url, content, msg_type='text', title=None, is_at_all=False) -> bool:
+        """发送 split_chunks 切分后的一部分"""
+        return self._post(post_url, self._build_message(content, msg_type, title))
+
+    @staticmethod
+    def _build_message(content, msg_type, title):
+        if msg_type == 'markdown':
+            data = {
+                "msg_type": "interactive",
+                "card": {
+                    "schema": "2.0",
+                    "config": {
+                        "update_multi": True,
+                        "style": {
+                            "text_size": {
+                                "normal_v2": {
+                                    "default": "normal",
+                                    "pc": "normal",
+                                    "mobile": "heading"
                                 }
                             }
-                        },
-                        "body": {
-                            "direction": "vertical",
-                            "padding": "12px 12px 12px 12px",
-                            "elements": [
-                                {
-                                    "tag": "markdown",
-                                    "content": content,
-                                    "text_align": "left",
-                                    "text_size": "normal_v2",
-                                    "margin": "0px 0px 0px 0px"
-                                }
-                            ]
-                        },
-                        "header": {
-                            "title": {
-                                "tag": "plain_text",
-                                "content": title
-                            },
-                            "template": "blue",
-                            "padding": "12px 12px 12px 12px"
                         }
-                    }
-                }
-            else:
-                data = {
-                    "msg_type": "text",
-                    "content": {
-                        "text": content
                     },
+                    "body": {
+                        "direction": "vertical",
+                        "padding": "12px 12px 12px 12px",
+                        "elements": [
+                            {
+                                "tag": "markdown",
+                                "content": content,
+                                "text_align": "left",
+                                "text_size": "normal_v2",
+                                "margin": "0px 0px 0px 0px"
+                            }
+                        ]
+                    },
+                    "header": {
+                        "title": {
+                            "tag": "plain_text",
+                            "content": title
+                        },
+                        "template": "blue",
+                        "padding": "12px 12px 12px 12px"
+                    }
                 }
+            }
+        else:
+            data = {
+                "msg_type": "text",
+                "content": {
+                    "text": content
+                },
+            }
+        return data
 
-            response = requests.post(
+    def _post(self, post_url, data) -> bool:
+        try:
+            response = get_session('feishu').post(
                 url=post_url,
                 json=data,
-                headers={'Content-Type': 'application/json'}
+                headers={'Content-Type': 'application/json'},
+                timeout=self.timeout
             )
 
             if response.status_code != 200:
                 logger.error(f"飞书消息发送失败! webhook_url:{post_url}, error_msg:{response.text}")
-                return
+                return False
 
             result = response.json()
             if result.get('msg') != "success":
                 logger.error(f"发送飞书消息失败! webhook_url:{post_url},errmsg:{result}")
-            else:
-                logger.info(f"飞书消息发送成功! webhook_url:{post_url}")
-
+                return False
+            logger.info(f"飞书消息发送成功! webhook_url:{post_url}")
+            return True
         except Exception as e:
-            logger.error(f"飞书消息发送失败! ", e)
+            logger.error(f"飞书消息发送失败! {e}")
+            return False
+
@@ -1,28 +1,131 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from biz.utils import metrics, tracing
 from biz.utils.im.dingtalk import DingTalkNotifier
 from biz.utils.im.feishu import FeishuNotifier
 from biz.utils.im.wecom import WeComNotifier
+from biz.utils.log import logger
+
+NOTIFIERS = {
+    'dingtalk': DingTalkNotifier,  # 钉钉推送
+    'wecom': WeComNotifier,  # 企业微信推送
+    'feishu': FeishuNotifier,  # 飞书推送
+}
+
+_executors = {}
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # 线程池不能跨 fork 使用，async 模式下每个工作进程创建自己的线程池
+    pid = os.getpid()
+    executor = _executors.get(pid)
+    if executor is None:
+        with _executor_lock:
+            executor = _executors.get(pid)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix='notifier')
+                _executors[pid] = executor
+    return executor
+
+
+def _send(channel, send, **kwargs) -> dict:
+    start = time.monotonic()
+    with metrics.track_latency(metrics.NOTIFIER_LATENCY, channel=channel), \
+            tracing.start_span(f'notify.{channel}') as span:
+        success = send(**kwargs)
+        span.set_attribute('success', bool(success))
+    return {'status': 'sent' if success else 'failed', 'elapsed_ms': round((time.monotonic() - start) * 1000, 1)}
+
+
+def split_chunks(channel, content, msg_type='text', title="通知") -> list:
+    """
+    按渠道单条消息的长度限制切分消息，与各渠道 send_message 的切分方式相同
+    :param channel: 渠道名称，见 NOTIFIERS
+    :return: [(内容, 标题)]，每部分对应一次 Webhook 请求
+    """
+    return NOTIFIERS[channel]().split_chunks(content, msg_type=msg_type, title=title)
 
 
+def deliver(channel, webhook_url, content, msg_type='text', title="通知", is_at_all=False) -> bool:
+    """
+    把 split_chunks 切分后的一部分发送到指定的 Webhook（一次请求，不再切分），供通知发件箱使用
+    :param channel: 渠道名称，见 NOTIFIERS
+    :return: 是否发送成功
+    """
+    im_notifier = NOTIFIERS[channel](webhook_url=webhook_url)
+    return _send(channel, im_notifier.post_chunk, post_url=webhook_url, content=content, msg_type=msg_type,
+                 title=title, is_at_all=is_at_all)['status'] == 'sent'
+
+
+def _enqueue(outbox, notifiers, content, msg_type, title, is_at_all, project_name, url_slug) -> dict:
+    report = {}
+    targets = []
+    for channel, im_notifier in notifiers.items():
+        if not im_notifier.enabled:
+            report[channel] = {'status': 'disabled', 'elapsed_ms': 0}
+            continue
+        try:
+            targets.append((channel, im_notifier._get_webhook_url(project_name=project_name, url_slug=url_slug)))
+        except Exception as e:
+            logger.error(f"{channel} 消息发送失败! {e}")
+            report[channel] = {'status': 'failed', 'elapsed_ms': 0}
+    if targets:
+        report.update(outbox.enqueue(targets, content=content, msg_type=msg_type, title=title, is_at_all=is_at_all))
+    return report
+
+
+@tracing.traced('notify.send')
 def send_notification(content, msg_type='text', title="通知", is_at_all=False, project_name=None, url_slug=None):
     """
-    发送通知消息到配置的平台(钉钉和企业微信)
+    发送通知消息到配置的平台(钉钉、企业微信和飞书)。
+    启用通知发件箱（NOTIFY_OUTBOX_ENABLED）且 API 进程中的发送线程在运行时只写入发件箱，由发送线程限流发送；
+    否则各渠道并发发送，总耗时取决于最慢的渠道
     :param content: 消息内容
     :param msg_type: 消息类型，支持text和markdown
     :param title: 消息标题(markdown类型时使用)
     :param is_at_all: 是否@所有人
     :param url_slug: 由gitlab服务器的url地址(如:http://www.gitlab.com)转换成的slug格式，如: www_gitlab_com
+    :return: 发送结果 {渠道: {'status': sent | failed | queued | disabled, 'elapsed_ms': 耗时}}
     """
-    # 钉钉推送
-    dingtalk_notifier = DingTalkNotifier()
-    dingtalk_notifier.send_message(content=content, msg_type=msg_type, title=title, is_at_all=is_at_all,
-                          project_name=project_name, url_slug=url_slug)
-
-    # 企业微信推送
-    wecom_notifier = WeComNotifier()
-    wecom_notifier.send_message(content=content, msg_type=msg_type, title=title, is_at_all=is_at_all,
-                                project_name=project_name, url_slug=url_slug)
-
-    # 飞书推送
-    feishu_notifier = FeishuNotifier()
-    feishu_notifier.send_message(content=content, msg_type=msg_type, title=title, is_at_all=is_at_all,
-                                 project_name=project_name, url_slug=url_slug)
+    # 发件箱依赖数据库模块，在调用时导入以避免循环导入
+    from biz.service.notification_outbox import OUTBOX_ENABLED, notification_outbox
+
+    notifiers = {channel: notifier_class() for channel, notifier_class in NOTIFIERS.items()}
+    if OUTBOX_ENABLED and not notification_outbox.dispatcher_alive():
+        # 没有进程在发送发件箱中的消息，写入后会一直不发送
+        logger.warning("IM 通知发件箱的发送线程未运行，直接发送通知")
+    elif OUTBOX_ENABLED:
+        try:
+            return _enqueue(notification_outbox, notifiers, content, msg_type, title, is_at_all, project_name,
+                            url_slug)
+        except Exception as e:
+            # 发件箱不可用时退回直接发送
+            logger.error(f"写入 IM 通知发件箱失败，直接发送: {e}")
+
+    kwargs = dict(content=content, msg_type=msg_type, title=title, is_at_all=is_at_all, project_name=project_name,
+                  url_slug=url_slug)
+    report = {}
+    futures = {}
+    for channel, im_notifier in notifiers.items():
+        if not im_notifier.enabled:
+            report[channel] = {'status': 'disabled', 'elapsed_ms': 0}
+            continue
+        # 复制当前上下文，使各渠道的 Span 挂在 notify.send 之下
+        context = contextvars.copy_context()
+        futures[channel] = _get_executor().submit(context.run, _send, channel, im_notifier.send_message, **kwargs)
+
+    # 各渠道的请求都设置了超时时间，这里等待所有渠道完成
+    for channel, future in futures.items():
+        try:
+            report[channel] = future.result()
+        except Exception as e:
+            logger.error(f"{channel} 消息发送失败! {e}")
+            report[channel] = {'status': 'failed', 'elapsed_ms': None}
+
+    logger.info(f"通知发送结果: {report}")
+    return report
@@ -0,0 +1,38 @@
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 发送 IM 消息的默认超时时间（秒），各渠道可通过 <渠道>_TIMEOUT 单独配置，例如 FEISHU_TIMEOUT
+NOTIFY_TIMEOUT = float(os.getenv('NOTIFY_TIMEOUT', 5))
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+def get_timeout(channel: str) -> float:
+    """
+    获取渠道的超时时间
+    :param channel: 渠道名称，如 dingtalk、wecom、feishu
+    """
+    return float(os.getenv(f'{channel.upper()}_TIMEOUT', NOTIFY_TIMEOUT))
+
+
+def get_session(channel: str) -> requests.Session:
+    """
+    获取渠道复用的 requests.Session，同一进程内的多次发送共用连接池。
+    fork 出的子进程不复用父进程的连接，按进程 id 分别创建
+    :param channel: 渠道名称，如 dingtalk、wecom、feishu
+    """
+    key = (os.getpid(), channel)
+    session = _sessions.get(key)
+    if session is None:
+        with _lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                session.mount('https://', HTTPAdapter(pool_maxsize=4))
+                session.mount('http://', HTTPAdapter(pool_maxsize=4))
+                _sessions[key] = session
+    return session
@@ -0,0 +1,150 @@
+import re
+from typing import List
+
+# 各渠道单条消息内容的最大字节数（UTF-8），(渠道, 消息类型) -> 字节数
+# 企业微信: text 2048、markdown 4096；钉钉、飞书的请求体上限约 20KB，预留消息结构与标题的空间
+MAX_MESSAGE_BYTES = {
+    ('wecom', 'text'): 2048,
+    ('wecom', 'markdown'): 4096,
+    ('dingtalk', 'text'): 18000,
+    ('dingtalk', 'markdown'): 18000,
+    ('feishu', 'text'): 18000,
+    ('feishu', 'markdown'): 18000,
+}
+
+FENCE_PATTERN = re.compile(r'^\s{0,3}(`{3,}|~{3,})')
+
+
+def max_message_bytes(channel: str, msg_type: str) -> int:
+    """获取渠道单条消息内容的最大字节数"""
+    return MAX_MESSAGE_BYTES.get((channel, msg_type), MAX_MESSAGE_BYTES.get((channel, 'text'), 2048))
+
+
+def chunk_title(title: str, index: int, total: int) -> str:
+    """分割发送时每部分的标题"""
+    return f"{title or '消息'} (第{index}/{total}部分)"
+
+
+def _split_line(line: str, line_bytes: bytes, max_bytes: int) -> List[str]:
+    """
+    把超过 max_bytes 的单行按字节切分，切分点落在 UTF-8 字符边界上。
+    max_bytes 小于单个字符的字节数时，该部分只包含这一个字符（会超过 max_bytes）
+    """
+    pieces = []
+    start = 0
+    while len(line_bytes) - start > max_bytes:
+        end = start + max_bytes
+        # UTF-8 的后续字节形如 10xxxxxx，最多回退 3 个字节即可到达字符起始位置
+        while end > start and (line_bytes[end] & 0xC0) == 0x80:
+            end -= 1
+        if end == start:
+            # 至少前进一个完整的字符
+            end = start + 1
+            while end < len(line_bytes) and (line_bytes[end] & 0xC0) == 0x80:
+                end += 1
+        pieces.append(line_bytes[start:end].decode('utf-8'))
+        start = end
+    if start < len(line_bytes):
+        pieces.append(line_bytes[start:].decode('utf-8'))
+    return pieces
+
+
+def _blocks(content: str):
+    """
+    把 markdown 按块切分：代码块（``` 或 ~~~ 围起来的部分）整体作为一块，其他内容以空行为界。
+    :return: [(lines, line_sizes, fence)]，fence 为代码块的起始行，普通块为 None
+    """
+    lines, sizes, fence, fence_marker = [], [], None, None
+    for line in content.split('\n'):
+        size = len(line.encode('utf-8'))
+        match = FENCE_PATTERN.match(line) if ('`' in line or '~' in line) else None
+        if fence_marker:
+            lines.append(line)
+            sizes.append(size)
+            if match and match.group(1)[0] == fence_marker[0] and len(match.group(1)) >= len(fence_marker) \
+                    and not line.strip()[len(match.group(1)):].strip():
+                yield lines, sizes, fence
+                lines, sizes, fence, fence_marker = [], [], None, None
+            continue
+        if match:
+            if lines:
+                yield lines, sizes, None
+            lines, sizes, fence, fence_marker = [line], [size], line, match.group(1)
+            continue
+        lines.append(line)
+        sizes.append(size)
+        if not line.strip():
+            yield lines, sizes, None
+            lines, sizes = [], []
+    if lines:
+        # 未闭合的代码块按代码块处理
+        yield lines, sizes, fence
+
+
+def split_message(content: str, max_bytes: int) -> List[str]:
+    """
+    按 UTF-8 字节数切分消息，尽量在 markdown 块（段落、列表、代码块）之间切分。
+    单个块超过限制时按行切分，代码块被切开时在每一部分补上围栏；单行超过限制时按字符边界切分。
+    每行只编码一次，耗时与内容长度成线性关系
+    :param content: 消息内容
+    :param max_bytes: 每部分的最大字节数
+    :return: 切分后的各部分，内容未超过限制时只有一部分
+    """
+    if len(content) * 4 <= max_bytes or len(content.encode('utf-8')) <= max_bytes:
+        return [content]
+
+    chunks = []
+    current, current_size = [], 0
+
+    def flush():
+        nonlocal current, current_size
+        if current:
+            chunks.append('\n'.join(current))
+        current, current_size = [], 0
+
+    def append(line: str, size: int):
+        nonlocal current_size
+        # 每行之前有一个换行符（第一行除外）
+        current_size += size + (1 if current else 0)
+        current.append(line)
+
+    for lines, sizes, fence in _blocks(content):
+        # 块之间以换行符连接
+        block_size = sum(sizes) + len(sizes) - 1
+        if current and current_size + 1 + block_size <= max_bytes:
+            for line, size in zip(lines, sizes):
+                append(line, size)
+            continue
+        if block_size <= max_bytes:
+            flush()
+            for line, size in zip(lines, sizes):
+                append(line, size)
+            continue
+
+        # 块本身超过限制，按行切分
+        flush()
+        if fence is not None:
+            opening = fence.strip()
+            closing = re.match(r'`{3,}|~{3,}', opening).group(0)
+            # 每部分首尾需要补上围栏
+            reserved = len(opening.encode('utf-8')) + len(closing) + 2
+            line_limit = max(max_bytes - reserved, 1)
+            for line, size in zip(lines, sizes):
+                pieces = _split_line(line, line.encode('utf-8'), line_limit) if size > line_limit else [line]
+                for piece in pieces:
+                    piece_size = len(piece.encode('utf-8')) if len(pieces) > 1 else size
+                    if current and current_size + 1 + piece_size + len(closing) + 1 > max_bytes:
+                        append(closing, len(closing))
+                        flush()
+                        append(opening, len(opening.encode('utf-8')))
+                    append(piece, piece_size)
+            continue
+        for line, size in zip(lines, sizes):
+            pieces = _split_line(line, line.encode('utf-8'), max_bytes) if size > max_bytes else [line]
+            for piece in pieces:
+                piece_size = len(piece.encode('utf-8')) if len(pieces) > 1 else size
+                if current and current_size + 1 + piece_size > max_bytes:
+                    flush()
+                append(piece, piece_size)
+    flush()
+    return chunks
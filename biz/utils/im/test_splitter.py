@@ -0,0 +1,67 @@
+from unittest import TestCase, main
+
+from biz.utils.im.splitter import split_message, max_message_bytes
+
+
+def _size(text: str) -> int:
+    return len(text.encode('utf-8'))
+
+
+class TestSplitMessage(TestCase):
+    def test_short_content_is_not_split(self):
+        """未超过限制的内容原样返回"""
+        self.assertEqual(split_message('### 标题\n\n内容', 4096), ['### 标题\n\n内容'])
+
+    def test_split_at_block_boundaries(self):
+        """在段落之间切分，拼接后与原文一致"""
+        paragraphs = [f'#### 问题 {i}\n- 描述：变量命名不清晰，建议修改。\n' for i in range(200)]
+        content = '\n'.join(paragraphs)
+        chunks = split_message(content, 1000)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(_size(chunk) <= 1000 for chunk in chunks))
+        self.assertEqual('\n'.join(chunks), content)
+        # 每部分都从段落开头开始
+        self.assertTrue(all(chunk.startswith('#### 问题') for chunk in chunks))
+
+    def test_code_fence_is_kept_together(self):
+        """代码块不超过限制时不会被切开"""
+        code = '```python\n' + '\n'.join(f'value_{i} = {i}' for i in range(30)) + '\n```'
+        content = 'a' * 600 + '\n\n' + code + '\n\n结论'
+        chunks = split_message(content, 800)
+        self.assertTrue(any(code in chunk for chunk in chunks))
+        for chunk in chunks:
+            self.assertEqual(chunk.count('```') % 2, 0)
+
+    def test_large_code_fence_is_reopened(self):
+        """超过限制的代码块按行切分，每部分补上围栏"""
+        code = '```python\n' + '\n'.join(f'result_{i} = compute(result_{i - 1})' for i in range(500)) + '\n```'
+        chunks = split_message(code, 1024)
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(_size(chunk), 1024)
+            self.assertTrue(chunk.startswith('```python'))
+            self.assertTrue(chunk.endswith('```'))
+        body = [line for chunk in chunks for line in chunk.split('\n')[1:-1]]
+        self.assertEqual(body, code.split('\n')[1:-1])
+
+    def test_long_single_line_is_split_on_character_boundary(self):
+        """单行超过限制时按 UTF-8 字符边界切分"""
+        content = '中文内容😀' * 20000
+        chunks = split_message(content, 4096)
+        self.assertTrue(all(_size(chunk) <= 4096 for chunk in chunks))
+        self.assertEqual(''.join(chunks), content)
+
+    def test_limit_smaller_than_one_character(self):
+        """限制小于单个字符的字节数时每部分一个字符，不会死循环"""
+        self.assertEqual(split_message('😀😀中', 2), ['😀', '😀', '中'])
+        chunks = split_message('```\n' + '😀' * 3 + '\n```', 4)
+        self.assertEqual(''.join(chunks).count('😀'), 3)
+
+    def test_channel_limits(self):
+        self.assertEqual(max_message_bytes('wecom', 'markdown'), 4096)
+        self.assertEqual(max_message_bytes('wecom', 'text'), 2048)
+        self.assertGreater(max_message_bytes('dingtalk', 'markdown'), 4096)
+
+
+if __name__ == '__main__':
+    main()
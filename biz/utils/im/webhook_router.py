@@ -0,0 +1,117 @@
+import fnmatch
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+
+from biz.utils.log import logger
+
+# 可选的路由配置文件，文件不存在时只使用环境变量中的规则
+WEBHOOK_ROUTES_FILE = os.getenv('WEBHOOK_ROUTES_FILE', 'conf/webhook_routes.yml')
+CHANNELS = ('dingtalk', 'wecom', 'feishu')
+
+
+class WebhookRouter:
+    """
+    IM 通知的 Webhook 路由表，钉钉、企业微信、飞书共用。
+    规则来源：
+      1. 环境变量 <渠道>_WEBHOOK_URL_<项目名或 url_slug>，例如 DINGTALK_WEBHOOK_URL_MY_PROJECT
+      2. 路由配置文件（YAML），项目名支持通配符，按书写顺序匹配：
+         dingtalk:
+           projects:
+             frontend-*: https://oapi.dingtalk.com/robot/send?access_token=xxx
+           url_slugs:
+             gitlab_example_com: https://oapi.dingtalk.com/robot/send?access_token=yyy
+    查找顺序：项目名精确匹配 > url_slug 精确匹配 > 项目名通配符；配置文件中的规则覆盖同名的环境变量。
+    规则在首次使用时构建，配置文件的修改时间(mtime)变化或调用 reload() 时重新构建，查找只需查询字典。
+    """
+
+    def __init__(self, routes_file: str = WEBHOOK_ROUTES_FILE):
+        self.routes_file = routes_file
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._loaded = False
+        self._exact: Dict[Tuple[str, str, str], str] = {}
+        self._patterns: Dict[str, List[Tuple[str, str]]] = {}
+
+    def _file_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.routes_file).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load_env(self, exact: dict):
+        for env_key, env_value in os.environ.items():
+            env_key_upper = env_key.upper()
+            for channel in CHANNELS:
+                prefix = f'{channel.upper()}_WEBHOOK_URL_'
+                if env_key_upper.startswith(prefix) and env_value:
+                    # 环境变量无法区分项目名与 url_slug，两种查找都使用
+                    name = env_key_upper[len(prefix):]
+                    exact[(channel, 'project', name)] = env_value
+                    exact[(channel, 'url_slug', name)] = env_value
+
+    def _load_file(self, exact: dict, patterns: dict):
+        with open(self.routes_file, 'r', encoding='utf-8') as file:
+            routes = yaml.safe_load(file) or {}
+        for channel, rules in routes.items():
+            if channel not in CHANNELS:
+                logger.warning(f"Webhook 路由配置中包含未知的渠道: {channel}")
+                continue
+            for project, url in ((rules or {}).get('projects') or {}).items():
+                project = str(project).upper()
+                if any(char in project for char in '*?['):
+                    patterns.setdefault(channel, []).append((project, url))
+                else:
+                    exact[(channel, 'project', project)] = url
+            for url_slug, url in ((rules or {}).get('url_slugs') or {}).items():
+                exact[(channel, 'url_slug', str(url_slug).upper())] = url
+
+    def reload(self):
+        """重新读取环境变量与路由配置文件"""
+        with self._lock:
+            mtime = self._file_mtime()
+            exact, patterns = {}, {}
+            self._load_env(exact)
+            if mtime is not None:
+                try:
+                    self._load_file(exact, patterns)
+                except (OSError, yaml.YAMLError, AttributeError) as e:
+                    logger.error(f"加载 Webhook 路由配置失败: {e}")
+            self._exact, self._patterns = exact, patterns
+            if self._loaded:
+                logger.info(f"Webhook 路由表已重新加载: {self.routes_file}")
+            self._mtime = mtime
+            self._loaded = True
+
+    def _reload_if_changed(self):
+        if not self._loaded or self._file_mtime() != self._mtime:
+            self.reload()
+
+    def resolve(self, channel: str, project_name: str = None, url_slug: str = None) -> Optional[str]:
+        """
+        查找项目对应的 Webhook URL
+        :param channel: dingtalk、wecom 或 feishu
+        :param project_name: 项目名称
+        :param url_slug: 由 gitlab 服务器的 url 转换而来的 slug
+        :return: Webhook URL，没有匹配的规则时返回 None
+        """
+        self._reload_if_changed()
+        project = project_name.upper() if project_name else None
+        if project:
+            url = self._exact.get((channel, 'project', project))
+            if url:
+                return url
+        if url_slug:
+            url = self._exact.get((channel, 'url_slug', url_slug.upper()))
+            if url:
+                return url
+        if project:
+            for pattern, url in self._patterns.get(channel, ()):
+                if fnmatch.fnmatchcase(project, pattern):
+                    return url
+        return None
+
+
+webhook_router = WebhookRouter()
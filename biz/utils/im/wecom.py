@@ -2,6 +2,10 @@ import json
 import requests
 import os
 import re
+
+from biz.utils.im.session import get_session, get_timeout
+from biz.utils.im.splitter import split_message, max_message_bytes, chunk_title
+from biz.utils.im.webhook_router import webhook_router
 from biz.utils.log import logger
 
 
@@ -13,6 +17,7 @@ class WeComNotifier:
         """
         self.default_webhook_url = webhook_url or os.environ.get('WECOM_WEBHOOK_URL', '')
         self.enabled = os.environ.get('WECOM_ENABLED', '0') == '1'
+        self.timeout = get_timeout('wecom')
 
     def _get_webhook_url(self, project_name=None, url_slug=None):
         """
@@ -28,19 +33,12 @@ class WeComNotifier:
             else:
                 raise ValueError("未提供项目名称，且未设置默认的企业微信 Webhook URL。")
 
-        # 构造目标键
-        target_key_project = f"WECOM_WEBHOOK_URL_{project_name.upper()}"
-        target_key_url_slug = f"WECOM_WEBHOOK_URL_{url_slug.upper()}"
-
-        # 遍历环境变量
-        for env_key, env_value in os.environ.items():
-            env_key_upper = env_key.upper()
-            if env_key_upper == target_key_project:
-                return env_value  # 找到项目名称对应的 Webhook URL，直接返回
-            if env_key_upper == target_key_url_slug:
-                return env_value  # 找到 GitLab URL 对应的 Webhook URL，直接返回
+        # 按项目名、url_slug 查找路由表
+        webhook_url = webhook_router.resolve('wecom', project_name=project_name, url_slug=url_slug)
+        if webhook_url:
+            return webhook_url
 
-        # 如果未找到匹配的环境变量，降级使用全局的 Webhook URL
+        # 如果未找到匹配的路由，降级使用全局的 Webhook URL
         if self.default_webhook_url:
             return self.default_webhook_url
 
@@ -76,71 +74,53 @@ class WeComNotifier:
         :param is_at_all: 是否 @所有人
         :param project_name: 关联项目名称
         :param url_slug: GitLab URL Slug
+        :return: 是否发送成功（分割发送时所有部分都成功），未启用时返回 None
         """
         if not self.enabled:
             logger.info("企业微信推送未启用")
-            return
+            return None
 
         try:
             post_url = self._get_webhook_url(project_name=project_name, url_slug=url_slug)
-            # 企业微信消息内容最大长度限制
-            # text类型最大2048字节
-            # https://developer.work.weixin.qq.com/document/path/91770#%E6%96%87%E6%9C%AC%E7%B1%BB%E5%9E%8B
-            # markdown类型最大4096字节
-            # https://developer.work.weixin.qq.com/document/path/91770#markdown%E7%B1%BB%E5%9E%8B
-            MAX_CONTENT_BYTES = 4096 if msg_type == 'markdown' else 2048
-
-            # 检查内容长度
-            content_length = len(content.encode('utf-8'))
-
-            if content_length <= MAX_CONTENT_BYTES:
+            chunks = self.split_chunks(content, msg_type, title)
+            if len(chunks) == 1:
                 # 内容长度在限制范围内，直接发送
-                data = self._build_message(content, title, msg_type, is_at_all)
-                self._send_message(post_url, data)
-            else:
-                # 内容超过限制，需要分割发送
-                logger.warning(f"消息内容超过{MAX_CONTENT_BYTES}字节限制，将分割发送。总长度: {content_length}字节")
-                self._send_message_in_chunks(content, title, post_url, msg_type, is_at_all, MAX_CONTENT_BYTES)
+                chunk, chunk_title_text = chunks[0]
+                return self.post_chunk(post_url, chunk, msg_type, chunk_title_text, is_at_all)
+            # 内容超过限制，需要分割发送
+            logger.warning(f"消息内容超过长度限制，将分割为{len(chunks)}部分发送。")
+            success = True
+            for i, (chunk, chunk_title_text) in enumerate(chunks):
+                data = self._build_message(chunk, chunk_title_text, msg_type, is_at_all)
+                success = self._send_message(post_url, data, chunk_num=i + 1, total_chunks=len(chunks)) and success
+            return success
 
         except Exception as e:
             logger.error(f"企业微信消息发送失败! {e}")
+            return False
 
-    def _send_message_in_chunks(self, content, title, post_url, msg_type, is_at_all, max_bytes):
+    def split_chunks(self, content, msg_type='text', title=None) -> list:
         """
-        将内容分割成多个部分并分别发送
+        超过长度限制时切分消息，markdown 消息先转换格式再切分，并为每部分的标题预留空间
+        :return: [(内容, 标题)]，切分为多部分时标题附带序号
         """
-        chunks = self._split_content(content, max_bytes)
-        for i, chunk in enumerate(chunks):
-            chunk_title = f"{title} (第{i + 1}/{len(chunks)}部分)" if title else f"消息 (第{i + 1}/{len(chunks)}部分)"
-            data = self._build_message(chunk, chunk_title, msg_type, is_at_all)
-            self._send_message(post_url, data, chunk_num=i + 1, total_chunks=len(chunks))
-
-    def _split_content(self, content, max_bytes):
-        """
-        将内容按最大字节长度分割成多个部分
-        """
-        chunks = []
-        start_pos = 0
-        content_bytes = content.encode('utf-8')
-        content_length = len(content_bytes)
-
-        while start_pos < content_length:
-            end_pos = start_pos + max_bytes
-            if end_pos >= content_length:
-                chunk = content_bytes[start_pos:].decode('utf-8', errors='ignore')
-                chunks.append(chunk)
-                break
-
-            while end_pos > start_pos:
-                if content_bytes[end_pos - 1:end_pos] == b'\n':
-                    break
-                end_pos -= 1
-
-            chunk = content_bytes[start_pos:end_pos].decode('utf-8', errors='ignore')
-            chunks.append(chunk)
-            start_pos = end_pos
-
-        return chunks
+        # 企业微信消息内容最大长度限制
+        # text类型最大2048字节
+        # https://developer.work.weixin.qq.com/document/path/91770#%E6%96%87%E6%9C%AC%E7%B1%BB%E5%9E%8B
+        # markdown类型最大4096字节
+        # https://developer.work.weixin.qq.com/document/path/91770#markdown%E7%B1%BB%E5%9E%8B
+        max_bytes = max_message_bytes('wecom', msg_type)
+        if msg_type == 'markdown':
+            content = self.format_markdown_content(content)
+            max_bytes -= len(f"## {chunk_title(title, 99, 99)}\n\n".encode('utf-8'))
+        chunks = split_message(content, max_bytes)
+        if len(chunks) == 1:
+            return [(content, title)]
+        return [(chunk, chunk_title(title, i + 1, len(chunks))) for i, chunk in enumerate(chunks)]
+
+    def post_chunk(self, post_url, content, msg_type='text', title=None, is_at_all=False) -> bool:
+        """发送 split_chunks 切分后的一部分，markdown 内容已转换过格式"""
+        return self._send_message(post_url, self._build_message(content, title, msg_type, is_at_all))
 
     def _send_message(self, post_url, data, chunk_num=None, total_chunks=None):
         """ 发送请求并返回响应 """
@@ -149,18 +129,21 @@ class WeComNotifier:
                 f"发送企业微信消息{'分块' if chunk_num else ''} {chunk_num}/{total_chunks if chunk_num else ''}: url={post_url}, data={data}")
             response = self._send_request(post_url, data)
 
-            if response and response.get('errcode') != 0:
+            if not response or response.get('errcode') != 0:
                 logger.error(f"企业微信消息发送失败! webhook_url:{post_url}, errmsg:{response}")
-            else:
-                logger.info(f"企业微信消息{'分块' if chunk_num else ''}发送成功! webhook_url:{post_url}")
+                return False
+            logger.info(f"企业微信消息{'分块' if chunk_num else ''}发送成功! webhook_url:{post_url}")
+            return True
 
         except Exception as e:
             logger.error(f"企业微信消息{'分块' if chunk_num else ''}发送失败! {e}")
+            return False
 
     def _send_request(self, url, data):
         """ 发送请求并返回 JSON 响应 """
         try:
-            response = requests.post(url, json=data, headers={'Content-Type': 'application/json'})
+            response = get_session('wecom').post(url, json=data, headers={'Content-Type': 'application/json'},
+                                                 timeout=self.timeout)
             response.raise_for_status()  # 触发 HTTP 错误
             return response.json()
         except requests.RequestException as e:
@@ -189,8 +172,8 @@ class WeComNotifier:
         }
 
     def _build_markdown_message(self, content, title):
-        """ 构造 Markdown 消息 """
-        formatted_content = self.format_markdown_content(content, title)
+        """ 构造 Markdown 消息，content 已经过 format_markdown_content 转换 """
+        formatted_content = f"## {title}\n\n{content}" if title else content
         return {
             "msgtype": "markdown",
             "markdown": {
@@ -0,0 +1,128 @@
+import os
+import time
+from contextlib import contextmanager
+
+# 多进程模式下（异步 fork 的工作进程、rq worker），各进程把指标写入 PROMETHEUS_MULTIPROC_DIR 下的文件，
+# /metrics 接口汇总该目录中的所有文件。该环境变量需要在导入 prometheus_client 之前设置好。
+multiproc_dir = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+if multiproc_dir:
+    os.makedirs(multiproc_dir, exist_ok=True)
+
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, generate_latest, \
+    CONTENT_TYPE_LATEST, multiprocess
+from prometheus_client.mmap_dict import MmapedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# 进程退出后合并到 <类型>_archive.db 的指标类型，这两类指标的值可以直接相加
+ARCHIVED_TYPES = ('counter', 'histogram')
+
+# 耗时分桶（秒），覆盖从毫秒级的数据库写入到分钟级的 LLM 调用
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, float("inf"))
+
+WEBHOOK_ACK_LATENCY = Histogram(
+    'webhook_ack_seconds', 'Webhook 从接收到返回响应的耗时', ['source', 'status'], buckets=LATENCY_BUCKETS)
+
+QUEUE_DEPTH = Gauge(
+    'queue_depth', '等待或正在处理的 Review 任务数', ['driver', 'queue'], multiprocess_mode='livemax')
+QUEUE_WAIT_LATENCY = Histogram(
+    'queue_wait_seconds', 'Review 任务从入队到开始执行的等待时间', ['driver'], buckets=LATENCY_BUCKETS)
+
+GIT_API_LATENCY = Histogram(
+    'git_api_request_seconds', '调用 GitLab/GitHub API 的耗时', ['platform', 'endpoint'], buckets=LATENCY_BUCKETS)
+
+LLM_LATENCY = Histogram(
+    'llm_request_seconds', '调用 LLM 的耗时', ['provider', 'model'], buckets=LATENCY_BUCKETS)
+LLM_TOKENS = Counter(
+    'llm_tokens', 'LLM 调用消耗的 token 数', ['provider', 'model', 'type'])
+LLM_ERRORS = Counter(
+    'llm_errors', 'LLM 调用失败次数', ['provider'])
+REVIEW_FILE_CACHE = Counter(
+    'review_file_cache', '按文件缓存的 Review 结果的命中情况', ['result'])
+
+NOTIFIER_LATENCY = Histogram(
+    'notifier_send_seconds', '发送 IM 通知的耗时', ['channel'], buckets=LATENCY_BUCKETS)
+
+EVENT_HANDLER_LATENCY = Histogram(
+    'event_handler_seconds', '事件处理函数的耗时', ['event', 'handler'], buckets=LATENCY_BUCKETS)
+EVENT_HANDLER_ERRORS = Counter(
+    'event_handler_errors', '事件处理函数失败次数', ['event', 'handler'])
+
+DB_WRITE_LATENCY = Histogram(
+    'db_write_seconds', '写入 SQLite 的耗时', ['table'], buckets=LATENCY_BUCKETS)
+
+
+@contextmanager
+def track_latency(histogram: Histogram, **labels):
+    """
+    统计代码块的执行耗时
+    :param histogram: 用于记录耗时的 Histogram
+    :param labels: Histogram 的标签
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - start)
+
+
+@contextmanager
+def _multiproc_lock(exclusive: bool):
+    """汇总指标与合并已退出进程的指标文件可能同时发生在不同进程中，用文件锁避免重复计数或读到已删除的文件"""
+    with open(os.path.join(multiproc_dir, '.lock'), 'a') as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def generate_metrics() -> bytes:
+    """生成 Prometheus 文本格式的指标数据，多进程模式下汇总所有进程的指标"""
+    if multiproc_dir:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        with _multiproc_lock(exclusive=False):
+            return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def mark_process_dead(pid: int = None):
+    """
+    工作进程退出前调用：删除该进程 live 模式的 Gauge 文件，把 Counter 与 Histogram 的文件合并到
+    <类型>_archive.db 后删除，PROMETHEUS_MULTIPROC_DIR 中的文件数与 /metrics 的耗时不再随任务数增长。
+    调用后本进程不能再记录指标（写入的是已删除的文件）
+    :param pid: 进程号，默认为当前进程
+    """
+    if not multiproc_dir:
+        return
+    pid = pid or os.getpid()
+    with _multiproc_lock(exclusive=True):
+        multiprocess.mark_process_dead(pid, multiproc_dir)
+        for typ in ARCHIVED_TYPES:
+            path = os.path.join(multiproc_dir, f'{typ}_{pid}.db')
+            if not os.path.exists(path):
+                continue
+            archive = MmapedDict(os.path.join(multiproc_dir, f'{typ}_archive.db'))
+            try:
+                for key, value, timestamp, _ in MmapedDict.read_all_values_from_file(path):
+                    archived_value, _ = archive.read_value(key)
+                    archive.write_value(key, archived_value + value, timestamp)
+            finally:
+                archive.close()
+            os.remove(path)
+
+
+def clear_multiproc_dir():
+    """清理上次运行遗留的多进程指标文件，需在启动工作进程之前调用"""
+    if not multiproc_dir:
+        return
+    for file_name in os.listdir(multiproc_dir):
+        if file_name.endswith('.db'):
+            os.remove(os.path.join(multiproc_dir, file_name))
+
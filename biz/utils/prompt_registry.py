@@ -0,0 +1,97 @@
+import hashlib
+import os
+import threading
+from typing import Dict, Any, Tuple
+
+import yaml
+from jinja2 import Template
+
+from biz.utils.log import logger
+
+PROMPT_TEMPLATES_FILE = "conf/prompt_templates.yml"
+
+
+class PromptRegistry:
+    """
+    提示词模板注册表。
+    进程内只读取、编译一次 YAML 中的 Jinja2 模板，并按 (prompt_key, style) 缓存渲染结果；
+    模板文件的修改时间(mtime)变化时自动重新加载，无需重启服务。
+    """
+
+    def __init__(self, templates_file: str = PROMPT_TEMPLATES_FILE):
+        self.templates_file = templates_file
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._templates: Dict[str, Dict[str, Template]] = {}
+        self._rendered: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    def _reload_if_changed(self):
+        """检查模板文件的 mtime，发生变化时重新加载并清空渲染缓存"""
+        mtime = os.stat(self.templates_file).st_mtime_ns
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            # 在打开 YAML 文件时显式指定编码为 UTF-8，避免使用系统默认的 GBK 编码。
+            with open(self.templates_file, "r", encoding="utf-8") as file:
+                raw_templates = yaml.safe_load(file) or {}
+
+            self._templates = {
+                prompt_key: {name: Template(template_str) for name, template_str in prompts.items()}
+                for prompt_key, prompts in raw_templates.items()
+            }
+            self._rendered = {}
+            if self._mtime is not None:
+                logger.info(f"提示词模板文件已更新，重新加载: {self.templates_file}")
+            self._mtime = mtime
+
+    def _render(self, prompt_key: str, style: str) -> Dict[str, Any]:
+        templates = self._templates.get(prompt_key, {})
+        system_prompt = templates["system_prompt"].render(style=style)
+        user_prompt = templates["user_prompt"].render(style=style)
+        return {
+            "system_prompt": system_prompt,
+            "user_prompt": user_prompt,
+            # 预先绑定的 str.format，调用方直接传入 diffs_text 等参数即可
+            "user_template": user_prompt.format,
+            # 模板版本号，模板内容或风格变化时随之变化
+            "version": hashlib.sha1(f"{system_prompt}\0{user_prompt}".encode("utf-8")).hexdigest()[:12],
+        }
+
+    def get_prompts(self, prompt_key: str, style: str = "professional") -> Dict[str, Any]:
+        """
+        获取渲染后的提示词
+        :param prompt_key: 提示词配置的键，例如 code_review_prompt
+        :param style: Review 风格
+        :return: 包含 system_message、user_message、user_template、version 的字典
+        :raises Exception: 模板文件不存在、格式错误或缺少必要的模板时抛出
+        """
+        try:
+            self._reload_if_changed()
+            cache_key = (prompt_key, style)
+            rendered = self._rendered.get(cache_key)
+            if rendered is None:
+                rendered = self._render(prompt_key, style)
+                self._rendered[cache_key] = rendered
+        except (FileNotFoundError, KeyError, yaml.YAMLError) as e:
+            logger.error(f"加载提示词配置失败: {e}")
+            raise Exception(f"提示词配置加载失败: {e}")
+
+        return {
+            "system_message": {"role": "system", "content": rendered["system_prompt"]},
+            "user_message": {"role": "user", "content": rendered["user_prompt"]},
+            "user_template": rendered["user_template"],
+            "version": rendered["version"],
+        }
+
+    def preload(self):
+        """预加载模板文件，便于在 fork 工作进程前完成解析和编译"""
+        try:
+            self._reload_if_changed()
+        except (FileNotFoundError, yaml.YAMLError) as e:
+            logger.error(f"预加载提示词配置失败: {e}")
+
+
+# 进程级共享的提示词注册表
+prompt_registry = PromptRegistry()
@@ -1,9 +1,12 @@
 import os
-from multiprocessing import Process
+import time
+from multiprocessing import Process, active_children
 
 from redis import Redis
 from rq import Queue
 
+from biz.event.event_bus import event_bus
+from biz.utils import metrics, tracing
 from biz.utils.log import logger
 
 queue_driver = os.getenv('QUEUE_DRIVER', 'async')
@@ -12,14 +15,51 @@ if queue_driver == 'rq':
     queues = {}
 
 
+def run_job(function: callable, job_context: dict, data: any, token: str, url: str, url_slug: str):
+    """
+    在工作进程中执行 Review 任务，并记录任务在队列中的等待时间
+    :param function: 实际的事件处理函数
+    :param job_context: 入队时附带的上下文信息，如入队时间、链路追踪的 traceparent
+    """
+    wait_seconds = max(time.time() - job_context.get('enqueued_at', time.time()), 0)
+    metrics.QUEUE_WAIT_LATENCY.labels(driver=queue_driver).observe(wait_seconds)
+    try:
+        with tracing.start_span('queue.job', traceparent=job_context.get('traceparent'),
+                                **{'queue.driver': queue_driver, 'queue.wait_ms': int(wait_seconds * 1000),
+                                   'job.function': function.__name__}):
+            try:
+                function(data, token, url, url_slug)
+            finally:
+                # 工作进程在任务结束后退出，退出前等待事件处理函数执行完。
+                # 因此 async 与 rq 模式下任务仍要等到记录日志、发送通知完成后才结束，事件总线只让各处理函数并发执行，
+                # 并不缩短任务的占用时间；处理函数本身只写入日志文件与通知发件箱（见 review_log_writer、notification_outbox），
+                # 由 API 进程中的后台线程完成耗时的写入与发送，等待时间通常很短
+                event_bus.drain()
+    finally:
+        # async 的子进程与 rq 的 work-horse 执行完一个任务后即退出，合并本进程的指标文件
+        metrics.mark_process_dead()
+
+
+def refresh_queue_depth():
+    """刷新队列深度指标：rq 为各队列中等待的任务数，async 为仍在运行的子进程数"""
+    if queue_driver == 'rq':
+        for url_slug, queue in queues.items():
+            metrics.QUEUE_DEPTH.labels(driver=queue_driver, queue=url_slug).set(len(queue))
+    else:
+        # active_children() 同时会回收已结束的子进程
+        metrics.QUEUE_DEPTH.labels(driver=queue_driver, queue='local').set(len(active_children()))
+
+
 def handle_queue(function: callable, data: any, token: str, url: str, url_slug: str):
+    job_context = {'enqueued_at': time.time(), 'traceparent': tracing.inject()}
     if queue_driver == 'rq':
         if url_slug not in queues:
             logger.info(f'REDIS_HOST: {os.getenv("REDIS_HOST", "127.0.0.1")}，REDIS_PORT: {os.getenv("REDIS_PORT", 6379)}')
             queues[url_slug] = Queue(url_slug, connection=Redis(os.getenv('REDIS_HOST', '127.0.0.1'),
                                                                               os.getenv('REDIS_PORT', 6379)))
 
-        queues[url_slug].enqueue(function, data, token, url, url_slug)
+        queues[url_slug].enqueue(run_job, function, job_context, data, token, url, url_slug)
     else:
-        process = Process(target=function, args=(data, token, url, url_slug))
+        process = Process(target=run_job, args=(function, job_context, data, token, url, url_slug))
         process.start()
+    refresh_queue_depth()
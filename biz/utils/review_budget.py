@@ -0,0 +1,108 @@
+import math
+import os
+import re
+
+from biz.utils.token_util import count_tokens
+
+# 各类文件的权重，未列出的扩展名使用 DEFAULT_LANGUAGE_WEIGHT
+LANGUAGE_WEIGHTS = {
+    '.c': 1.0, '.cc': 1.0, '.cpp': 1.0, '.h': 1.0, '.go': 1.0, '.java': 1.0, '.js': 1.0, '.ts': 1.0,
+    '.php': 1.0, '.py': 1.0, '.vue': 0.9, '.sql': 1.1,
+    '.yml': 0.6, '.yaml': 0.6, '.json': 0.4, '.css': 0.4, '.md': 0.2,
+}
+DEFAULT_LANGUAGE_WEIGHT = 0.8
+# 涉及认证、权限、加密、支付、数据库迁移等的路径更值得 Review
+SENSITIVE_PATH_PATTERN = re.compile(
+    r'auth|login|passw|secret|token|credential|crypt|secur|permission|privilege|payment|billing|migration|\.env',
+    re.IGNORECASE)
+TEST_PATH_PATTERN = re.compile(r'(^|/)(tests?|__tests__|specs?)/|(^|/)test_[^/]*$|_test\.\w+$|\.(spec|test)\.\w+$',
+                               re.IGNORECASE)
+# 增加分支的语句，新增的分支越多，逻辑越可能出错
+BRANCH_PATTERN = re.compile(r'\b(if|elif|for|foreach|while|case|catch|except)\b|&&|\|\|')
+
+
+def _language_weight(path: str) -> float:
+    return LANGUAGE_WEIGHTS.get(os.path.splitext(path)[1].lower(), DEFAULT_LANGUAGE_WEIGHT)
+
+
+def score_hunk(path: str, lines: list, complexity_delta: int = 0) -> float:
+    """
+    评估一个 hunk 的 Review 价值
+    :param path: 文件路径
+    :param lines: hunk 的行 [(标记, 内容)]
+    :param complexity_delta: 文件圈复杂度的变化量，未知时为 0
+    :return: 分数，越大越优先
+    """
+    added = [text for tag, text in lines if tag == '+']
+    removed = [text for tag, text in lines if tag == '-']
+    score = _language_weight(path) * (1 + math.log2(1 + len(added) + len(removed)))
+    # 新增的分支与圈复杂度的增加
+    branch_delta = sum(len(BRANCH_PATTERN.findall(text)) for text in added) \
+        - sum(len(BRANCH_PATTERN.findall(text)) for text in removed)
+    score += 0.5 * max(branch_delta, 0) + 0.5 * max(complexity_delta, 0)
+    if SENSITIVE_PATH_PATTERN.search(path):
+        score *= 1.5
+    if TEST_PATH_PATTERN.search(path):
+        score *= 0.5
+    if not added:
+        # 只删除代码的修改风险较低
+        score *= 0.5
+    return score
+
+
+def allocate(files: list, max_tokens: int, complexity_deltas: dict = None) -> tuple:
+    """
+    在 token 预算内选择最值得 Review 的 hunk，代替只保留前 max_tokens 个 token 的截断：
+    按 score_hunk 的分数从高到低依次放入放得下的 hunk，选中的 hunk 保持原来的文件与先后顺序。
+    :param files: diff_encoder.encode_file 的结果
+    :param max_tokens: token 预算
+    :param complexity_deltas: {文件路径: 圈复杂度的变化量}
+    :return: (只包含选中 hunk 的文件列表, 未选中的 hunk [(文件, hunk)])
+    """
+    complexity_deltas = complexity_deltas or {}
+    candidates = []
+    for file_index, file in enumerate(files):
+        for hunk_index, hunk in enumerate(file['hunks']):
+            score = score_hunk(file['path'], hunk['lines'], complexity_deltas.get(file['path'], 0))
+            candidates.append((score, file_index, hunk_index))
+    header_tokens = [count_tokens(file['header']) + 2 for file in files]
+    hunk_tokens = {(file_index, hunk_index): count_tokens(hunk['text']) + 1
+                   for file_index, file in enumerate(files) for hunk_index, hunk in enumerate(file['hunks'])}
+    if sum(header_tokens) + sum(hunk_tokens.values()) <= max_tokens:
+        return files, []
+
+    selected, selected_file_indexes = set(), set()
+    used = 0
+    for score, file_index, hunk_index in sorted(candidates, key=lambda item: -item[0]):
+        cost = hunk_tokens[(file_index, hunk_index)]
+        if file_index not in selected_file_indexes:
+            cost += header_tokens[file_index]
+        # 第一个 hunk 超过预算时仍然选中，由调用方截断
+        if selected and used + cost > max_tokens:
+            continue
+        selected.add((file_index, hunk_index))
+        selected_file_indexes.add(file_index)
+        used += cost
+
+    selected_files, omitted = [], []
+    for file_index, file in enumerate(files):
+        hunks = [hunk for hunk_index, hunk in enumerate(file['hunks']) if (file_index, hunk_index) in selected]
+        omitted.extend((file, hunk) for hunk_index, hunk in enumerate(file['hunks'])
+                       if (file_index, hunk_index) not in selected)
+        if hunks:
+            selected_files.append({**file, 'hunks': hunks})
+    return selected_files, omitted
+
+
+def format_omitted(omitted: list) -> str:
+    """未 Review 的修改列表，附在 Review 结果之后"""
+    if not omitted:
+        return ''
+    ranges = {}
+    for file, hunk in omitted:
+        end = hunk['new_start'] + max(hunk['new_count'], 1) - 1
+        ranges.setdefault(file['path'], []).append(f"{hunk['new_start']}-{end}" if end > hunk['new_start']
+                                                   else str(hunk['new_start']))
+    lines = [f"- {path}：第 {', '.join(file_ranges)} 行" for path, file_ranges in ranges.items()]
+    return (f"#### ⚠️ 以下 {len(omitted)} 处修改超出 Review 的 token 上限（REVIEW_MAX_TOKENS），未经 AI Review：\n"
+            + '\n'.join(lines))
@@ -0,0 +1,110 @@
+import os
+import tempfile
+from unittest import TestCase, main
+
+from biz.service import database
+from biz.service.blob_complexity_cache import BlobComplexityCache
+from biz.utils.complexity_analyzer import analyze_changes, complexity_increase, format_file_summary, format_summary
+
+OLD_SOURCE = '''def load(path):
+    return open(path).read()
+
+
+def save(path, data):
+    open(path, 'w').write(data)
+'''
+NEW_SOURCE = '''def load(path):
+    if not path:
+        return None
+    if path.endswith('.gz'):
+        return gzip.open(path).read()
+    return open(path).read()
+
+
+def save(path, data):
+    open(path, 'w').write(data)
+'''
+DIFF = ('@@ -1,2 +1,6 @@\n def load(path):\n+    if not path:\n+        return None\n'
+        '+    if path.endswith(\'.gz\'):\n+        return gzip.open(path).read()\n     return open(path).read()\n')
+
+
+class FakeHandler:
+    """提供 diff_refs、get_blob_id 与 get_file_content 的 handler，记录下载过的文件版本"""
+
+    def __init__(self, files: dict, blob_ids: dict = None):
+        self.diff_refs = ('base', 'head')
+        self.files = files
+        self.blob_ids = blob_ids or {}
+        self.fetched = []
+
+    def get_blob_id(self, file_path, ref):
+        return self.blob_ids.get((file_path, ref))
+
+    def get_file_content(self, file_path, ref):
+        self.fetched.append((file_path, ref))
+        content = self.files.get((file_path, ref))
+        return (self.get_blob_id(file_path, ref), content) if content is not None else (None, None)
+
+
+class TestAnalyzeChanges(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.tmp.name, 'data.db')
+        database.migrate(self.db_file)
+        self.cache = BlobComplexityCache(self.db_file)
+
+    def tearDown(self):
+        database.close_connections()
+        self.tmp.cleanup()
+
+    def test_modified_function(self):
+        """只列出被修改且复杂度变化的函数"""
+        handler = FakeHandler({('io.py', 'base'): OLD_SOURCE, ('io.py', 'head'): NEW_SOURCE})
+        result = analyze_changes([{'new_path': 'io.py', 'diff': DIFF}], handler)
+        self.assertEqual(result, {'io.py': [{'name': 'load', 'old': (1, 2), 'new': (3, 6)}]})
+        self.assertEqual(complexity_increase(result['io.py']), 2)
+        self.assertEqual(format_file_summary(result['io.py']), '复杂度变化(lizard): load(CCN 1→3, 2→6 行)')
+        self.assertEqual(format_summary(result), 'io.py: load(CCN 1→3, 2→6 行)')
+        self.assertIsNone(format_summary({}))
+
+    def test_cached_versions_are_not_fetched(self):
+        """按 blob SHA 缓存分析结果，再次分析相同版本时不下载文件内容"""
+        files = {('io.py', 'base'): OLD_SOURCE, ('io.py', 'head'): NEW_SOURCE}
+        blob_ids = {('io.py', 'base'): 'blob-old', ('io.py', 'head'): 'blob-new'}
+        first = FakeHandler(files, blob_ids)
+        expected = analyze_changes([{'new_path': 'io.py', 'diff': DIFF}], first, self.cache)
+        self.assertEqual(len(first.fetched), 2)
+        self.assertEqual(set(self.cache.get_many(['blob-old', 'blob-new'])), {'blob-old', 'blob-new'})
+
+        second = FakeHandler(files, blob_ids)
+        self.assertEqual(analyze_changes([{'new_path': 'io.py', 'diff': DIFF}], second, self.cache), expected)
+        self.assertEqual(second.fetched, [])
+
+    def test_blob_id_from_change(self):
+        """变更中已带有 blob SHA 时（GitHub）直接作为新版本的缓存键"""
+        handler = FakeHandler({('io.py', 'base'): OLD_SOURCE, ('io.py', 'head'): NEW_SOURCE})
+        analyze_changes([{'new_path': 'io.py', 'diff': DIFF, 'blob_id': 'sha-new'}], handler, self.cache)
+        self.assertEqual(set(self.cache.get_many(['sha-new', 'base:io.py'])), {'sha-new', 'base:io.py'})
+
+    def test_renamed_and_new_files(self):
+        """重命名的文件按 old_path 获取旧版本，新文件不获取旧版本"""
+        handler = FakeHandler({('old_io.py', 'base'): OLD_SOURCE, ('io.py', 'head'): NEW_SOURCE,
+                               ('new.py', 'head'): OLD_SOURCE})
+        new_diff = '@@ -0,0 +1,6 @@\n' + ''.join(f'+{line}\n' for line in OLD_SOURCE.splitlines())
+        result = analyze_changes([{'new_path': 'io.py', 'old_path': 'old_io.py', 'diff': DIFF},
+                                  {'new_path': 'new.py', 'new_file': True, 'diff': new_diff}], handler)
+        self.assertEqual(sorted(handler.fetched), [('io.py', 'head'), ('new.py', 'head'), ('old_io.py', 'base')])
+        self.assertEqual(result['io.py'], [{'name': 'load', 'old': (1, 2), 'new': (3, 6)}])
+        self.assertEqual([delta['old'] for delta in result['new.py']], [None, None])
+
+    def test_skip_unavailable_or_unsupported_files(self):
+        """获取不到旧版本的文件与 lizard 不支持的文件跳过，没有 diff_refs 时不分析"""
+        handler = FakeHandler({('io.py', 'head'): NEW_SOURCE})
+        self.assertEqual(analyze_changes([{'new_path': 'io.py', 'diff': DIFF}], handler), {})
+        self.assertEqual(analyze_changes([{'new_path': 'README.md', 'diff': DIFF}], handler), {})
+        handler.diff_refs = None
+        self.assertEqual(analyze_changes([{'new_path': 'io.py', 'diff': DIFF}], handler), {})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+from unittest import TestCase, main
+
+from biz.utils.diff_encoder import changed_line_numbers, encode_changes, encode_file
+
+# 第 3 行与第 15 行各有一处修改，相距较远
+DIFF = '\n'.join(['@@ -1,17 +1,17 @@ class Demo:'] + [f' line {i}' for i in range(1, 3)] +
+                 ['-old 3', '+new 3'] + [f' line {i}' for i in range(4, 15)] + ['-old 15', '+new 15'] +
+                 [' line 16', ' line 17', ''])
+
+
+class TestEncodeFile(TestCase):
+    def test_split_distant_changes(self):
+        """相距较远的修改拆分为多个 hunk，每处只保留 context_lines 行上下文，行号正确"""
+        file = encode_file({'new_path': 'demo.js', 'diff': DIFF}, context_lines=2)
+        self.assertEqual(file['header'], '### demo.js')
+        self.assertEqual([hunk['text'] for hunk in file['hunks']], [
+            '@@ -1,5 +1,5 @@ class Demo:\n line 1\n line 2\n-old 3\n+new 3\n line 4\n line 5',
+            '@@ -13,5 +13,5 @@ class Demo:\n line 13\n line 14\n-old 15\n+new 15\n line 16\n line 17',
+        ])
+
+    def test_merge_nearby_changes(self):
+        """相邻修改之间的上下文较少时合并为一个 hunk"""
+        file = encode_file({'new_path': 'demo.js', 'diff': DIFF}, context_lines=6)
+        self.assertEqual(len(file['hunks']), 1)
+
+    def test_new_file(self):
+        """新文件省略 hunk 头与每行的 +"""
+        file = encode_file({'new_path': 'new.js', 'diff': '@@ -0,0 +1,2 @@\n+a = 1\n+b = 2\n\\ No newline at end of file'})
+        self.assertEqual(file['header'], '### new.js（新文件）')
+        self.assertEqual(file['hunks'][0]['text'], 'a = 1\nb = 2')
+
+    def test_skip_whitespace_only_changes(self):
+        """只修改了空白字符的 hunk 不输出，在标题中注明"""
+        diff = '@@ -1,3 +1,3 @@\n a()\n-if (x) {  return 1; }\n+if (x) {\n+  return 1; }\n b()\n'
+        file = encode_file({'new_path': 'demo.js', 'diff': diff})
+        self.assertEqual(file['hunks'], [])
+        self.assertEqual(file['header'], '### demo.js（省略 1 处仅空白字符的修改）')
+        self.assertEqual(encode_changes([{'new_path': 'demo.js', 'diff': diff}]),
+                         '### demo.js（省略 1 处仅空白字符的修改）')
+
+    def test_keep_indentation_changes_in_indent_sensitive_files(self):
+        """Python、YAML、Makefile 等文件中只修改缩进的 hunk 仍然输出，只省略空行与行尾空白的修改"""
+        indent = '@@ -1,3 +1,3 @@\n if ready:\n     start()\n-stop()\n+    stop()\n'
+        for path in ('app.py', 'conf/app.yaml', 'build/Makefile'):
+            file = encode_file({'new_path': path, 'diff': indent})
+            self.assertEqual(len(file['hunks']), 1, path)
+            self.assertEqual(file['skipped'], 0, path)
+        self.assertEqual(encode_file({'new_path': 'app.js', 'diff': indent})['skipped'], 1)
+
+        trailing = '@@ -1,3 +1,4 @@\n if ready:\n-    start()   \n+    start()\n+\n'
+        self.assertEqual(encode_file({'new_path': 'app.py', 'diff': trailing})['skipped'], 1)
+
+    def test_skip_files_without_changes(self):
+        """没有任何修改的文件（如二进制文件）不输出"""
+        self.assertEqual(encode_changes([{'new_path': 'logo.png', 'diff': ''},
+                                         {'new_path': 'new.js', 'diff': '@@ -0,0 +1 @@\n+a = 1\n'}]),
+                         '### new.js（新文件）\na = 1')
+
+class TestChangedLineNumbers(TestCase):
+    def test_changed_line_numbers(self):
+        """返回旧文件中删除的行号与新文件中新增的行号"""
+        diff = '@@ -10,3 +10,4 @@\n a\n-b\n+c\n+d\n e\n'
+        self.assertEqual(changed_line_numbers(diff), ({11}, {11, 12}))
+        self.assertEqual(changed_line_numbers(DIFF), ({3, 15}, {3, 15}))
+        self.assertEqual(changed_line_numbers(None), (set(), set()))
+
+
+
+if __name__ == '__main__':
+    main()
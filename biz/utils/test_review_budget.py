@@ -0,0 +1,68 @@
+from unittest import TestCase, main
+
+from biz.utils.diff_encoder import encode_file
+from biz.utils.review_budget import allocate, format_omitted, score_hunk
+
+
+def _change(path: str, added: list, start: int = 1) -> dict:
+    diff = f'@@ -{start},1 +{start},{len(added) + 1} @@\n context\n' + '\n'.join(f'+{line}' for line in added)
+    return {'new_path': path, 'diff': diff}
+
+
+class TestScoreHunk(TestCase):
+    def test_relevance_factors(self):
+        """敏感路径、新增分支与复杂度增加提高分数，测试、文档与只删除的修改降低分数"""
+        lines = [('+', 'x = 1')]
+        base = score_hunk('app.py', lines)
+        self.assertGreater(score_hunk('auth/login.py', lines), base)
+        self.assertGreater(score_hunk('app.py', [('+', 'if x and y or z: pass')]), base)
+        self.assertGreater(score_hunk('app.py', lines, complexity_delta=3), base)
+        self.assertLess(score_hunk('tests/test_app.py', lines), base)
+        self.assertLess(score_hunk('README.md', lines), base)
+        self.assertLess(score_hunk('app.py', [('-', 'x = 1')]), base)
+
+
+class TestAllocate(TestCase):
+    def setUp(self):
+        self.files = [
+            encode_file(_change('README.md', [f'文档说明第 {i} 行' for i in range(40)])),
+            encode_file(_change('auth/token.py', ['if token is None or expired(token):', '    raise Unauthorized()'])),
+            encode_file(_change('app.py', ['value = compute()'], start=50)),
+        ]
+
+    def test_everything_fits(self):
+        """预算充足时原样返回"""
+        files, omitted = allocate(self.files, 100000)
+        self.assertIs(files, self.files)
+        self.assertEqual(omitted, [])
+
+    def test_select_most_relevant_hunks(self):
+        """预算不足时优先选择分数高的 hunk，而不是按顺序截断，选中的文件保持原来的顺序"""
+        files, omitted = allocate(self.files, 60)
+        self.assertEqual([file['path'] for file in files], ['auth/token.py', 'app.py'])
+        self.assertEqual([file['path'] for file, _ in omitted], ['README.md'])
+
+    def test_complexity_delta_changes_priority(self):
+        """复杂度增加的文件优先"""
+        small = [encode_file(_change('a.py', ['x = 1'])), encode_file(_change('b.py', ['y = 2']))]
+        budget = 20
+        files, _ = allocate(small, budget)
+        self.assertEqual([file['path'] for file in files], ['a.py'])
+        files, _ = allocate(small, budget, {'b.py': 5})
+        self.assertEqual([file['path'] for file in files], ['b.py'])
+
+    def test_first_hunk_always_selected(self):
+        """预算小于任何一个 hunk 时仍然选中分数最高的 hunk"""
+        files, omitted = allocate(self.files, 1)
+        self.assertEqual([file['path'] for file in files], ['auth/token.py'])
+        self.assertEqual(len(omitted), 2)
+
+    def test_format_omitted(self):
+        """列出未 Review 的修改在新文件中的行号范围"""
+        _, omitted = allocate(self.files, 1)
+        self.assertEqual(format_omitted(omitted).split('\n')[1:], ['- README.md：第 1-41 行', '- app.py：第 50-51 行'])
+        self.assertEqual(format_omitted([]), '')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+import contextvars
+import functools
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Dict, Any
+
+from biz.utils.log import logger
+
+# 链路追踪导出方式: none（不导出）| console（输出到日志）| file（按行写入 TRACE_FILE，JSON 字段与 OTLP/JSON 一致）
+TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', 'none')
+TRACE_FILE = os.getenv('TRACE_FILE', 'log/trace.jsonl')
+SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'ai-codereview')
+
+# W3C Trace Context: traceparent = 00-<trace_id>-<span_id>-<flags>
+TRACEPARENT_PATTERN = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+_file_lock = threading.Lock()
+
+
+class Span:
+    """
+    一个处理阶段的耗时记录，字段命名与 OpenTelemetry 的 Span 保持一致
+    """
+
+    def __init__(self, name: str, trace_id: str, parent_span_id: Optional[str] = None,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.attributes = dict(attributes or {})
+        self.status_code = 'OK'
+        self.status_message = ''
+        self.start_time_ns = time.time_ns()
+        self.end_time_ns = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        self.attributes.update(attributes)
+
+    def record_exception(self, e: BaseException):
+        self.status_code = 'ERROR'
+        self.status_message = f'{type(e).__name__}: {e}'
+
+    @property
+    def duration_ms(self) -> float:
+        end_time_ns = self.end_time_ns or time.time_ns()
+        return (end_time_ns - self.start_time_ns) / 1_000_000
+
+    @property
+    def traceparent(self) -> str:
+        return f'00-{self.trace_id}-{self.span_id}-01'
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_span_id or '',
+            'name': self.name,
+            'startTimeUnixNano': self.start_time_ns,
+            'endTimeUnixNano': self.end_time_ns,
+            'durationMs': round(self.duration_ms, 3),
+            'attributes': self.attributes,
+            'status': {'code': self.status_code, 'message': self.status_message},
+            'resource': {'service.name': SERVICE_NAME, 'process.pid': os.getpid()},
+        }
+
+
+def _export(span: Span):
+    if TRACE_EXPORTER == 'console':
+        logger.info(f"trace span: {json.dumps(span.to_dict(), ensure_ascii=False, default=str)}")
+    elif TRACE_EXPORTER == 'file':
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str) + '\n'
+        try:
+            # 多个工作进程共用同一文件，以追加模式一次写入一整行
+            with _file_lock, open(TRACE_FILE, 'a', encoding='utf-8') as f:
+                f.write(line)
+        except OSError as e:
+            logger.warning(f"写入链路追踪文件失败: {e}")
+
+
+def _parse_traceparent(traceparent: Optional[str]):
+    match = TRACEPARENT_PATTERN.match(traceparent or '')
+    if not match:
+        return None, None
+    return match.group(1), match.group(2)
+
+
+@contextmanager
+def start_span(name: str, traceparent: Optional[str] = None, **attributes):
+    """
+    开启一个 Span，结束时记录耗时并导出
+    :param name: 阶段名称，例如 fetch.changes
+    :param traceparent: 上游传递过来的 W3C traceparent，未提供时使用当前上下文中的 Span 作为父节点
+    :param attributes: Span 属性
+    """
+    trace_id, parent_span_id = _parse_traceparent(traceparent)
+    if not trace_id:
+        parent = _current_span.get()
+        if parent:
+            trace_id, parent_span_id = parent.trace_id, parent.span_id
+        else:
+            trace_id = secrets.token_hex(16)
+
+    span = Span(name, trace_id, parent_span_id, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_exception(e)
+        raise
+    finally:
+        span.end_time_ns = time.time_ns()
+        _current_span.reset(token)
+        _export(span)
+
+
+def _payload_size(value) -> int:
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, (list, dict)):
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'))
+    return 0
+
+
+def traced(name: str):
+    """
+    装饰器：为函数调用创建 Span，并记录字符串参数与返回值的大小（字节）
+    :param name: 阶段名称
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with start_span(name) as span:
+                result = func(*args, **kwargs)
+                if isinstance(result, (list, dict)):
+                    span.set_attribute('result.count', len(result))
+                # 仅在需要导出时计算大小，避免无谓的序列化开销
+                if TRACE_EXPORTER != 'none':
+                    input_bytes = sum(_payload_size(arg) for arg in list(args) + list(kwargs.values())
+                                      if isinstance(arg, str))
+                    span.set_attributes({'input.bytes': input_bytes, 'result.bytes': _payload_size(result)})
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def inject() -> Optional[str]:
+    """返回当前 Span 的 traceparent，用于通过队列等方式传递到下游"""
+    span = _current_span.get()
+    return span.traceparent if span else None
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.trace_id if span else None
@@ -1,14 +1,16 @@
 import datetime
 import os
 
+import altair as alt
 import pandas as pd
 import streamlit as st
 from dotenv import load_dotenv
-import matplotlib.pyplot as plt
-from biz.service.review_service import ReviewService
 
+# biz 中的模块在导入时读取配置，需要在导入它们之前加载 conf/.env
 load_dotenv("conf/.env")
 
+from biz.service.review_service import ReviewService
+
 # 从环境变量中读取用户名和密码
 DASHBOARD_USER = os.getenv("DASHBOARD_USER", "admin")
 DASHBOARD_PASSWORD = os.getenv("DASHBOARD_PASSWORD", "admin")
@@ -22,13 +24,23 @@ def authenticate(username, password):
     return username in USER_CREDENTIALS and USER_CREDENTIALS[username] == password
 
 
+# 审查日志表格每页条数
+PAGE_SIZE = 50
+# Dashboard 查询结果与图表的缓存时间（秒），筛选条件不变时在此期间内直接复用
+CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", 60))
+
+
 # 获取数据函数
-def get_data(service_func, authors=None, project_names=None, updated_at_gte=None, updated_at_lte=None, columns=None):
-    df = service_func(authors=authors, project_names=project_names, updated_at_gte=updated_at_gte,
-                      updated_at_lte=updated_at_lte)
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def get_data(log_type, authors=None, project_names=None, updated_at_gte=None, updated_at_lte=None, columns=None,
+             cursor=None, limit=PAGE_SIZE):
+    """按游标分页获取数据，返回 (当前页数据, 下一页游标)"""
+    df, next_cursor = ReviewService.get_review_log_page(log_type, authors=authors, project_names=project_names,
+                                                        updated_at_gte=updated_at_gte, updated_at_lte=updated_at_lte,
+                                                        columns=columns, cursor=cursor, limit=limit)
 
     if df.empty:
-        return pd.DataFrame(columns=columns)
+        return pd.DataFrame(columns=columns), None
 
     if "updated_at" in df.columns:
         df["updated_at"] = df["updated_at"].apply(
@@ -37,7 +49,31 @@ def get_data(service_func, authors=None, project_names=None, updated_at_gte=None
         )
 
     data = df[columns]
-    return data
+    return data, next_cursor
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def get_filter_options(log_type, updated_at_gte, updated_at_lte):
+    return ReviewService.get_filter_options(log_type, updated_at_gte=updated_at_gte, updated_at_lte=updated_at_lte)
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def get_rollups(log_type, group_by, authors, project_names, updated_at_gte, updated_at_lte):
+    return ReviewService.get_review_rollups(log_type, group_by, authors=authors, project_names=project_names,
+                                            updated_at_gte=updated_at_gte, updated_at_lte=updated_at_lte)
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def search_reviews(log_type, keywords, authors, project_names, updated_at_gte, updated_at_lte):
+    return ReviewService.search_reviews(keywords, log_type=log_type, authors=authors, project_names=project_names,
+                                        updated_at_gte=updated_at_gte, updated_at_lte=updated_at_lte)
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def get_review_result(log_type, review_id):
+    if log_type == "push":
+        return ReviewService.get_push_review_result(review_id)
+    return ReviewService.get_mr_review_result(review_id)
 
 
 # Streamlit 配置
@@ -73,102 +109,78 @@ def login_page():
                 st.error("用户名或密码错误")
 
 
-# 生成项目提交数量图表
-def generate_project_count_chart(df):
+# 分数区间的显示名称，与每日汇总表中的列对应
+SCORE_BUCKET_LABELS = {
+    "score_lt_60": "<60",
+    "score_60_69": "60-69",
+    "score_70_79": "70-79",
+    "score_80_89": "80-89",
+    "score_ge_90": ">=90",
+}
+
+
+# 柱状图由浏览器端的 Vega-Lite 渲染，服务端只传输汇总后的数据；点击柱子可选中对应的项目或人员
+def show_bar_chart(df, label_column, value_column, scheme, key, sort="-y"):
+    """
+    :param scheme: Vega 配色方案
+    :param key: 图表的 key，选中状态保存在 session_state 中
+    :return: 选中的项目或人员
+    """
     if df.empty:
         st.info("没有数据可供展示")
-        return
+        return []
 
-    # 计算每个项目的提交数量
-    project_counts = df['project_name'].value_counts().reset_index()
-    project_counts.columns = ['project_name', 'count']
+    selection = alt.selection_point(name="selected", fields=[label_column])
+    chart = alt.Chart(df[[label_column, value_column]]).mark_bar().encode(
+        x=alt.X(f"{label_column}:N", sort=sort, title=None, axis=alt.Axis(labelAngle=-45)),
+        y=alt.Y(f"{value_column}:Q", title=None),
+        color=alt.Color(f"{label_column}:N", scale=alt.Scale(scheme=scheme), legend=None),
+        opacity=alt.condition(selection, alt.value(1.0), alt.value(0.4)),
+        tooltip=[alt.Tooltip(f"{label_column}:N"), alt.Tooltip(f"{value_column}:Q", format=".2f")],
+    ).add_params(selection)
+    event = st.altair_chart(chart, use_container_width=True, on_select="rerun", key=key)
+    return [point[label_column] for point in event["selection"].get("selected", []) if label_column in point]
 
-    # 生成颜色列表，每个项目一个颜色
-    colors = plt.colormaps['tab20'].resampled(len(project_counts))
 
-    # 显示提交数量柱状图
-    fig1, ax1 = plt.subplots(figsize=(10, 6))
-    ax1.bar(
-        project_counts['project_name'],
-        project_counts['count'],
-        color=[colors(i) for i in range(len(project_counts))]
-    )
-    plt.xticks(rotation=45, ha='right', fontsize=26)
-    plt.tight_layout()
-    st.pyplot(fig1)
+# 生成项目提交数量图表
+def generate_project_count_chart(df, key):
+    # 每个项目的提交数量（来自每日汇总表）
+    return show_bar_chart(df, 'project_name', 'count', 'category20', key)
 
 
 # 生成项目平均分数图表
-def generate_project_score_chart(df):
-    if df.empty:
-        st.info("没有数据可供展示")
-        return
-
-    # 计算每个项目的平均分数
-    project_scores = df.groupby('project_name')['score'].mean().reset_index()
-    project_scores.columns = ['project_name', 'average_score']
-
-    # 生成颜色列表，每个项目一个颜色
-    # colors = plt.cm.get_cmap('Accent', len(project_scores))  # 使用'tab20'颜色映射，适合分类数据
-    colors = plt.colormaps['Accent'].resampled(len(project_scores))
-    # 显示平均分数柱状图
-    fig2, ax2 = plt.subplots(figsize=(10, 6))
-    ax2.bar(
-        project_scores['project_name'],
-        project_scores['average_score'],
-        color=[colors(i) for i in range(len(project_scores))]
-    )
-    plt.xticks(rotation=45, ha='right', fontsize=26)
-    plt.tight_layout()
-    st.pyplot(fig2)
+def generate_project_score_chart(df, key):
+    # 每个项目的平均分数（来自每日汇总表）
+    return show_bar_chart(df, 'project_name', 'average_score', 'accent', key, sort=None)
 
 
 # 生成人员提交数量图表
-def generate_author_count_chart(df):
-    if df.empty:
-        st.info("没有数据可供展示")
-        return
-
-    # 计算每个人员的提交数量
-    author_counts = df['author'].value_counts().reset_index()
-    author_counts.columns = ['author', 'count']
-
-    # 生成颜色列表，每个项目一个颜色
-    colors = plt.colormaps['Paired'].resampled(len(author_counts))
-    # 显示提交数量柱状图
-    fig1, ax1 = plt.subplots(figsize=(10, 6))
-    ax1.bar(
-        author_counts['author'],
-        author_counts['count'],
-        color=[colors(i) for i in range(len(author_counts))]
-    )
-    plt.xticks(rotation=45, ha='right', fontsize=26)
-    plt.tight_layout()
-    st.pyplot(fig1)
+def generate_author_count_chart(df, key):
+    # 每个人员的提交数量（来自每日汇总表）
+    return show_bar_chart(df, 'author', 'count', 'paired', key)
 
 
 # 生成人员平均分数图表
-def generate_author_score_chart(df):
-    if df.empty:
-        st.info("没有数据可供展示")
-        return
-
-    # 计算每个人员的平均分数
-    author_scores = df.groupby('author')['score'].mean().reset_index()
-    author_scores.columns = ['author', 'average_score']
-
-    # 显示平均分数柱状图
-    fig2, ax2 = plt.subplots(figsize=(10, 6))
-    # 生成颜色列表，每个项目一个颜色
-    colors = plt.colormaps['Pastel1'].resampled(len(author_scores))
-    ax2.bar(
-        author_scores['author'],
-        author_scores['average_score'],
-        color=[colors(i) for i in range(len(author_scores))]
+def generate_author_score_chart(df, key):
+    # 每个人员的平均分数（来自每日汇总表）
+    return show_bar_chart(df, 'author', 'average_score', 'pastel1', key, sort=None)
+
+
+# 选中项目或人员后展示其分数分布
+def generate_score_distribution_chart(df, label_column, selected):
+    selected_df = df[df[label_column].isin(selected)]
+    distribution = selected_df.melt(id_vars=[label_column], value_vars=list(SCORE_BUCKET_LABELS),
+                                    var_name="bucket", value_name="reviews")
+    distribution["bucket"] = distribution["bucket"].map(SCORE_BUCKET_LABELS)
+    chart = alt.Chart(distribution).mark_bar().encode(
+        x=alt.X("bucket:N", sort=list(SCORE_BUCKET_LABELS.values()), title="分数区间",
+                axis=alt.Axis(labelAngle=0)),
+        xOffset=f"{label_column}:N",
+        y=alt.Y("reviews:Q", title="审查次数"),
+        color=alt.Color(f"{label_column}:N", title=None),
+        tooltip=[f"{label_column}:N", "bucket:N", "reviews:Q"],
     )
-    plt.xticks(rotation=45, ha='right', fontsize=26)
-    plt.tight_layout()
-    st.pyplot(fig2)
+    st.altair_chart(chart, use_container_width=True)
 
 
 # 主要内容
@@ -186,61 +198,111 @@ def main_page():
     else:
         mr_tab = st.container()
 
-    def display_data(tab, service_func, columns, column_config):
+    def display_data(tab, log_type, columns, column_config):
         with tab:
             col1, col2, col3, col4 = st.columns(4)
             with col1:
-                start_date = st.date_input("开始日期", start_date_default, key=f"{tab}_start_date")
+                start_date = st.date_input("开始日期", start_date_default, key=f"{log_type}_start_date")
             with col2:
-                end_date = st.date_input("结束日期", current_date, key=f"{tab}_end_date")
+                end_date = st.date_input("结束日期", current_date, key=f"{log_type}_end_date")
 
-            start_datetime = datetime.datetime.combine(start_date, datetime.time.min)
-            end_datetime = datetime.datetime.combine(end_date, datetime.time.max)
+            updated_at_gte = int(datetime.datetime.combine(start_date, datetime.time.min).timestamp())
+            updated_at_lte = int(datetime.datetime.combine(end_date, datetime.time.max).timestamp())
 
-            data = get_data(service_func, updated_at_gte=int(start_datetime.timestamp()),
-                            updated_at_lte=int(end_datetime.timestamp()), columns=columns)
-            df = pd.DataFrame(data)
-
-            unique_authors = sorted(df["author"].dropna().unique().tolist()) if not df.empty else []
-            unique_projects = sorted(df["project_name"].dropna().unique().tolist()) if not df.empty else []
+            # 筛选项来自每日汇总表的 DISTINCT 查询，不扫描审查日志
+            options = get_filter_options(log_type, updated_at_gte, updated_at_lte)
             with col3:
-                authors = st.multiselect("用户名", unique_authors, default=[], key=f"{tab}_authors")
+                authors = st.multiselect("用户名", options["author"], default=[], key=f"{log_type}_authors")
             with col4:
-                project_names = st.multiselect("项目名", unique_projects, default=[], key=f"{tab}_projects")
-
-            data = get_data(service_func, authors=authors, project_names=project_names,
-                            updated_at_gte=int(start_datetime.timestamp()),
-                            updated_at_lte=int(end_datetime.timestamp()), columns=columns)
+                project_names = st.multiselect("项目名", options["project_name"], default=[], key=f"{log_type}_projects")
+
+            keywords = st.text_input("搜索审查结果与提交信息", key=f"{log_type}_search",
+                                     placeholder="输入关键词，多个关键词以空格分隔")
+            if keywords.strip():
+                results = search_reviews(log_type, keywords, authors, project_names, updated_at_gte, updated_at_lte)
+                if results.empty:
+                    st.info("没有找到匹配的审查记录")
+                for row in results.to_dict(orient="records"):
+                    updated_at = datetime.datetime.fromtimestamp(row["updated_at"]).strftime("%Y-%m-%d %H:%M:%S")
+                    snippet = (row["snippet"] or "").replace("\n", " ")
+                    st.markdown(f"**{row['project_name']}** | {row['author']} | {updated_at} | 分数: {row['score']}\n\n"
+                                f"> {snippet}")
+
+            # 筛选条件变化时回到第一页；cursors 保存已访问页的游标，用于返回上一页
+            filters = (start_date, end_date, tuple(authors), tuple(project_names))
+            if st.session_state.get(f"{log_type}_filters") != filters:
+                st.session_state[f"{log_type}_filters"] = filters
+                st.session_state[f"{log_type}_cursors"] = [None]
+            cursors = st.session_state[f"{log_type}_cursors"]
+
+            data, next_cursor = get_data(log_type, authors=authors, project_names=project_names,
+                                         updated_at_gte=updated_at_gte, updated_at_lte=updated_at_lte, columns=columns,
+                                         cursor=cursors[-1])
             df = pd.DataFrame(data)
 
             st.data_editor(
                 df,
                 use_container_width=True,
-                column_config=column_config
+                column_config=column_config,
+                column_order=[column for column in columns if column != "id"]
             )
 
-            total_records = len(df)
-            average_score = df["score"].mean() if not df.empty else 0
+            prev_col, page_col, next_col = st.columns([1, 8, 1])
+            with prev_col:
+                if st.button("上一页", disabled=len(cursors) == 1, key=f"{log_type}_prev_page"):
+                    cursors.pop()
+                    st.rerun()
+            with page_col:
+                st.markdown(f"<div style='text-align: center;'>第 {len(cursors)} 页</div>", unsafe_allow_html=True)
+            with next_col:
+                if st.button("下一页", disabled=next_cursor is None, key=f"{log_type}_next_page"):
+                    cursors.append(next_cursor)
+                    st.rerun()
+
+            # Review 结果体积较大，只在选中某条记录时按 id 加载
+            if not df.empty:
+                labels = {row["id"]: f'{row["updated_at"]} | {row["project_name"]} | {row["author"]}'
+                          for row in df.to_dict(orient="records")}
+                review_id = st.selectbox("查看审查结果", list(labels), index=None, key=f"{log_type}_review_id",
+                                         format_func=labels.get)
+                if review_id is not None:
+                    st.markdown(get_review_result(log_type, review_id) or "")
+
+            # 统计数据与图表读取每日汇总表，耗时不随审查日志总量增长
+            project_df = get_rollups(log_type, "project_name", authors, project_names, updated_at_gte, updated_at_lte)
+            author_df = get_rollups(log_type, "author", authors, project_names, updated_at_gte, updated_at_lte)
+
+            total_records = int(project_df["count"].sum())
+            score_count = project_df["score_count"].sum()
+            average_score = project_df["score_sum"].sum() / score_count if score_count else 0
             st.markdown(f"**总记录数:** {total_records}，**平均分:** {average_score:.2f}")
 
             # 创建2x2网格布局展示四个图表
             row1, row2, row3, row4 = st.columns(4)
             with row1:
                 st.markdown("<div style='text-align: center;'><b>项目提交次数</b></div>", unsafe_allow_html=True)
-                generate_project_count_chart(df)
+                selected_projects = generate_project_count_chart(project_df, key=f"{log_type}_project_count_chart")
             with row2:
                 st.markdown("<div style='text-align: center;'><b>项目平均分数</b></div>", unsafe_allow_html=True)
-                generate_project_score_chart(df)
+                selected_projects += generate_project_score_chart(project_df, key=f"{log_type}_project_score_chart")
             with row3:
                 st.markdown("<div style='text-align: center;'><b>人员提交次数</b></div>", unsafe_allow_html=True)
-                generate_author_count_chart(df)
+                selected_authors = generate_author_count_chart(author_df, key=f"{log_type}_author_count_chart")
             with row4:
                 st.markdown("<div style='text-align: center;'><b>人员平均分数</b></div>", unsafe_allow_html=True)
-                generate_author_score_chart(df)
+                selected_authors += generate_author_score_chart(author_df, key=f"{log_type}_author_score_chart")
+
+            # 点击图表中的柱子后，展示选中项目、人员的分数分布
+            if selected_projects:
+                st.markdown("**项目分数分布**")
+                generate_score_distribution_chart(project_df, "project_name", selected_projects)
+            if selected_authors:
+                st.markdown("**人员分数分布**")
+                generate_score_distribution_chart(author_df, "author", selected_authors)
 
     # Merge Request 数据展示
-    mr_columns = ["project_name", "author", "source_branch", "target_branch", "updated_at", "commit_messages", "score",
-                  "url"]
+    mr_columns = ["id", "project_name", "author", "source_branch", "target_branch", "updated_at", "commit_messages",
+                  "score", "url"]
 
     mr_column_config = {
         "score": st.column_config.ProgressColumn(
@@ -254,11 +316,11 @@ def main_page():
         ),
     }
 
-    display_data(mr_tab, ReviewService().get_mr_review_logs, mr_columns, mr_column_config)
+    display_data(mr_tab, "mr", mr_columns, mr_column_config)
 
     # Push 数据展示
     if show_push_tab:
-        push_columns = ["project_name", "author", "branch", "updated_at", "commit_messages", "score"]
+        push_columns = ["id", "project_name", "author", "branch", "updated_at", "commit_messages", "score"]
 
         push_column_config = {
             "score": st.column_config.ProgressColumn(
@@ -268,7 +330,7 @@ def main_page():
             ),
         }
 
-        display_data(push_tab, ReviewService().get_push_review_logs, push_columns, push_column_config)
+        display_data(push_tab, "push", push_columns, push_column_config)
 
 
 # 应用入口